@@ -0,0 +1,246 @@
+import os
+import sys
+import glob
+import time
+import argparse
+import datetime
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from modules.http_client import get_http_client
+from modules.job_store import (
+    DEFAULT_JOB_DB,
+    JOB_CANCELLED,
+    JOB_RUNNING,
+    JobAlreadyClaimed,
+    JobStore,
+)
+from modules.pipeline import RenderOptions, run_job
+from modules.tts import SYNTHESIS_WORKERS
+from modules.video_gen import ENCODE_WORKERS, SUBTITLE_RENDERER, SUBTITLE_RENDERERS
+
+
+def render_file(story_path, output_root, options, store, skip_existing=False):
+    """
+    Tạo video cho một file truyện, kết quả nằm trong output_root/<tên file>
+
+    Nếu lần chạy trước của cùng truyện với cùng tùy chọn bị dừng hoặc lỗi giữa
+    chừng, công việc trong store được chạy tiếp từ bước chưa hoàn thành.
+
+    Returns:
+        str: Đường dẫn video đã tạo
+    """
+    name = os.path.splitext(os.path.basename(story_path))[0]
+    output_dir = os.path.join(output_root, name)
+    video_path = os.path.join(output_dir, "video.mp4")
+    if skip_existing and os.path.exists(video_path):
+        print(f"[{name}] Bỏ qua, đã có video: {video_path}")
+        return video_path
+
+    with open(story_path, "r", encoding="utf-8") as f:
+        story = f.read().strip()
+    if not story:
+        raise Exception(f"File truyện rỗng: {story_path}")
+
+    job = store.find_job(output_dir, story)
+    # Qua from_dict để tùy chọn lưu bởi phiên bản cũ cũng có đủ giá trị mặc định
+    if (
+        job is not None
+        and RenderOptions.from_dict(job["options"]).to_dict() != options.to_dict()
+    ):
+        # Tùy chọn đã đổi (giọng, tốc độ...): kết quả các bước cũ không dùng được
+        print(f"[{name}] Tùy chọn khác lần chạy trước, tạo lại từ đầu")
+        if job["status"] != JOB_RUNNING:
+            store.set_status(job["id"], JOB_CANCELLED, "Thay bằng công việc mới")
+        job = None
+    if job is not None:
+        job_id = job["id"]
+        print(f"[{name}] Chạy tiếp công việc #{job_id}")
+    else:
+        job_id = store.create_job(story, options.to_dict(), output_dir)
+
+    return run_job(
+        store,
+        job_id,
+        progress=lambda message: print(f"[{name}] {message}"),
+        api_key=options.api_key,
+        leonardo_api_key=options.leonardo_api_key,
+    )
+
+
+def run_when_due(store, job, api_key=None, leonardo_api_key=None):
+    """Chờ đến thời điểm đã đặt lịch của công việc (run_at) rồi chạy nó"""
+    job_id = job["id"]
+    wait = (job["run_at"] or 0) - time.time()
+    if wait > 0:
+        run_time = datetime.datetime.fromtimestamp(job["run_at"])
+        print(f"[#{job_id}] Chờ đến {run_time:%Y-%m-%d %H:%M:%S}")
+        time.sleep(wait)
+    return run_job(
+        store,
+        job_id,
+        lambda message: print(f"[#{job_id}] {message}"),
+        api_key=api_key,
+        leonardo_api_key=leonardo_api_key,
+    )
+
+
+def resume_unfinished(store, workers, api_key=None, leonardo_api_key=None):
+    """
+    Chạy tiếp mọi công việc chưa xong trong store (ví dụ sau khi máy bị tắt)
+
+    Công việc đã đặt lịch chỉ chạy khi đến giờ; công việc đang chạy ở tiến
+    trình khác được bỏ qua.
+
+    Returns:
+        int: Số công việc bị lỗi
+    """
+    # Công việc đến giờ trước được chạy trước
+    jobs = sorted(store.unfinished_jobs(), key=lambda job: job["run_at"] or 0)
+    print(f"Có {len(jobs)} công việc chưa xong")
+    failures = 0
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        futures = {}
+        for job in jobs:
+            future = executor.submit(
+                run_when_due, store, job, api_key, leonardo_api_key
+            )
+            futures[future] = job["id"]
+        for future in as_completed(futures):
+            job_id = futures[future]
+            try:
+                print(f"Đã tạo video cho công việc #{job_id}: {future.result()}")
+            except JobAlreadyClaimed:
+                print(f"Bỏ qua công việc #{job_id}: đang chạy ở tiến trình khác")
+            except Exception as e:
+                failures += 1
+                print(f"Lỗi khi tạo video cho công việc #{job_id}: {str(e)}")
+    return failures
+
+
+def main():
+    """
+    Tạo video từ truyện không cần giao diện (chạy trên máy chủ)
+    """
+    parser = argparse.ArgumentParser(
+        description="Tạo video từ một file truyện hoặc cả thư mục story*.txt"
+    )
+    parser.add_argument(
+        "input", nargs="?", help="File truyện .txt hoặc thư mục chứa truyện"
+    )
+    parser.add_argument(
+        "--pattern", default="story*.txt", help="Mẫu tên file khi input là thư mục"
+    )
+    parser.add_argument("--output", default="output", help="Thư mục đầu ra")
+    parser.add_argument(
+        "--workers", type=int, default=1, help="Số truyện được tạo video cùng lúc"
+    )
+    parser.add_argument(
+        "--tts-workers",
+        type=int,
+        default=SYNTHESIS_WORKERS,
+        help="Số bản sao mô hình TTS cho mỗi truyện",
+    )
+    parser.add_argument(
+        "--encode-workers",
+        type=int,
+        default=ENCODE_WORKERS,
+        help="Số tiến trình ffmpeg mã hóa song song cho mỗi video nhiều hình",
+    )
+    parser.add_argument(
+        "--subtitle-renderer",
+        choices=SUBTITLE_RENDERERS,
+        default=SUBTITLE_RENDERER,
+        help="Cách gắn phụ đề vào video",
+    )
+    parser.add_argument(
+        "--translate", action="store_true", help="Dịch từ tiếng Trung sang tiếng Việt"
+    )
+    parser.add_argument("--lang", default="vi", help="Ngôn ngữ giọng đọc (vi, en)")
+    parser.add_argument("--voice", help="Tên mô hình Coqui TTS")
+    parser.add_argument("--speed", default="+0%", help='Tốc độ đọc, ví dụ "+7%%"')
+    parser.add_argument(
+        "--images",
+        type=int,
+        default=0,
+        help="Số hình cố định (0 = tự động theo thời lượng audio)",
+    )
+    parser.add_argument(
+        "--seconds-per-image",
+        type=float,
+        default=60,
+        help="Thời gian cho mỗi hình ở chế độ tự động",
+    )
+    parser.add_argument("--api-key", help="DeepSeek API key")
+    parser.add_argument("--leonardo-key", help="Leonardo.ai API key")
+    parser.add_argument(
+        "--skip-existing", action="store_true", help="Bỏ qua truyện đã có video"
+    )
+    parser.add_argument(
+        "--db", default=DEFAULT_JOB_DB, help="File SQLite lưu hàng đợi công việc"
+    )
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="Chạy tiếp các công việc chưa xong trong hàng đợi",
+    )
+    args = parser.parse_args()
+
+    store = JobStore(args.db)
+    if args.resume:
+        return (
+            1
+            if resume_unfinished(store, args.workers, args.api_key, args.leonardo_key)
+            else 0
+        )
+    if not args.input:
+        parser.error("Cần chỉ định file truyện hoặc thư mục (hoặc dùng --resume)")
+
+    if os.path.isdir(args.input):
+        story_paths = sorted(glob.glob(os.path.join(args.input, args.pattern)))
+    else:
+        story_paths = [args.input]
+    if not story_paths:
+        print(f"Không tìm thấy truyện nào trong {args.input}")
+        return 1
+
+    options = RenderOptions(
+        api_key=args.api_key,
+        leonardo_api_key=args.leonardo_key,
+        translate=args.translate,
+        voice=args.voice,
+        lang=args.lang,
+        speed=args.speed,
+        auto_images=args.images <= 0,
+        time_per_image_seconds=args.seconds_per_image,
+        image_count=max(1, args.images),
+        tts_workers=args.tts_workers,
+        encode_workers=max(1, args.encode_workers),
+        subtitle_renderer=args.subtitle_renderer,
+    )
+
+    # Các truyện dùng chung mô hình TTS đã tải (xem TTSModelCache)
+    failures = 0
+    with ThreadPoolExecutor(max_workers=max(1, args.workers)) as executor:
+        futures = {
+            executor.submit(
+                render_file, path, args.output, options, store, args.skip_existing
+            ): path
+            for path in story_paths
+        }
+        for future in as_completed(futures):
+            path = futures[future]
+            try:
+                print(f"Đã tạo video cho {path}: {future.result()}")
+            except Exception as e:
+                failures += 1
+                print(f"Lỗi khi tạo video cho {path}: {str(e)}")
+
+    print(f"Hoàn thành {len(story_paths) - failures}/{len(story_paths)} truyện")
+    # Độ trễ của từng API (DeepSeek, Leonardo) trong lần chạy này
+    metrics = get_http_client().format_metrics()
+    if metrics:
+        print(metrics)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -25,3 +25,12 @@ LEONARDO_IMAGE_HEIGHT = 1080
 # DeepSeek settings
 DEEPSEEK_MAX_TOKENS = 4000
 DEEPSEEK_TEMPERATURE = 0.1
+DEEPSEEK_MAX_CONCURRENCY = 4  # Parallel requests when translating long texts
+DEEPSEEK_REQUESTS_PER_SECOND = 2  # Shared rate limit for all DeepSeek calls
+
+# HTTP connection pools (modules/http_client.py)
+HTTP_POOL_SIZE = 10  # Connections kept open per host
+HTTP_HOST_POOL_SIZES = {"api.deepseek.com": 8, "cloud.leonardo.ai": 4}
+HTTP_TIMEOUT = (10, 120)  # (connect, read) seconds
+HTTP_RETRIES = 3
+HTTP_BACKOFF_FACTOR = 1
@@ -2,6 +2,7 @@ import sys
 import os
 import datetime
 import asyncio
+import threading
 from PyQt6.QtWidgets import (
     QApplication,
     QMainWindow,
@@ -18,14 +19,75 @@ from PyQt6.QtWidgets import (
     QGroupBox,
     QLineEdit,
     QCheckBox,
+    QListWidget,
+    QListWidgetItem,
 )
-from PyQt6.QtCore import Qt
-from modules.tts import text_to_speech
-from modules.image_gen import generate_image_from_story
-from modules.video_gen import create_video
-from modules.subtitle import create_subtitle
-from modules.scheduler import schedule_task
-from modules.translate import translate_chinese_to_vietnamese
+from PyQt6.QtCore import Qt, QObject, QRunnable, QThreadPool, pyqtSignal
+from modules.job_store import JOB_CANCELLED, get_job_store
+from modules.pipeline import (
+    RenderCancelled,
+    RenderOptions,
+    estimate_video_duration,
+    run_job,
+)
+from modules.scheduler import schedule_job, schedule_task
+
+# Số video được render cùng lúc
+MAX_CONCURRENT_JOBS = 2
+
+
+class JobSignals(QObject):
+    """Tín hiệu từ luồng render về giao diện (job_id, nội dung)"""
+
+    progress = pyqtSignal(int, str)
+    finished = pyqtSignal(int, str)
+    failed = pyqtSignal(int, str)
+
+
+class RenderJob(QRunnable):
+    """
+    Một lần tạo video (dịch -> TTS -> hình ảnh -> phụ đề -> video) chạy trong
+    QThreadPool, không đụng tới widget nào
+
+    Mọi tùy chọn được chụp lại từ giao diện khi bấm "Tạo Video" và lưu trong
+    JobStore cùng kết quả từng bước, nên công việc bị dừng (tắt ứng dụng) được
+    chạy tiếp ở lần mở sau. Mỗi công việc ghi vào thư mục riêng nên nhiều công
+    việc có thể chạy cùng lúc. Việc hủy là hợp tác: công việc dừng ở lần báo
+    tiến độ kế tiếp.
+    """
+
+    def __init__(self, job_store, job_id, api_key=None, leonardo_api_key=None):
+        super().__init__()
+        self.job_store = job_store
+        self.job_id = job_id
+        # API key chỉ giữ trong bộ nhớ, không lưu vào JobStore
+        self.api_key = api_key
+        self.leonardo_api_key = leonardo_api_key
+        self.signals = JobSignals()
+        self.cancel_event = threading.Event()
+
+    def cancel(self):
+        self.cancel_event.set()
+
+    def run(self):
+        try:
+            video_path = self.render()
+        except RenderCancelled:
+            self.signals.failed.emit(self.job_id, "Đã hủy")
+        except Exception as e:
+            self.signals.failed.emit(self.job_id, str(e))
+        else:
+            self.signals.finished.emit(self.job_id, video_path)
+
+    def render(self):
+        return run_job(
+            self.job_store,
+            self.job_id,
+            progress=lambda message: self.signals.progress.emit(self.job_id, message),
+            cancel_event=self.cancel_event,
+            api_key=self.api_key,
+            leonardo_api_key=self.leonardo_api_key,
+        )
 
 
 class MainWindow(QMainWindow):
@@ -37,28 +99,14 @@ class MainWindow(QMainWindow):
         self.api_leonardo_key = (
             "2486143c-9dcb-48f5-8044-5be51de198fe"  # Default API key
         )
+        # Hàng đợi render: các công việc chạy trong thread pool riêng
+        self.thread_pool = QThreadPool()
+        self.thread_pool.setMaxThreadCount(MAX_CONCURRENT_JOBS)
+        self.jobs = {}
+        self.job_items = {}
+        self.job_store = get_job_store()
         self.init_ui()
-
-    def estimate_video_duration(self, text, speed_factor):
-        """Ước lượng thời gian video dựa vào số lượng ký tự và tốc độ đọc"""
-        # Tốc độ đọc trung bình: ~15-20 ký tự/giây ở tốc độ bình thường
-        chars = len(text.strip())
-
-        # Chuyển đổi speed_factor từ format "+7%" sang số thập phân
-        if speed_factor.startswith("+"):
-            speed_factor = 1 + float(speed_factor.strip("+%")) / 100
-        elif speed_factor.startswith("-"):
-            speed_factor = 1 - float(speed_factor.strip("-%")) / 100
-        else:
-            speed_factor = 1
-
-        # Ước tính số ký tự/giây dựa vào tốc độ (15 ký tự/giây ở tốc độ bình thường)
-        chars_per_second = 15 * speed_factor
-
-        # Tính thời gian ước lượng
-        seconds = chars / chars_per_second
-
-        return seconds
+        self.resume_unfinished_jobs()
 
     def update_duration_estimate(self):
         """Cập nhật ước lượng thời gian video khi text hoặc tốc độ thay đổi"""
@@ -66,7 +114,7 @@ class MainWindow(QMainWindow):
         speed_factor = self.speed_combobox.currentData()
 
         if text:
-            duration_seconds = self.estimate_video_duration(text, speed_factor)
+            duration_seconds = estimate_video_duration(text, speed_factor)
             minutes = int(duration_seconds // 60)
             seconds = int(duration_seconds % 60)
 
@@ -267,12 +315,23 @@ class MainWindow(QMainWindow):
         # layout.addWidget(self.datetime_edit)
         layout.addWidget(self.status_label)
 
+        # Danh sách công việc đang chờ/đang chạy
+        jobs_group = QGroupBox("Hàng đợi tạo video")
+        jobs_layout = QVBoxLayout()
+        self.job_list = QListWidget(self)
+        self.cancel_job_btn = QPushButton("Hủy công việc đã chọn", self)
+        jobs_layout.addWidget(self.job_list)
+        jobs_layout.addWidget(self.cancel_job_btn)
+        jobs_group.setLayout(jobs_layout)
+        layout.addWidget(jobs_group)
+
         container = QWidget()
         container.setLayout(layout)
         self.setCentralWidget(container)
 
         # Connect signals
         self.generate_btn.clicked.connect(self.handle_generate)
+        self.cancel_job_btn.clicked.connect(self.cancel_selected_job)
         # self.schedule_btn.clicked.connect(self.handle_schedule)
         self.refresh_voices_btn.clicked.connect(self.update_voice_list)
         self.lang_combobox.currentIndexChanged.connect(self.update_voice_list)
@@ -341,9 +400,141 @@ class MainWindow(QMainWindow):
         story = self.story_input.toPlainText().strip()
         if not story:
             self.status_label.setText("Vui lòng nhập truyện hoặc chọn file!")
-            return  # Removed duplicate translation here as it's handled in generate_all
+            return  # Removed duplicate translation here as it's handled in the job
         self.status_label.setText("Đang xử lý...")
-        self.generate_all(story)
+        self.enqueue_job(story)
+
+    def collect_settings(self):
+        """Chụp lại các tùy chọn trên giao diện (chỉ gọi từ luồng giao diện)"""
+        selected_voice = self.voice_combobox.currentData()
+
+        # Ensure Vietnamese language is selected for translated content
+        if self.translate_checkbox.isChecked():
+            # Find a Vietnamese voice if current voice is not Vietnamese
+            if not selected_voice.startswith("vi-"):
+                # Set to default Vietnamese voice
+                for i in range(self.voice_combobox.count()):
+                    if self.voice_combobox.itemData(i).startswith("vi-"):
+                        self.voice_combobox.setCurrentIndex(i)
+                        selected_voice = self.voice_combobox.currentData()
+                        break
+
+        try:
+            time_per_image_seconds = (
+                float(self.time_per_image_value.text())
+                * self.time_per_image_unit.currentData()
+            )
+        except ValueError:
+            time_per_image_seconds = 0
+
+        return {
+            "api_key": self.api_key,
+            "leonardo_api_key": self.leonardo_key_input.text().strip()
+            or self.api_leonardo_key,
+            "translate": self.translate_checkbox.isChecked(),
+            "voice": selected_voice,
+            "lang": self.lang_combobox.currentData(),
+            "speed": self.speed_combobox.currentData(),
+            "auto_images": self.auto_images_checkbox.isChecked(),
+            "time_per_image_seconds": time_per_image_seconds,
+            "image_count": self.image_count_combobox.currentData(),
+        }
+
+    def enqueue_job(self, story):
+        """Tạo công việc render mới và đưa vào hàng đợi"""
+        timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+        settings = self.collect_settings()
+        job_id = self.job_store.create_job(
+            story, RenderOptions.from_dict(settings).to_dict()
+        )
+        output_dir = os.path.join("output", f"{timestamp}_job{job_id}")
+        self.job_store.set_output_dir(job_id, output_dir)
+        self.start_job(job_id, story)
+        self.status_label.setText(f"Đã thêm công việc #{job_id} vào hàng đợi")
+
+    def resume_unfinished_jobs(self):
+        """Đưa lại vào hàng đợi các công việc chưa xong từ lần chạy trước"""
+        now = datetime.datetime.now().timestamp()
+        resumed = 0
+        for job in self.job_store.unfinished_jobs():
+            if job["run_at"] and job["run_at"] > now:
+                # Công việc đặt lịch chưa đến giờ
+                schedule_job(
+                    self.job_store,
+                    job["id"],
+                    api_key=self.api_key,
+                    leonardo_api_key=self.leonardo_key_input.text().strip()
+                    or self.api_leonardo_key,
+                )
+                continue
+            self.start_job(job["id"], job["story"])
+            resumed += 1
+        if resumed:
+            self.status_label.setText(
+                f"Chạy tiếp {resumed} công việc chưa xong từ lần trước"
+            )
+
+    def start_job(self, job_id, story):
+        """Hiển thị công việc đã lưu trong JobStore và chạy nó trong thread pool"""
+        job = RenderJob(
+            self.job_store,
+            job_id,
+            api_key=self.api_key,
+            leonardo_api_key=self.leonardo_key_input.text().strip()
+            or self.api_leonardo_key,
+        )
+        job.setAutoDelete(False)
+        job.signals.progress.connect(self.on_job_progress)
+        job.signals.finished.connect(self.on_job_finished)
+        job.signals.failed.connect(self.on_job_failed)
+
+        title = story.splitlines()[0][:40]
+        item = QListWidgetItem(f"#{job_id} {title}: Đang chờ...")
+        item.setData(Qt.ItemDataRole.UserRole, job_id)
+        self.job_list.addItem(item)
+        self.jobs[job_id] = job
+        self.job_items[job_id] = (item, title)
+
+        self.thread_pool.start(job)
+
+    def set_job_status(self, job_id, message):
+        item, title = self.job_items[job_id]
+        item.setText(f"#{job_id} {title}: {message}")
+
+    def on_job_progress(self, job_id, message):
+        self.set_job_status(job_id, message)
+        self.status_label.setText(f"#{job_id}: {message}")
+
+    def on_job_finished(self, job_id, video_path):
+        self.jobs.pop(job_id, None)
+        self.set_job_status(job_id, f"Xong - {video_path}")
+        self.status_label.setText(f"Đã tạo video: {video_path}")
+
+    def on_job_failed(self, job_id, message):
+        self.jobs.pop(job_id, None)
+        self.set_job_status(job_id, f"Lỗi - {message}")
+        self.status_label.setText(f"#{job_id}: {message}")
+        if message != "Đã hủy":
+            QMessageBox.warning(
+                self, "Lỗi tạo video", f"Công việc #{job_id} thất bại: {message}"
+            )
+
+    def cancel_selected_job(self):
+        """Hủy công việc đang chọn (chưa chạy thì bỏ khỏi hàng đợi)"""
+        item = self.job_list.currentItem()
+        if item is None:
+            return
+        job_id = item.data(Qt.ItemDataRole.UserRole)
+        job = self.jobs.get(job_id)
+        if job is None:
+            return
+        job.cancel()
+        if self.thread_pool.tryTake(job):
+            # Chưa bắt đầu: không có tín hiệu nào sẽ được phát
+            self.job_store.set_status(job_id, JOB_CANCELLED)
+            self.on_job_failed(job_id, "Đã hủy")
+        else:
+            self.set_job_status(job_id, "Đang hủy...")
 
     def update_voice_list(self):
         """Cập nhật danh sách giọng nói dựa trên ngôn ngữ đã chọn"""
@@ -429,205 +620,6 @@ class MainWindow(QMainWindow):
         self.time_per_image_value.setVisible(auto_mode)
         self.time_per_image_unit.setVisible(auto_mode)
 
-    def generate_all(self, story):
-        base = "output"
-        os.makedirs(base, exist_ok=True)
-        audio_path = os.path.join(base, "audio.mp3")
-        img_path = os.path.join(base, "image.png")
-        video_path = os.path.join(base, "video.mp4")
-        sub_path = os.path.join(base, "subtitle.ass")
-        timing_path = os.path.join(base, "timings.json")
-
-        # Get Leonardo AI API key
-        leonardo_api_key = (
-            self.leonardo_key_input.text().strip() or self.api_leonardo_key
-        )
-
-        # Check if translation is needed
-        if self.translate_checkbox.isChecked():
-            self.status_label.setText("Đang dịch từ tiếng Trung sang tiếng Việt...")
-            QApplication.processEvents()
-            try:
-                # Save the original Chinese story
-                original_story = story
-                chinese_path = os.path.join(base, "original_chinese.txt")
-                with open(chinese_path, "w", encoding="utf-8") as f:
-                    f.write(original_story)
-
-                # Translate the story
-                story = translate_chinese_to_vietnamese(original_story, self.api_key)
-
-                # Save the translated story
-                vietnamese_path = os.path.join(base, "translated_vietnamese.txt")
-                with open(vietnamese_path, "w", encoding="utf-8") as f:
-                    f.write(story)
-
-                self.status_label.setText("Đã dịch xong tiếng Trung sang tiếng Việt")
-                QApplication.processEvents()
-
-            except Exception as e:
-                self.status_label.setText(f"Lỗi khi dịch: {str(e)}")
-                QMessageBox.critical(
-                    self, "Lỗi dịch thuật", f"Không thể dịch văn bản: {str(e)}"
-                )
-                return  # Lấy giọng đọc được chọn
-        selected_voice = self.voice_combobox.currentData()
-        selected_lang = self.lang_combobox.currentData()
-        selected_speed = self.speed_combobox.currentData()
-
-        # Ensure Vietnamese language is selected for translated content
-        if self.translate_checkbox.isChecked():
-            selected_lang = "vi"
-            # Find a Vietnamese voice if current voice is not Vietnamese
-            if not selected_voice.startswith("vi-"):
-                # Set to default Vietnamese voice
-                for i in range(self.voice_combobox.count()):
-                    if self.voice_combobox.itemData(i).startswith("vi-"):
-                        self.voice_combobox.setCurrentIndex(i)
-                        selected_voice = self.voice_combobox.currentData()
-                        break
-
-        # 1. TTS (với ước tính thời gian)
-        self.status_label.setText(
-            f"Đang tạo giọng nói ({selected_voice}, tốc độ: {selected_speed}) và tính thời gian..."
-        )
-        QApplication.processEvents()
-        audio_path, word_timings = text_to_speech(
-            story,
-            audio_path,
-            lang=selected_lang,
-            timing_file=timing_path,
-            voice=selected_voice,
-            rate=selected_speed,
-        )
-
-        # 2. Image(s)
-        self.status_label.setText("Đang tạo hình ảnh...")
-        QApplication.processEvents()  # Số lượng hình ảnh được chọn
-        if self.auto_images_checkbox.isChecked():
-            # Tự động tạo hình theo thời gian
-            try:
-                from modules.video_gen import get_audio_duration
-
-                audio_duration = get_audio_duration(audio_path)
-                time_per_image = float(self.time_per_image_value.text())
-                time_unit = self.time_per_image_unit.currentData()
-                time_per_image_seconds = time_per_image * time_unit
-
-                # Tính số lượng hình ảnh dựa trên thời lượng audio
-                total_images = max(1, int(audio_duration / time_per_image_seconds))
-
-                unit_name = "giây" if time_unit == 1 else "phút"
-                self.status_label.setText(
-                    f"Audio dài {audio_duration:.1f} giây, tạo {total_images} hình (mỗi {time_per_image} {unit_name})"
-                )
-                QApplication.processEvents()
-            except Exception as e:
-                self.status_label.setText(f"Lỗi khi tính toán thời gian: {str(e)}")
-                QMessageBox.warning(
-                    self,
-                    "Lỗi tạo hình ảnh",
-                    f"Không thể tính toán thời gian: {str(e)}",
-                )
-                total_images = 1
-        else:
-            total_images = self.image_count_combobox.currentData()
-
-        if total_images <= 1:
-            # Tạo một hình duy nhất
-            generate_image_from_story(story, img_path, leonardo_api_key)
-
-            # 3. Subtitle (với dữ liệu timing)
-            self.status_label.setText("Đang tạo phụ đề đồng bộ với audio...")
-            QApplication.processEvents()
-            create_subtitle(story, sub_path, word_timings=word_timings)
-
-            # 4. Video với phụ đề
-            self.status_label.setText("Đang tạo video và gắn phụ đề...")
-            QApplication.processEvents()
-            from modules.video_gen import create_video
-
-            create_video(img_path, audio_path, video_path, sub_path)
-
-            # Hiển thị thông tin thời lượng
-            try:
-                from modules.video_gen import get_audio_duration, get_video_duration
-
-                audio_dur = get_audio_duration(audio_path)
-                video_dur = get_video_duration(video_path)
-                self.status_label.setText(
-                    f"Đã tạo video ({video_dur:.1f}s) từ audio ({audio_dur:.1f}s): {video_path}"
-                )
-            except Exception as e:
-                self.status_label.setText(f"Đã tạo video: {video_path}")
-        else:
-            # Tạo nhiều hình ảnh
-            self.status_label.setText(
-                f"Đang tạo {total_images} hình ảnh cho các phân đoạn truyện..."
-            )
-            QApplication.processEvents()
-
-            # Tạo nhiều hình ảnh
-            segments_dir = os.path.join(base, "segment_images")
-            os.makedirs(segments_dir, exist_ok=True)
-
-            try:
-                # Import các module cần thiết
-                from modules.story_segment import process_story_for_images
-                from modules.video_gen import (
-                    create_video_with_segments,
-                    get_audio_duration,
-                )
-
-                # Phân đoạn truyện và tạo hình ảnh
-                image_paths = process_story_for_images(
-                    story, total_images, segments_dir, leonardo_api_key
-                )
-
-                # 3. Subtitle (với dữ liệu timing)                self.status_label.setText("Đang tạo phụ đề đồng bộ với audio...")
-                QApplication.processEvents()
-                create_subtitle(story, sub_path, word_timings=word_timings)
-
-                # 4. Video với phụ đề từ nhiều hình ảnh
-                self.status_label.setText(
-                    f"Đang tạo video từ {len(image_paths)} hình ảnh và gắn phụ đề..."
-                )
-                QApplication.processEvents()
-                create_video_with_segments(
-                    image_paths, audio_path, video_path, sub_path
-                )
-
-                # Hiển thị thông tin thời lượng
-                try:
-                    from modules.video_gen import get_audio_duration, get_video_duration
-
-                    audio_dur = get_audio_duration(audio_path)
-                    video_dur = get_video_duration(video_path)
-                    self.status_label.setText(
-                        f"Đã tạo video ({video_dur:.1f}s) từ audio ({audio_dur:.1f}s): {video_path}"
-                    )
-                except Exception as e:
-                    self.status_label.setText(f"Đã tạo video: {video_path}")
-
-            except Exception as e:
-                self.status_label.setText(f"Lỗi khi tạo video từ nhiều hình: {str(e)}")
-                QMessageBox.warning(
-                    self,
-                    "Lỗi tạo video",
-                    f"Không thể tạo video từ nhiều hình: {str(e)}",
-                )
-
-                # Thử lại với một hình duy nhất
-                self.status_label.setText("Thử tạo video với một hình đơn...")
-                QApplication.processEvents()
-                generate_image_from_story(story, img_path, leonardo_api_key)
-
-                from modules.video_gen import create_video
-
-                create_video(img_path, audio_path, video_path, sub_path)
-
-        self.status_label.setText(f"Đã tạo video: {video_path}")
-
     def update_api_key(self):
         """Update the API key when the input changes"""
         self.api_key = self.api_key_input.text().strip()
@@ -0,0 +1,252 @@
+# modules/alignment.py
+# Căn chỉnh thời gian từng từ với audio đã tổng hợp
+import logging
+from typing import List, Optional, Sequence
+import numpy as np
+
+# Cấu hình logging
+logging.basicConfig(
+    level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+)
+logger = logging.getLogger(__name__)
+
+# Tham số của bộ căn chỉnh theo năng lượng
+ENERGY_FRAME_SECONDS = 0.01  # 10 ms mỗi khung
+ENERGY_SILENCE_DB = 35.0  # Thấp hơn đỉnh năng lượng bao nhiêu dB thì coi là im lặng
+ENERGY_MIN_PAUSE_SECONDS = 0.06  # Khoảng lặng ngắn hơn sẽ bị bỏ qua
+ENERGY_SNAP_SECONDS = 0.12  # Phạm vi tìm điểm năng lượng thấp nhất quanh ranh giới từ
+ENERGY_MIN_WORD_SECONDS = 0.04  # Thời lượng tối thiểu của một từ
+
+
+def word_spans_from_durations(
+    sentence: str,
+    token_texts: Sequence[str],
+    durations: np.ndarray,
+    hop_length: int,
+    sample_rate: int,
+) -> Optional[np.ndarray]:
+    """
+    Tính ranh giới từ từ thời lượng của từng token do mô hình dự đoán (VITS, Glow-TTS)
+
+    Token khoảng trắng tách các từ; token trống (blank) và token đặc biệt được
+    tính vào thời lượng nhưng không thuộc từ nào.
+
+    Args:
+        sentence (str): Câu gốc
+        token_texts (Sequence[str]): Ký tự tương ứng với từng token đầu vào mô hình
+        durations (np.ndarray): Số khung âm thanh của từng token
+        hop_length (int): Số mẫu audio trên mỗi khung
+        sample_rate (int): Tần số lấy mẫu
+
+    Returns:
+        np.ndarray: Mảng (số từ, 2) gồm thời điểm bắt đầu/kết thúc (giây) tính từ
+        đầu câu, hoặc None nếu không khớp được token với các từ
+    """
+    words = sentence.split()
+    durations = np.asarray(durations, dtype=np.float64).reshape(-1)
+    if not words or len(token_texts) != len(durations):
+        return None
+
+    ends = np.cumsum(durations) * hop_length / sample_rate
+    starts = ends - durations * hop_length / sample_rate
+
+    spans = []
+    current = None
+    for text, start, end in zip(token_texts, starts, ends):
+        if text == " ":
+            if current is not None:
+                spans.append(current)
+                current = None
+        elif len(text) == 1:
+            current = [start, end] if current is None else [current[0], end]
+    if current is not None:
+        spans.append(current)
+
+    if len(spans) != len(words):
+        return None
+    return np.asarray(spans, dtype=np.float32)
+
+
+class UniformAligner:
+    """Chia đều thời lượng câu cho các từ (cách ước tính cũ)"""
+
+    name = "uniform"
+
+    def align(
+        self,
+        sentence: str,
+        samples: np.ndarray,
+        sample_rate: int,
+        model_spans: Optional[np.ndarray] = None,
+    ) -> Optional[np.ndarray]:
+        words = sentence.split()
+        if not words:
+            return None
+        duration = len(samples) / sample_rate
+        edges = np.linspace(0, duration, len(words) + 1, dtype=np.float32)
+        return np.stack([edges[:-1], edges[1:]], axis=1)
+
+
+class ModelDurationAligner:
+    """Dùng ranh giới từ lấy từ thời lượng token của chính mô hình TTS"""
+
+    name = "model"
+
+    def align(
+        self,
+        sentence: str,
+        samples: np.ndarray,
+        sample_rate: int,
+        model_spans: Optional[np.ndarray] = None,
+    ) -> Optional[np.ndarray]:
+        if model_spans is None or len(model_spans) != len(sentence.split()):
+            return None
+        return model_spans
+
+
+class EnergyAligner:
+    """
+    Căn chỉnh ngoại tuyến dựa trên năng lượng (VAD) của audio
+
+    Thời gian có tiếng nói được chia cho các từ theo số ký tự; khoảng lặng rơi
+    vào giữa các từ, còn ranh giới nằm trong đoạn nói liền được dời tới điểm
+    năng lượng thấp nhất gần đó. Mọi bước đều được vector hóa trên mảng khung.
+    """
+
+    name = "energy"
+
+    def __init__(
+        self,
+        frame_seconds: float = ENERGY_FRAME_SECONDS,
+        silence_db: float = ENERGY_SILENCE_DB,
+        min_pause_seconds: float = ENERGY_MIN_PAUSE_SECONDS,
+        snap_seconds: float = ENERGY_SNAP_SECONDS,
+        min_word_seconds: float = ENERGY_MIN_WORD_SECONDS,
+    ):
+        self.frame_seconds = frame_seconds
+        self.silence_db = silence_db
+        self.min_pause_seconds = min_pause_seconds
+        self.snap_seconds = snap_seconds
+        self.min_word_seconds = min_word_seconds
+
+    def _frame_energy_db(self, samples: np.ndarray, frame: int) -> np.ndarray:
+        n_frames = len(samples) // frame
+        frames = np.asarray(samples[: n_frames * frame], dtype=np.float32)
+        energy = np.mean(frames.reshape(n_frames, frame) ** 2, axis=1)
+        return 10 * np.log10(energy + 1e-10)
+
+    def _voiced_mask(self, energy_db: np.ndarray) -> np.ndarray:
+        voiced = energy_db > energy_db.max() - self.silence_db
+
+        # Lấp các khoảng lặng quá ngắn (thường là phụ âm tắc trong một từ)
+        min_pause = max(1, int(round(self.min_pause_seconds / self.frame_seconds)))
+        change = np.diff(np.concatenate([[1], voiced.astype(np.int8), [1]]))
+        gap_starts = np.flatnonzero(change == -1)
+        gap_ends = np.flatnonzero(change == 1)
+        for start, end in zip(gap_starts, gap_ends):
+            if end - start < min_pause and start > 0 and end < len(voiced):
+                voiced[start:end] = True
+        return voiced
+
+    def align(
+        self,
+        sentence: str,
+        samples: np.ndarray,
+        sample_rate: int,
+        model_spans: Optional[np.ndarray] = None,
+    ) -> Optional[np.ndarray]:
+        words = sentence.split()
+        frame = max(1, int(sample_rate * self.frame_seconds))
+        if not words or len(samples) < frame * 2:
+            return None
+
+        energy_db = self._frame_energy_db(samples, frame)
+        voiced = self._voiced_mask(energy_db)
+        cum_voiced = np.cumsum(voiced)
+        total_voiced = cum_voiced[-1]
+        if total_voiced < len(words):
+            return None
+
+        # Phân bổ thời gian có tiếng cho các từ theo số ký tự
+        weights = np.array([len(w) for w in words], dtype=np.float64)
+        shares = np.concatenate([[0], np.cumsum(weights)]) / weights.sum()
+        targets = shares * total_voiced
+        starts = np.searchsorted(cum_voiced, targets[:-1], side="right")
+        ends = np.searchsorted(cum_voiced, targets[1:], side="left") + 1
+
+        # Ranh giới nằm giữa đoạn nói liền: dời tới điểm năng lượng thấp nhất
+        snap = int(round(self.snap_seconds / self.frame_seconds))
+        if snap > 0 and len(words) > 1:
+            joined = starts[1:] <= ends[:-1]
+            boundaries = starts[1:][joined]
+            if len(boundaries):
+                padded = np.pad(energy_db, snap, mode="edge")
+                offsets = np.arange(-snap, snap + 1)
+                windows = padded[boundaries[:, None] + snap + offsets[None, :]]
+                snapped = boundaries + offsets[np.argmin(windows, axis=1)]
+                snapped = np.clip(snapped, 0, len(energy_db) - 1)
+
+                # Nếu điểm mới rơi vào khoảng lặng: từ trước kết thúc ở đầu khoảng
+                # lặng, từ sau bắt đầu ở cuối khoảng lặng
+                index = np.arange(len(voiced))
+                prev_voiced = np.maximum.accumulate(np.where(voiced, index, -1))
+                next_voiced = np.minimum.accumulate(
+                    np.where(voiced, index, len(voiced))[::-1]
+                )[::-1]
+                in_pause = ~voiced[snapped]
+                ends[:-1][joined] = np.where(
+                    in_pause, prev_voiced[snapped] + 1, snapped
+                )
+                starts[1:][joined] = np.where(in_pause, next_voiced[snapped], snapped)
+
+        # Mỗi ranh giới được dời độc lập nên các từ gần nhau có thể chồng lên
+        # nhau: ép điểm bắt đầu tăng dần, cách nhau ít nhất min_frames khung,
+        # và mỗi từ kết thúc trước khi từ sau bắt đầu
+        n_frames = len(energy_db)
+        count = len(words)
+        min_frames = int(round(self.min_word_seconds / self.frame_seconds))
+        min_frames = max(1, min(min_frames, n_frames // count))
+        steps = np.arange(count) * min_frames
+        starts = np.maximum.accumulate(np.clip(starts, 0, n_frames) - steps) + steps
+        # Chừa chỗ cho các từ phía sau
+        starts = np.minimum(starts, n_frames - count * min_frames + steps)
+        ends = np.maximum(ends, starts + min_frames)
+        ends = np.minimum(ends, np.append(starts[1:], n_frames))
+        spans = np.stack([starts, ends], axis=1) * (frame / sample_rate)
+        return spans.astype(np.float32)
+
+
+class AlignmentStage:
+    """
+    Chuỗi các bộ căn chỉnh, dùng kết quả của bộ đầu tiên thành công
+
+    Mặc định: thời lượng của mô hình -> năng lượng audio -> chia đều.
+    Có thể truyền danh sách bộ căn chỉnh khác (chỉ cần có phương thức align).
+    """
+
+    def __init__(self, aligners: Optional[List] = None):
+        self.aligners = aligners or [
+            ModelDurationAligner(),
+            EnergyAligner(),
+            UniformAligner(),
+        ]
+
+    def align(
+        self,
+        sentence: str,
+        samples: np.ndarray,
+        sample_rate: int,
+        model_spans: Optional[np.ndarray] = None,
+    ) -> np.ndarray:
+        """
+        Trả về ranh giới (bắt đầu, kết thúc) của từng từ tính từ đầu câu (giây)
+        """
+        for aligner in self.aligners:
+            try:
+                spans = aligner.align(sentence, samples, sample_rate, model_spans)
+            except Exception as e:
+                logger.warning(f"Bộ căn chỉnh {aligner.name} bị lỗi: {str(e)}")
+                continue
+            if spans is not None:
+                return spans
+        return np.zeros((0, 2), dtype=np.float32)
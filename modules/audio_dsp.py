@@ -0,0 +1,97 @@
+# modules/audio_dsp.py
+# Xử lý tín hiệu audio bằng NumPy (không phụ thuộc pydub/librosa)
+import numpy as np
+from numpy.lib.stride_tricks import as_strided
+
+# Tham số STFT mặc định cho giọng nói 22-24 kHz (~46 ms mỗi khung)
+STRETCH_FFT_SIZE = 1024
+STRETCH_HOP = STRETCH_FFT_SIZE // 4
+# Số khung đầu ra xử lý mỗi lần, giới hạn bộ nhớ cho các chương dài
+STRETCH_BLOCK_FRAMES = 4096
+
+
+def time_stretch(
+    samples: np.ndarray,
+    rate: float,
+    n_fft: int = STRETCH_FFT_SIZE,
+    hop: int = STRETCH_HOP,
+) -> np.ndarray:
+    """
+    Thay đổi tốc độ audio mà không đổi cao độ (phase vocoder)
+
+    Phổ STFT được nội suy theo thời gian, pha được tích lũy theo tần số tức thời
+    của từng bin rồi ghép chồng (overlap-add) lại. Toàn bộ phép tính được vector
+    hóa theo từng khối khung, không có vòng lặp Python theo từng mẫu hay khung.
+
+    Args:
+        samples (np.ndarray): Waveform mono float32
+        rate (float): Hệ số tốc độ (>1 nhanh hơn, <1 chậm hơn)
+        n_fft (int, optional): Kích thước khung FFT
+        hop (int, optional): Bước nhảy giữa các khung, n_fft phải chia hết cho hop
+
+    Returns:
+        np.ndarray: Waveform float32 dài khoảng len(samples) / rate
+    """
+    samples = np.asarray(samples, dtype=np.float32)
+    if rate == 1.0 or len(samples) == 0:
+        return samples
+
+    overlap = n_fft // hop
+    target_len = int(round(len(samples) / rate))
+    window = (0.5 - 0.5 * np.cos(2 * np.pi * np.arange(n_fft) / n_fft)).astype(
+        np.float32
+    )
+
+    # Chia tín hiệu thành các khung chồng nhau (không sao chép dữ liệu)
+    pad = n_fft // 2
+    padded = np.pad(samples, (pad, pad + n_fft))
+    n_frames = 1 + (len(padded) - n_fft) // hop
+    stride = padded.strides[0]
+    frames = as_strided(padded, shape=(n_frames, n_fft), strides=(stride * hop, stride))
+
+    # Vị trí (lẻ) của từng khung đầu ra trên trục khung đầu vào
+    steps = np.arange(0, n_frames - 1, rate)
+    omega = (2 * np.pi * hop * np.arange(n_fft // 2 + 1) / n_fft).astype(np.float32)
+
+    out = np.zeros((len(steps) + overlap) * hop, dtype=np.float32)
+    phase = None
+    for k0 in range(0, len(steps), STRETCH_BLOCK_FRAMES):
+        block = steps[k0 : k0 + STRETCH_BLOCK_FRAMES]
+        first = int(block[0])
+        last = int(block[-1]) + 2
+        spec = np.fft.rfft(frames[first:last] * window, axis=1)
+
+        idx = block.astype(np.int64) - first
+        frac = (block - np.floor(block)).astype(np.float32)[:, None]
+        left, right = spec[idx], spec[idx + 1]
+        magnitude = (1 - frac) * np.abs(left) + frac * np.abs(right)
+
+        # Độ lệch pha so với tần số danh định của bin, đưa về khoảng [-pi, pi]
+        delta = np.angle(right) - np.angle(left) - omega
+        delta -= 2 * np.pi * np.round(delta / (2 * np.pi))
+        advance = omega + delta
+
+        if phase is None:
+            phase = np.angle(left[0])
+        block_phase = phase + np.concatenate(
+            [np.zeros((1, advance.shape[1])), np.cumsum(advance[:-1], axis=0)]
+        )
+        phase = block_phase[-1] + advance[-1]
+
+        stretched = np.fft.irfft(magnitude * np.exp(1j * block_phase), n=n_fft, axis=1)
+        stretched = (stretched * window).astype(np.float32)
+
+        # Overlap-add: mỗi khung gồm `overlap` đoạn dài hop, cộng dồn theo từng đoạn
+        pieces = stretched.reshape(len(block), overlap, hop)
+        for i in range(overlap):
+            start = (k0 + i) * hop
+            out[start : start + len(block) * hop] += pieces[:, i, :].reshape(-1)
+
+    # Bù năng lượng của cửa sổ phân tích x tổng hợp khi chồng khung
+    norm = (window**2).reshape(overlap, hop).sum(axis=0)
+    out = (out.reshape(-1, hop) / norm).reshape(-1)
+
+    result = out[pad : pad + target_len]
+    if len(result) < target_len:
+        result = np.pad(result, (0, target_len - len(result)))
+    return result
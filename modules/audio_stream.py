@@ -0,0 +1,148 @@
+# modules/audio_stream.py
+# Mã hóa audio theo luồng: nhận PCM từng đoạn và đẩy thẳng vào ffmpeg qua pipe
+import os
+import shutil
+import logging
+import subprocess
+import numpy as np
+
+# Cấu hình logging
+logging.basicConfig(
+    level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+)
+logger = logging.getLogger(__name__)
+
+# Tham số codec theo định dạng file đầu ra
+# AAC (m4a) và Opus (opus/webm) có thể ghép thẳng vào video mp4/webm mà không
+# cần mã hóa lại (xem video_gen.audio_codec_args)
+AUDIO_CODEC_ARGS = {
+    "mp3": ["-c:a", "libmp3lame"],
+    "m4a": ["-c:a", "aac", "-b:a", "160k"],
+    "aac": ["-c:a", "aac", "-b:a", "160k"],
+    # libopus chỉ hỗ trợ một số tần số lấy mẫu, 48 kHz là chuẩn
+    "opus": ["-c:a", "libopus", "-b:a", "96k", "-ar", "48000"],
+    "webm": ["-c:a", "libopus", "-b:a", "96k", "-ar", "48000"],
+    "wav": ["-c:a", "pcm_s16le"],
+}
+
+# Tên codec (theo ffprobe) của file được tạo với các tham số trên, ghi vào
+# media_info để bước tạo video không phải chạy ffprobe
+AUDIO_CODEC_NAMES = {
+    "mp3": "mp3",
+    "m4a": "aac",
+    "aac": "aac",
+    "opus": "opus",
+    "webm": "opus",
+    "wav": "pcm_s16le",
+}
+
+
+class FFmpegAudioEncoder:
+    """
+    Bộ mã hóa audio chạy ffmpeg ở tiến trình riêng, đọc PCM float32 mono từ stdin
+
+    Mỗi lần write() đẩy một đoạn PCM vào pipe, ffmpeg mã hóa song song trong khi
+    Python tiếp tục tổng hợp câu tiếp theo. Khi pipe đầy, write() sẽ chờ nên bộ
+    nhớ không tăng theo độ dài truyện.
+
+    Ví dụ:
+        with FFmpegAudioEncoder("audio.mp3", 22050) as encoder:
+            for samples in chunks:
+                encoder.write(samples)
+    """
+
+    def __init__(self, output_path: str, sample_rate: int, speed: float = 1.0):
+        """
+        Args:
+            output_path (str): File audio đầu ra (định dạng theo phần mở rộng)
+            sample_rate (int): Tần số lấy mẫu của PCM đầu vào
+            speed (float, optional): Tốc độ đọc, áp dụng bằng bộ lọc atempo
+                (giữ nguyên cao độ)
+        """
+        self.output_path = output_path
+        self.sample_rate = sample_rate
+        self.speed = speed
+        self.samples_written = 0
+        self.process = None
+
+    @staticmethod
+    def available() -> bool:
+        """Kiểm tra ffmpeg có trong PATH không"""
+        return shutil.which("ffmpeg") is not None
+
+    def _build_command(self):
+        cmd = [
+            "ffmpeg",
+            "-y",
+            "-loglevel",
+            "error",
+            "-f",
+            "f32le",
+            "-ar",
+            str(self.sample_rate),
+            "-ac",
+            "1",
+            "-i",
+            "pipe:0",
+        ]
+        if self.speed != 1.0:
+            cmd += ["-filter:a", f"atempo={self.speed}"]
+        output_format = os.path.splitext(self.output_path)[1][1:].lower()
+        cmd += AUDIO_CODEC_ARGS.get(output_format, [])
+        cmd.append(self.output_path)
+        return cmd
+
+    def start(self):
+        """Khởi động tiến trình ffmpeg"""
+        cmd = self._build_command()
+        logger.info(f"Chạy bộ mã hóa audio: {' '.join(cmd)}")
+        self.process = subprocess.Popen(
+            cmd, stdin=subprocess.PIPE, stderr=subprocess.PIPE
+        )
+        return self
+
+    def write(self, samples: np.ndarray):
+        """Đẩy một đoạn PCM (float32 trong khoảng [-1, 1]) vào bộ mã hóa"""
+        if self.process is None:
+            self.start()
+        pcm = np.clip(samples, -1.0, 1.0).astype("<f4", copy=False)
+        self.process.stdin.write(pcm.tobytes())
+        self.samples_written += len(pcm)
+
+    def close(self) -> str:
+        """
+        Đóng pipe và chờ ffmpeg ghi xong file
+
+        Returns:
+            str: Đường dẫn file đầu ra
+        """
+        if self.process is None:
+            self.start()
+        self.process.stdin.close()
+        stderr = self.process.stderr.read().decode("utf-8", errors="replace")
+        self.process.wait()
+        if self.process.returncode != 0:
+            logger.error(f"Lỗi ffmpeg khi mã hóa audio: {stderr}")
+            raise Exception(stderr)
+        return self.output_path
+
+    def abort(self):
+        """Dừng ffmpeg khi quá trình tổng hợp bị lỗi"""
+        if self.process is not None and self.process.poll() is None:
+            self.process.kill()
+            self.process.wait()
+
+    @property
+    def duration(self) -> float:
+        """Thời lượng audio đầu ra (giây), đã tính cả tốc độ đọc"""
+        return self.samples_written / self.sample_rate / self.speed
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None:
+            self.abort()
+            return False
+        self.close()
+        return False
@@ -1,11 +1,13 @@
 # modules/deepseek.py
 # Module for interacting with the DeepSeek AI API
-import requests
 import json
 import time
 import logging
 import os
 import sys
+import asyncio
+import threading
+from modules.http_client import get_http_client
 
 # Add parent directory to path to import config
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -13,6 +15,11 @@ try:
     from config import DEEPSEEK_API_KEY as CONFIG_API_KEY
 except ImportError:
     CONFIG_API_KEY = None
+try:
+    from config import DEEPSEEK_MAX_CONCURRENCY, DEEPSEEK_REQUESTS_PER_SECOND
+except ImportError:
+    DEEPSEEK_MAX_CONCURRENCY = 4
+    DEEPSEEK_REQUESTS_PER_SECOND = 2
 
 # Configure logging
 logging.basicConfig(
@@ -20,6 +27,46 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Long completions can take minutes to generate: (connect, read) timeout
+CHAT_TIMEOUT = (10, 300)
+
+
+class TokenBucket:
+    """Thread-safe token bucket that limits how many requests start per second"""
+
+    def __init__(self, rate, capacity=None):
+        """
+        Args:
+            rate (float): Tokens added per second (0 disables the limit)
+            capacity (float, optional): Maximum burst size (default: max(1, rate))
+        """
+        self.rate = rate
+        self.capacity = capacity or max(1, rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Block until a token is available, then take it"""
+        if self.rate <= 0:
+            return
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(
+                    self.capacity, self.tokens + (now - self.updated) * self.rate
+                )
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+# Shared by every DeepSeek instance so concurrent jobs stay within the API limits
+rate_limiter = TokenBucket(DEEPSEEK_REQUESTS_PER_SECOND)
+
 
 class DeepSeek:
     """Class to handle interactions with DeepSeek API"""
@@ -45,11 +92,46 @@ class DeepSeek:
             logger.warning("Using default API key - consider setting your own API key")
 
         self.api_url = "https://api.deepseek.com/v1/chat/completions"
+        self.model = "deepseek-chat"
         self.headers = {
             "Content-Type": "application/json",
             "Authorization": f"Bearer {self.api_key}",
         }
 
+    def _build_payload(self, system_prompt, prompt, temperature, max_tokens):
+        payload = {
+            "model": self.model,
+            "messages": [
+                {"role": "system", "content": system_prompt} if system_prompt else None,
+                {"role": "user", "content": prompt},
+            ],
+            "temperature": temperature,
+            "max_tokens": max_tokens,
+        }
+        # Remove None values from the messages list
+        payload["messages"] = [
+            message for message in payload["messages"] if message is not None
+        ]
+        return payload
+
+    @staticmethod
+    def _retry_wait(response, delay):
+        """Seconds to wait before retrying, honouring Retry-After on 429"""
+        if response.status_code == 429:
+            try:
+                return max(delay, float(response.headers["Retry-After"]))
+            except (KeyError, ValueError):
+                pass
+        return delay
+
+    @staticmethod
+    def _sleep(seconds, stop_event=None):
+        """Sleep between retries; returns True if stop_event was set meanwhile"""
+        if stop_event is None:
+            time.sleep(seconds)
+            return False
+        return stop_event.wait(seconds)
+
     def chat(
         self,
         system_prompt,
@@ -76,28 +158,21 @@ class DeepSeek:
             logger.warning("Empty prompt provided for chat")
             return ""
 
-        payload = {
-            "model": "deepseek-chat",
-            "messages": [
-                {"role": "system", "content": system_prompt} if system_prompt else None,
-                {"role": "user", "content": prompt},
-            ],
-            "temperature": temperature,
-            "max_tokens": max_tokens,
-        }
-        # Remove None values from the messages list
-        payload["messages"] = [
-            message for message in payload["messages"] if message is not None
-        ]
+        payload = self._build_payload(system_prompt, prompt, temperature, max_tokens)
 
         # Try to make the request with retries
         for attempt in range(retries):
             try:
+                rate_limiter.acquire()
                 logger.info(
                     f"Sending chat request to Deepseek API (attempt {attempt+1}/{retries})"
                 )
-                response = requests.post(
-                    self.api_url, headers=self.headers, data=json.dumps(payload)
+                response = get_http_client().post(
+                    self.api_url,
+                    endpoint="deepseek.chat",
+                    headers=self.headers,
+                    data=json.dumps(payload),
+                    timeout=CHAT_TIMEOUT,
                 )
 
                 if response.status_code == 200:
@@ -110,8 +185,9 @@ class DeepSeek:
                 else:
                     logger.error(f"API error: {response.status_code} - {response.text}")
                     if attempt < retries - 1:
-                        logger.info(f"Retrying in {delay} seconds...")
-                        time.sleep(delay)
+                        wait = self._retry_wait(response, delay)
+                        logger.info(f"Retrying in {wait} seconds...")
+                        time.sleep(wait)
             except Exception as e:
                 logger.error(f"Error during API call: {str(e)}")
                 if attempt < retries - 1:
@@ -122,14 +198,160 @@ class DeepSeek:
         logger.error("All chat attempts failed")
         raise Exception("Failed to get response from Deepseek API")
 
+    def chat_stream(
+        self,
+        system_prompt,
+        prompt,
+        temperature=0.1,
+        max_tokens=4000,
+        retries=3,
+        delay=2,
+        stop_event=None,
+        on_finish=None,
+    ):
+        """
+        Send a chat request with "stream": true and yield the response as it is
+        generated (server-sent events)
+
+        A failed request is retried only while nothing has been yielded yet.
+
+        Args:
+            system_prompt (str): The system prompt (or None)
+            prompt (str): The prompt to send
+            temperature (float): Temperature parameter for generation
+            max_tokens (int): Maximum number of tokens to generate
+            retries (int): Number of retries if the API call fails
+            delay (int): Delay between retries in seconds
+            stop_event (threading.Event, optional): When set, the stream and any
+                retry back-off end early
+            on_finish (Callable[[str], None], optional): Called with the
+                finish_reason of the response ("stop", "length"...)
+
+        Yields:
+            str: Pieces of the response text, in order
+        """
+        if not prompt or not prompt.strip():
+            logger.warning("Empty prompt provided for chat")
+            return
+
+        payload = self._build_payload(system_prompt, prompt, temperature, max_tokens)
+        payload["stream"] = True
+
+        for attempt in range(retries):
+            yielded = False
+            try:
+                rate_limiter.acquire()
+                logger.info(
+                    f"Sending streaming chat request to Deepseek API (attempt {attempt+1}/{retries})"
+                )
+                response = get_http_client().post(
+                    self.api_url,
+                    endpoint="deepseek.chat_stream",
+                    headers=self.headers,
+                    data=json.dumps(payload),
+                    timeout=CHAT_TIMEOUT,
+                    stream=True,
+                )
+                with response:
+                    if response.status_code != 200:
+                        logger.error(
+                            f"API error: {response.status_code} - {response.text}"
+                        )
+                        if attempt < retries - 1:
+                            wait = self._retry_wait(response, delay)
+                            logger.info(f"Retrying in {wait} seconds...")
+                            if self._sleep(wait, stop_event):
+                                return
+                            continue
+                        raise Exception(
+                            f"API error: {response.status_code} - {response.text}"
+                        )
+                    # text/event-stream usually has no charset, so requests
+                    # would guess ISO-8859-1: split bytes and decode UTF-8
+                    for raw_line in response.iter_lines():
+                        if stop_event is not None and stop_event.is_set():
+                            return
+                        line = raw_line.decode("utf-8")
+                        # Events look like "data: {...}"; blank lines and
+                        # ": keep-alive" comments separate them
+                        if not line or not line.startswith("data:"):
+                            continue
+                        data = line[len("data:") :].strip()
+                        if data == "[DONE]":
+                            return
+                        choice = json.loads(data)["choices"][0]
+                        content = choice.get("delta", {}).get("content")
+                        if content:
+                            yielded = True
+                            yield content
+                        if choice.get("finish_reason") and on_finish is not None:
+                            on_finish(choice["finish_reason"])
+                return
+            except Exception as e:
+                logger.error(f"Error during streaming API call: {str(e)}")
+                if yielded or attempt == retries - 1:
+                    raise Exception(f"Streaming response from Deepseek API failed: {e}")
+                logger.info(f"Retrying in {delay} seconds...")
+                if self._sleep(delay, stop_event):
+                    return
+
+    async def achat_stream(self, system_prompt, prompt, **kwargs):
+        """
+        Async variant of chat_stream: the HTTP stream is read in a worker thread
+        and each piece is handed to the event loop as soon as it arrives
+
+        Args:
+            system_prompt (str): The system prompt (or None)
+            prompt (str): The prompt to send
+            **kwargs: temperature, max_tokens, retries, delay (see chat_stream)
+
+        Yields:
+            str: Pieces of the response text, in order
+        """
+        loop = asyncio.get_running_loop()
+        queue = asyncio.Queue()
+        done = object()
+        stop = threading.Event()
+
+        def pump():
+            try:
+                for piece in self.chat_stream(system_prompt, prompt, **kwargs):
+                    if stop.is_set():
+                        break
+                    loop.call_soon_threadsafe(queue.put_nowait, piece)
+                loop.call_soon_threadsafe(queue.put_nowait, done)
+            except Exception as e:
+                loop.call_soon_threadsafe(queue.put_nowait, e)
+
+        worker = loop.run_in_executor(None, pump)
+        try:
+            while True:
+                item = await queue.get()
+                if item is done:
+                    break
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+        finally:
+            # Stop reading the stream if the consumer gave up early
+            stop.set()
+            await worker
+
 
 # For testing the module
 if __name__ == "__main__":
     test_prompt = "What is the capital of Vietnam?"
     try:
         deepseek = DeepSeek()
-        response = deepseek.chat(test_prompt)
+        response = deepseek.chat(None, test_prompt)
         print(f"Prompt: {test_prompt}")
         print(f"Response: {response}")
+
+        async def stream_demo():
+            async for piece in deepseek.achat_stream(None, test_prompt):
+                print(piece, end="", flush=True)
+            print()
+
+        asyncio.run(stream_demo())
     except Exception as e:
         print(f"Error: {e}")
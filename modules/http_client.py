@@ -0,0 +1,195 @@
+# modules/http_client.py
+# Shared connection-pooled HTTP client (keep-alive, retry/backoff, latency metrics)
+import os
+import sys
+import time
+import logging
+import threading
+from typing import Dict, Optional
+from urllib.parse import urlsplit
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# Add parent directory to path to import config
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+try:
+    from config import (
+        HTTP_POOL_SIZE,
+        HTTP_HOST_POOL_SIZES,
+        HTTP_TIMEOUT,
+        HTTP_RETRIES,
+        HTTP_BACKOFF_FACTOR,
+    )
+except ImportError:
+    HTTP_POOL_SIZE = 10
+    HTTP_HOST_POOL_SIZES = {}
+    HTTP_TIMEOUT = (10, 120)
+    HTTP_RETRIES = 3
+    HTTP_BACKOFF_FACTOR = 1
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+)
+logger = logging.getLogger(__name__)
+
+
+class HttpClient:
+    """
+    One keep-alive requests.Session per host, so repeated calls (chat requests,
+    generation status polling, image downloads) reuse open TCP/TLS connections
+
+    Idempotent requests (GET, HEAD...) are retried with exponential back-off on
+    connection errors and 429/5xx responses; POST requests are only retried
+    when the connection could not be established, so a generation is never
+    submitted twice.
+    """
+
+    def __init__(
+        self,
+        pool_size: int = HTTP_POOL_SIZE,
+        host_pool_sizes: Optional[Dict[str, int]] = None,
+        timeout=HTTP_TIMEOUT,
+        retries: int = HTTP_RETRIES,
+        backoff_factor: float = HTTP_BACKOFF_FACTOR,
+    ):
+        """
+        Args:
+            pool_size (int): Connections kept open per host
+            host_pool_sizes (Dict[str, int], optional): Pool size overrides by host
+            timeout (float or tuple): Default (connect, read) timeout in seconds
+            retries (int): Maximum number of retries per request
+            backoff_factor (float): Back-off factor between retries
+        """
+        self.pool_size = pool_size
+        self.host_pool_sizes = dict(
+            HTTP_HOST_POOL_SIZES if host_pool_sizes is None else host_pool_sizes
+        )
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff_factor = backoff_factor
+        self._sessions = {}
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def session_for(self, url: str) -> requests.Session:
+        """Pooled session for the host of the given URL"""
+        parts = urlsplit(url)
+        host = parts.hostname or ""
+        with self._lock:
+            session = self._sessions.get(host)
+            if session is None:
+                retry = Retry(
+                    total=self.retries,
+                    connect=self.retries,
+                    backoff_factor=self.backoff_factor,
+                    status_forcelist=(429, 500, 502, 503, 504),
+                    respect_retry_after_header=True,
+                    raise_on_status=False,
+                )
+                adapter = HTTPAdapter(
+                    pool_connections=1,
+                    pool_maxsize=self.host_pool_sizes.get(host, self.pool_size),
+                    max_retries=retry,
+                )
+                session = requests.Session()
+                session.mount(f"{parts.scheme}://", adapter)
+                self._sessions[host] = session
+        return session
+
+    def request(
+        self, method: str, url: str, endpoint: Optional[str] = None, **kwargs
+    ) -> requests.Response:
+        """
+        Send a request through the pooled session of the URL's host
+
+        Args:
+            method (str): HTTP method
+            url (str): Request URL
+            endpoint (str, optional): Name used for the latency metrics (default:
+                method + host + path; pass one for URLs containing IDs)
+            **kwargs: Passed to requests.Session.request
+
+        Returns:
+            requests.Response: The response
+        """
+        kwargs.setdefault("timeout", self.timeout)
+        if endpoint is None:
+            parts = urlsplit(url)
+            endpoint = f"{method.upper()} {parts.hostname}{parts.path}"
+
+        start = time.perf_counter()
+        failed = True
+        try:
+            response = self.session_for(url).request(method, url, **kwargs)
+            failed = response.status_code >= 400
+            return response
+        finally:
+            self._record(endpoint, time.perf_counter() - start, failed)
+
+    def get(self, url: str, **kwargs) -> requests.Response:
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url: str, **kwargs) -> requests.Response:
+        return self.request("POST", url, **kwargs)
+
+    def head(self, url: str, **kwargs) -> requests.Response:
+        return self.request("HEAD", url, **kwargs)
+
+    def _record(self, endpoint: str, seconds: float, failed: bool):
+        with self._lock:
+            stats = self._metrics.setdefault(
+                endpoint,
+                {"count": 0, "errors": 0, "total": 0.0, "min": None, "max": 0.0},
+            )
+            stats["count"] += 1
+            stats["errors"] += int(failed)
+            stats["total"] += seconds
+            stats["min"] = (
+                seconds if stats["min"] is None else min(stats["min"], seconds)
+            )
+            stats["max"] = max(stats["max"], seconds)
+
+    def metrics(self) -> Dict[str, Dict]:
+        """Latency statistics (seconds) per endpoint"""
+        with self._lock:
+            return {
+                endpoint: dict(stats, avg=stats["total"] / stats["count"])
+                for endpoint, stats in self._metrics.items()
+            }
+
+    def format_metrics(self) -> str:
+        """Metrics as one readable line per endpoint"""
+        return "\n".join(
+            f"{endpoint}: {s['count']} requests, {s['errors']} errors, "
+            f"avg {s['avg']:.2f}s, min {s['min']:.2f}s, max {s['max']:.2f}s"
+            for endpoint, s in sorted(self.metrics().items())
+        )
+
+    def close(self):
+        with self._lock:
+            for session in self._sessions.values():
+                session.close()
+            self._sessions.clear()
+
+
+_default_client = None
+_default_client_lock = threading.Lock()
+
+
+def get_http_client() -> HttpClient:
+    """Shared HTTP client, created on first use"""
+    global _default_client
+    with _default_client_lock:
+        if _default_client is None:
+            _default_client = HttpClient()
+        return _default_client
+
+
+# For testing the module
+if __name__ == "__main__":
+    client = get_http_client()
+    for _ in range(3):
+        client.head("https://api.deepseek.com", endpoint="deepseek.head")
+    print(client.format_metrics())
@@ -21,7 +21,9 @@ logger = logging.getLogger(__name__)
 LEONARDO_API_KEY = "your-leonardo-api-key-here"
 
 
-def generate_image_from_story(story, output_path, api_key=None, num_images=1):
+def generate_image_from_story(
+    story, output_path, api_key=None, num_images=1, cancel_event=None
+):
     """
     Tạo hình ảnh từ nội dung truyện sử dụng Leonardo.ai API
 
@@ -30,20 +32,26 @@ def generate_image_from_story(story, output_path, api_key=None, num_images=1):
         output_path (str): Đường dẫn để lưu hình ảnh
         api_key (str, optional): Leonardo.ai API key. Nếu không cung cấp, sẽ sử dụng key mặc định
         num_images (int, optional): Số lượng hình ảnh cần tạo. Mặc định là 1
+        cancel_event (threading.Event, optional): Cờ hủy, dừng việc chờ
+            Leonardo.ai tạo và tải hình
 
     Returns:
-        str: Đường dẫn đến hình ảnh đã tạo
+        str: Đường dẫn đến hình ảnh đã tạo, None nếu bị hủy
     """
     if api_key is None:
         api_key = LEONARDO_API_KEY
 
     if num_images <= 1:
         # Tạo một hình ảnh duy nhất
-        return _generate_single_image(story, output_path, api_key)
+        return _generate_single_image(story, output_path, api_key, cancel_event)
     else:
         # Tạo nhiều hình ảnh từ các phân đoạn truyện
         output_dir = os.path.dirname(output_path)
-        image_paths = _generate_multiple_images(story, num_images, output_dir, api_key)
+        image_paths = _generate_multiple_images(
+            story, num_images, output_dir, api_key, cancel_event
+        )
+        if cancel_event is not None and cancel_event.is_set():
+            return None
 
         # Tạo một hình ảnh đại diện (hình đầu tiên được tạo)
         if image_paths and os.path.exists(image_paths[0]):
@@ -56,7 +64,7 @@ def generate_image_from_story(story, output_path, api_key=None, num_images=1):
         return output_path
 
 
-def _generate_single_image(story, output_path, api_key):
+def _generate_single_image(story, output_path, api_key, cancel_event=None):
     """
     Tạo một hình ảnh duy nhất từ nội dung truyện
     """
@@ -72,7 +80,7 @@ def _generate_single_image(story, output_path, api_key):
 
         if prompts and prompts[0]:
             # Tạo hình ảnh với Leonardo.ai
-            generator = LeonardoImageGenerator(api_key)
+            generator = LeonardoImageGenerator(api_key, cancel_event)
             print(f"DEBUG: Using API key: {api_key[:5]}...")
             image_url = generator.generate_image(prompts[0])
 
@@ -109,23 +117,32 @@ def _generate_single_image(story, output_path, api_key):
                         return output_path
 
                     # Try to manually download the image with a different method
-                    try:
-                        logger.info(
-                            f"Attempting alternative download method for {image_url}"
-                        )
-                        import urllib.request
-
-                        urllib.request.urlretrieve(image_url, output_path)
-                        if (
-                            os.path.exists(output_path)
-                            and os.path.getsize(output_path) > 0
-                        ):
+                    # (not when download_image stopped because of cancel_event)
+                    if cancel_event is None or not cancel_event.is_set():
+                        try:
                             logger.info(
-                                f"Alternative download successful: {output_path}"
+                                f"Attempting alternative download method for {image_url}"
+                            )
+                            import urllib.request
+
+                            urllib.request.urlretrieve(image_url, output_path)
+                            if (
+                                os.path.exists(output_path)
+                                and os.path.getsize(output_path) > 0
+                            ):
+                                logger.info(
+                                    f"Alternative download successful: {output_path}"
+                                )
+                                return output_path
+                        except Exception as e:
+                            logger.error(
+                                f"Alternative download method failed: {str(e)}"
                             )
-                            return output_path
-                    except Exception as e:
-                        logger.error(f"Alternative download method failed: {str(e)}")
+
+        # Bị hủy giữa chừng: không tạo hình mặc định thay thế
+        if cancel_event is not None and cancel_event.is_set():
+            logger.info("Đã hủy tạo hình ảnh")
+            return None
 
         # Nếu không thể tạo hoặc tải hình ảnh từ API, tạo hình ảnh mặc định
         logger.warning("Không thể tạo hình ảnh từ API, sử dụng hình ảnh mặc định.")
@@ -139,7 +156,9 @@ def _generate_single_image(story, output_path, api_key):
         return _create_default_image(story, output_path)
 
 
-def _generate_multiple_images(story, num_images, output_dir, api_key):
+def _generate_multiple_images(
+    story, num_images, output_dir, api_key, cancel_event=None
+):
     """
     Tạo nhiều hình ảnh từ các phân đoạn truyện
     """
@@ -149,7 +168,9 @@ def _generate_multiple_images(story, num_images, output_dir, api_key):
         os.makedirs(segments_dir, exist_ok=True)
 
         # Tạo các hình ảnh từ các phân đoạn truyện
-        image_paths = process_story_for_images(story, num_images, segments_dir, api_key)
+        image_paths = process_story_for_images(
+            story, num_images, segments_dir, api_key, cancel_event
+        )
 
         # Lưu thông tin về các hình ảnh đã tạo
         info_path = os.path.join(output_dir, "segment_images.json")
@@ -0,0 +1,293 @@
+# modules/job_store.py
+# Lưu hàng đợi tạo video và kết quả từng bước vào SQLite để chạy tiếp sau khi khởi động lại
+import os
+import json
+import time
+import socket
+import sqlite3
+import logging
+import threading
+from typing import Dict, List, Optional
+
+# Cấu hình logging
+logging.basicConfig(
+    level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+)
+logger = logging.getLogger(__name__)
+
+DEFAULT_JOB_DB = os.path.join("output", "jobs.sqlite")
+
+# Trạng thái của một công việc
+JOB_PENDING = "pending"
+JOB_RUNNING = "running"
+JOB_DONE = "done"
+JOB_FAILED = "failed"
+JOB_CANCELLED = "cancelled"
+
+# Công việc đang chạy được xem là bị bỏ dở (tiến trình đã tắt) khi không có
+# heartbeat trong khoảng thời gian này (giây)
+JOB_LEASE_SECONDS = 120
+# Khoảng thời gian giữa hai lần heartbeat của công việc đang chạy (giây)
+JOB_HEARTBEAT_SECONDS = 30
+
+
+class JobAlreadyClaimed(Exception):
+    """Công việc đang được một tiến trình khác chạy"""
+
+
+def job_owner() -> str:
+    """Tên người nhận công việc: máy, tiến trình và luồng hiện tại"""
+    return f"{socket.gethostname()}:{os.getpid()}:{threading.get_ident()}"
+
+
+class JobStore:
+    """
+    Hàng đợi công việc bền vững: mỗi công việc lưu nội dung truyện, tùy chọn,
+    thư mục đầu ra và kết quả của từng bước đã xong (bản dịch, audio, timing,
+    hình ảnh, phụ đề, video). Khi tiến trình bị dừng giữa chừng, lần chạy sau
+    bắt đầu lại từ bước chưa hoàn thành.
+    """
+
+    def __init__(self, db_path: str = DEFAULT_JOB_DB):
+        self.db_path = db_path
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(db_path, check_same_thread=False)
+        self._db.row_factory = sqlite3.Row
+        self._db.execute("""CREATE TABLE IF NOT EXISTS jobs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                story TEXT NOT NULL,
+                options TEXT NOT NULL,
+                output_dir TEXT,
+                status TEXT NOT NULL,
+                error TEXT,
+                run_at REAL,
+                created REAL,
+                updated REAL,
+                owner TEXT,
+                heartbeat REAL
+            )""")
+        # Cơ sở dữ liệu tạo bởi phiên bản cũ chưa có cột owner/heartbeat
+        columns = {row["name"] for row in self._db.execute("PRAGMA table_info(jobs)")}
+        for column, kind in (("owner", "TEXT"), ("heartbeat", "REAL")):
+            if column not in columns:
+                self._db.execute(f"ALTER TABLE jobs ADD COLUMN {column} {kind}")
+        self._db.execute("""CREATE TABLE IF NOT EXISTS stages (
+                job_id INTEGER NOT NULL,
+                stage TEXT NOT NULL,
+                output TEXT,
+                completed REAL,
+                PRIMARY KEY (job_id, stage)
+            )""")
+        self._db.commit()
+
+    def create_job(
+        self,
+        story: str,
+        options: Dict,
+        output_dir: Optional[str] = None,
+        run_at: Optional[float] = None,
+    ) -> int:
+        """
+        Thêm công việc mới vào hàng đợi
+
+        Args:
+            story (str): Nội dung truyện
+            options (Dict): Tùy chọn (RenderOptions.to_dict())
+            output_dir (str, optional): Thư mục đầu ra, mặc định output/job<id>
+            run_at (float, optional): Thời điểm chạy (timestamp), None = ngay
+
+        Returns:
+            int: Mã công việc
+        """
+        now = time.time()
+        with self._lock:
+            cursor = self._db.execute(
+                "INSERT INTO jobs (story, options, output_dir, status, run_at, created, updated) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (story, json.dumps(options), output_dir, JOB_PENDING, run_at, now, now),
+            )
+            job_id = cursor.lastrowid
+            if output_dir is None:
+                self._db.execute(
+                    "UPDATE jobs SET output_dir = ? WHERE id = ?",
+                    (os.path.join("output", f"job{job_id}"), job_id),
+                )
+            self._db.commit()
+        return job_id
+
+    def get_job(self, job_id: int) -> Optional[Dict]:
+        """Lấy thông tin công việc (options đã được giải mã JSON)"""
+        with self._lock:
+            row = self._db.execute(
+                "SELECT * FROM jobs WHERE id = ?", (job_id,)
+            ).fetchone()
+        if row is None:
+            return None
+        job = dict(row)
+        job["options"] = json.loads(job["options"])
+        return job
+
+    def set_status(self, job_id: int, status: str, error: Optional[str] = None):
+        with self._lock:
+            self._db.execute(
+                "UPDATE jobs SET status = ?, error = ?, updated = ? WHERE id = ?",
+                (status, error, time.time(), job_id),
+            )
+            self._db.commit()
+
+    def claim_job(
+        self, job_id: int, owner: str, lease_seconds: float = JOB_LEASE_SECONDS
+    ) -> bool:
+        """
+        Nhận công việc để chạy và chuyển sang trạng thái đang chạy
+
+        Chỉ nhận được khi công việc không chạy ở nơi khác: chưa ở trạng thái
+        đang chạy, hoặc người nhận trước đã không gửi heartbeat quá lease_seconds.
+        Việc kiểm tra và cập nhật nằm trong một câu UPDATE nên hai tiến trình
+        không thể cùng nhận một công việc.
+
+        Args:
+            job_id (int): Mã công việc
+            owner (str): Người nhận (xem job_owner)
+            lease_seconds (float, optional): Thời hạn của heartbeat
+
+        Returns:
+            bool: True nếu đã nhận được công việc
+        """
+        now = time.time()
+        with self._lock:
+            cursor = self._db.execute(
+                "UPDATE jobs SET status = ?, error = NULL, owner = ?, heartbeat = ?, "
+                "updated = ? WHERE id = ? AND (status != ? OR heartbeat IS NULL "
+                "OR heartbeat < ?)",
+                (
+                    JOB_RUNNING,
+                    owner,
+                    now,
+                    now,
+                    job_id,
+                    JOB_RUNNING,
+                    now - lease_seconds,
+                ),
+            )
+            self._db.commit()
+        return cursor.rowcount == 1
+
+    def heartbeat(self, job_id: int, owner: str) -> bool:
+        """
+        Gia hạn công việc đang chạy
+
+        Returns:
+            bool: False nếu công việc đã bị người khác nhận lại
+        """
+        with self._lock:
+            cursor = self._db.execute(
+                "UPDATE jobs SET heartbeat = ? WHERE id = ? AND owner = ? AND status = ?",
+                (time.time(), job_id, owner, JOB_RUNNING),
+            )
+            self._db.commit()
+        return cursor.rowcount == 1
+
+    def set_run_at(self, job_id: int, run_at: Optional[float]):
+        """Đổi thời điểm chạy của công việc (timestamp)"""
+        with self._lock:
+            self._db.execute(
+                "UPDATE jobs SET run_at = ?, updated = ? WHERE id = ?",
+                (run_at, time.time(), job_id),
+            )
+            self._db.commit()
+
+    def set_output_dir(self, job_id: int, output_dir: str):
+        with self._lock:
+            self._db.execute(
+                "UPDATE jobs SET output_dir = ?, updated = ? WHERE id = ?",
+                (output_dir, time.time(), job_id),
+            )
+            self._db.commit()
+
+    def find_job(self, output_dir: str, story: str) -> Optional[Dict]:
+        """Công việc chưa xong gần nhất có cùng thư mục đầu ra và nội dung"""
+        with self._lock:
+            row = self._db.execute(
+                "SELECT id FROM jobs WHERE output_dir = ? AND story = ? "
+                "AND status IN (?, ?, ?) ORDER BY id DESC LIMIT 1",
+                (output_dir, story, JOB_PENDING, JOB_RUNNING, JOB_FAILED),
+            ).fetchone()
+        return self.get_job(row["id"]) if row else None
+
+    def save_stage(self, job_id: int, stage: str, output):
+        """Ghi lại kết quả (dạng JSON) của một bước đã hoàn thành"""
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO stages VALUES (?, ?, ?, ?)",
+                (job_id, stage, json.dumps(output, ensure_ascii=False), time.time()),
+            )
+            self._db.execute(
+                "UPDATE jobs SET updated = ? WHERE id = ?", (time.time(), job_id)
+            )
+            self._db.commit()
+
+    def load_stages(self, job_id: int) -> Dict:
+        """Kết quả của các bước đã hoàn thành, theo tên bước"""
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT stage, output FROM stages WHERE job_id = ?", (job_id,)
+            ).fetchall()
+        return {row["stage"]: json.loads(row["output"]) for row in rows}
+
+    def clear_stages(self, job_id: int):
+        """Xóa kết quả các bước để chạy lại từ đầu"""
+        with self._lock:
+            self._db.execute("DELETE FROM stages WHERE job_id = ?", (job_id,))
+            self._db.commit()
+
+    def unfinished_jobs(self, lease_seconds: float = JOB_LEASE_SECONDS) -> List[Dict]:
+        """
+        Các công việc chưa xong: đang chờ, hoặc bị dừng khi đang chạy (không có
+        heartbeat quá lease_seconds). Công việc đang chạy ở tiến trình khác
+        không được trả về.
+        """
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT id FROM jobs WHERE status = ? OR (status = ? AND "
+                "(heartbeat IS NULL OR heartbeat < ?)) ORDER BY id",
+                (JOB_PENDING, JOB_RUNNING, time.time() - lease_seconds),
+            ).fetchall()
+        return [self.get_job(row["id"]) for row in rows]
+
+    def list_jobs(self, limit: int = 50) -> List[Dict]:
+        """Các công việc gần nhất"""
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT id FROM jobs ORDER BY id DESC LIMIT ?", (limit,)
+            ).fetchall()
+        return [self.get_job(row["id"]) for row in rows]
+
+
+_default_store = None
+_default_store_lock = threading.Lock()
+
+
+def get_job_store() -> JobStore:
+    """Lấy hàng đợi công việc mặc định (tạo khi dùng lần đầu)"""
+    global _default_store
+    with _default_store_lock:
+        if _default_store is None:
+            _default_store = JobStore()
+        return _default_store
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Xem hàng đợi tạo video")
+    parser.add_argument("--db", default=DEFAULT_JOB_DB, help="File SQLite")
+    args = parser.parse_args()
+
+    store = JobStore(args.db)
+    for job in store.list_jobs():
+        stages = ", ".join(store.load_stages(job["id"])) or "-"
+        print(f"#{job['id']} [{job['status']}] {job['output_dir']} (xong: {stages})")
+        if job["error"]:
+            print(f"    Lỗi: {job['error']}")
@@ -0,0 +1,138 @@
+# modules/media_info.py
+# Bộ nhớ đệm thông tin media (thời lượng, stream) để không gọi ffprobe lặp lại
+import os
+import logging
+import threading
+from typing import Dict, Optional, Tuple
+import ffmpeg
+
+# Cấu hình logging
+logging.basicConfig(
+    level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+)
+logger = logging.getLogger(__name__)
+
+_cache: Dict[Tuple[str, int, int], Dict] = {}
+_cache_lock = threading.Lock()
+_stats = {"hits": 0, "misses": 0, "recorded": 0}
+
+
+def _file_key(path: str) -> Tuple[str, int, int]:
+    """Khóa của file: (đường dẫn tuyệt đối, mtime_ns, kích thước)"""
+    abs_path = os.path.abspath(path)
+    stat = os.stat(abs_path)
+    return abs_path, stat.st_mtime_ns, stat.st_size
+
+
+def record_media_info(path: str, duration: Optional[float] = None, **info):
+    """
+    Ghi thông tin của file vừa tạo (ví dụ thời lượng audio do bước TTS tính từ
+    số mẫu), để các bước sau không phải chạy ffprobe
+
+    Phải gọi sau khi file đã được ghi xong, vì khóa gồm cả mtime và kích thước.
+
+    Args:
+        path (str): Đường dẫn file
+        duration (float, optional): Thời lượng (giây)
+        **info: Các thông tin khác (codec, sample_rate, width, height...)
+    """
+    key = _file_key(path)
+    if duration is not None:
+        info["duration"] = float(duration)
+    with _cache_lock:
+        # Bỏ các mục cũ của cùng đường dẫn (file đã bị ghi đè)
+        for old_key in [k for k in _cache if k[0] == key[0]]:
+            del _cache[old_key]
+        _cache[key] = info
+        _stats["recorded"] += 1
+
+
+def get_media_info(path: str) -> Dict:
+    """
+    Lấy thông tin của file media, chỉ chạy ffprobe khi file chưa có trong bộ nhớ
+    đệm hoặc đã thay đổi
+
+    Args:
+        path (str): Đường dẫn file
+
+    Returns:
+        Dict: Thông tin gồm "duration" và (nếu từ ffprobe) "streams"
+    """
+    key = _file_key(path)
+    with _cache_lock:
+        info = _cache.get(key)
+        if info is not None:
+            _stats["hits"] += 1
+            return info
+        _stats["misses"] += 1
+
+    info = _probe(path)
+    with _cache_lock:
+        _cache[key] = info
+    return info
+
+
+def _probe(path: str) -> Dict:
+    """Chạy ffprobe, trả về thời lượng và danh sách stream"""
+    probe = ffmpeg.probe(path)
+    info = {"duration": float(probe["format"]["duration"])}
+    info["streams"] = [
+        {
+            "codec_type": stream.get("codec_type"),
+            "codec_name": stream.get("codec_name"),
+            "width": stream.get("width"),
+            "height": stream.get("height"),
+            "sample_rate": stream.get("sample_rate"),
+        }
+        for stream in probe.get("streams", [])
+    ]
+    return info
+
+
+def get_duration(path: str) -> float:
+    """Thời lượng của file media (giây)"""
+    return get_media_info(path)["duration"]
+
+
+def get_audio_codec(path: str) -> Optional[str]:
+    """
+    Codec của stream audio đầu tiên (tên theo ffprobe, ví dụ "aac", "opus")
+
+    Dùng codec đã được ghi lại (record_media_info(..., audio_codec=...)) hoặc
+    stream từ ffprobe; mục chỉ có thời lượng sẽ được bổ sung bằng ffprobe.
+
+    Returns:
+        str: Tên codec, None nếu file không có audio
+    """
+    info = get_media_info(path)
+    if info.get("audio_codec"):
+        return info["audio_codec"]
+    streams = info.get("streams")
+    if streams is None:
+        streams = _probe(path)["streams"]
+    codec = next((s["codec_name"] for s in streams if s["codec_type"] == "audio"), None)
+    with _cache_lock:
+        info["streams"] = streams
+        info["audio_codec"] = codec
+    return codec
+
+
+def get_media_cache_stats() -> Dict:
+    """Thống kê hit/miss của bộ nhớ đệm"""
+    with _cache_lock:
+        return dict(_stats, entries=len(_cache))
+
+
+def clear_media_cache():
+    """Xóa toàn bộ bộ nhớ đệm"""
+    with _cache_lock:
+        _cache.clear()
+
+
+if __name__ == "__main__":
+    import sys
+
+    for media_path in sys.argv[1:]:
+        print(f"{media_path}: {get_duration(media_path):.2f} giây")
+        print(f"{media_path}: {get_duration(media_path):.2f} giây (từ bộ nhớ đệm)")
+    print(get_media_cache_stats())
@@ -0,0 +1,600 @@
+# modules/pipeline.py
+# Quy trình tạo video từ truyện (dịch -> TTS -> hình ảnh -> phụ đề -> video), không phụ thuộc giao diện
+import os
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from typing import Callable, Dict, Iterable, List, Optional
+import config
+from modules.job_store import (
+    JobAlreadyClaimed,
+    JobStore,
+    job_owner,
+    JOB_CANCELLED,
+    JOB_DONE,
+    JOB_FAILED,
+    JOB_HEARTBEAT_SECONDS,
+)
+from modules.media_info import record_media_info
+from modules.timings import load_timings
+from modules.tts import text_to_speech, SYNTHESIS_WORKERS
+from modules.image_gen import generate_image_from_story
+from modules.subtitle import create_subtitle
+from modules.translate import stream_chinese_to_vietnamese
+from modules.video_gen import (
+    ENCODE_WORKERS,
+    SUBTITLE_RENDERER,
+    create_video,
+    create_video_with_segments,
+    get_audio_duration,
+    get_video_duration,
+)
+
+# Cấu hình logging
+logging.basicConfig(
+    level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+)
+logger = logging.getLogger(__name__)
+
+
+# Số bước chạy song song tối đa trong một lần tạo video (TTS, hình ảnh...)
+STAGE_WORKERS = 3
+
+
+class RenderCancelled(Exception):
+    """Quá trình tạo video bị hủy"""
+
+
+def estimate_video_duration(text: str, speed_factor: str) -> float:
+    """Ước lượng thời gian video dựa vào số lượng ký tự và tốc độ đọc"""
+    # Tốc độ đọc trung bình: ~15-20 ký tự/giây ở tốc độ bình thường
+    chars = len(text.strip())
+
+    # Chuyển đổi speed_factor từ format "+7%" sang số thập phân
+    if speed_factor.startswith("+"):
+        speed_factor = 1 + float(speed_factor.strip("+%")) / 100
+    elif speed_factor.startswith("-"):
+        speed_factor = 1 - float(speed_factor.strip("-%")) / 100
+    else:
+        speed_factor = 1
+
+    # Ước tính số ký tự/giây dựa vào tốc độ (15 ký tự/giây ở tốc độ bình thường)
+    chars_per_second = 15 * speed_factor
+
+    # Tính thời gian ước lượng
+    seconds = chars / chars_per_second
+
+    return seconds
+
+
+class StageGraph:
+    """
+    Chạy các bước theo đồ thị phụ thuộc: bước nào có đủ đầu vào thì được chạy
+    ngay trong thread pool, các bước độc lập (TTS và tạo hình) chạy song song
+
+    Mỗi bước là một hàm nhận dict kết quả của các bước trước (theo tên).
+    """
+
+    def __init__(self, max_workers: int = STAGE_WORKERS):
+        self.max_workers = max_workers
+        self.stages = {}
+
+    def add(self, name: str, func: Callable[[Dict], object], deps: Iterable[str] = ()):
+        """Thêm một bước và các bước mà nó phụ thuộc"""
+        self.stages[name] = (func, tuple(deps))
+
+    def run(
+        self,
+        cancel_event: Optional[threading.Event] = None,
+        results: Optional[Dict] = None,
+        on_done: Optional[Callable[[str, object], None]] = None,
+        stop_event: Optional[threading.Event] = None,
+    ) -> Dict:
+        """
+        Chạy toàn bộ đồ thị
+
+        Args:
+            cancel_event (threading.Event, optional): Cờ hủy
+            results (Dict, optional): Kết quả đã có sẵn (ví dụ khôi phục từ
+                JobStore), các bước này không chạy lại
+            on_done (Callable[[str, object], None], optional): Gọi sau mỗi bước
+                hoàn thành với tên bước và kết quả
+            stop_event (threading.Event, optional): Được đặt khi đồ thị dừng vì
+                bị hủy hoặc có lỗi, để các bước đang chạy tự kết thúc sớm
+
+        Returns:
+            Dict: Kết quả của từng bước theo tên
+
+        Raises:
+            Exception: Lỗi đầu tiên của một bước (các bước chưa chạy bị bỏ)
+        """
+        results = dict(results or {})
+        pending = {n: s for n, s in self.stages.items() if n not in results}
+        running = {}
+
+        def cancelled():
+            return cancel_event is not None and cancel_event.is_set()
+
+        # Không dùng "with": khi thoát, nó chờ các bước đang chạy làm xong
+        executor = ThreadPoolExecutor(max_workers=self.max_workers)
+        try:
+            while pending or running:
+                if cancelled():
+                    raise RenderCancelled()
+
+                for name, (func, deps) in list(pending.items()):
+                    missing = [d for d in deps if d not in self.stages]
+                    if missing:
+                        raise ValueError(
+                            f"Bước {name} phụ thuộc bước không có: {missing}"
+                        )
+                    if all(d in results for d in deps):
+                        running[executor.submit(func, dict(results))] = name
+                        del pending[name]
+
+                if not running:
+                    raise ValueError(f"Đồ thị có vòng phụ thuộc: {list(pending)}")
+
+                # Chờ có giới hạn để kiểm tra cờ hủy thường xuyên
+                done, _ = wait(running, timeout=0.5, return_when=FIRST_COMPLETED)
+                for future in done:
+                    # Bước kết thúc vì bị hủy được báo là hủy, không phải lỗi
+                    if cancelled():
+                        raise RenderCancelled()
+                    name = running.pop(future)
+                    # Ném lại lỗi của bước; các bước chưa chạy bị bỏ
+                    results[name] = future.result()
+                    if on_done is not None:
+                        on_done(name, results[name])
+        except BaseException:
+            # Báo các bước đang chạy dừng lại thay vì chờ chúng chạy hết
+            if stop_event is not None:
+                stop_event.set()
+            raise
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
+        return results
+
+
+def resolve_api_keys(
+    api_key: Optional[str] = None, leonardo_api_key: Optional[str] = None
+):
+    """
+    API key được dùng khi không truyền vào: biến môi trường DEEPSEEK_API_KEY /
+    LEONARDO_API_KEY, sau đó config.py
+
+    Returns:
+        Tuple[str, str]: DeepSeek API key và Leonardo.ai API key
+    """
+    return (
+        api_key or os.environ.get("DEEPSEEK_API_KEY") or config.DEEPSEEK_API_KEY,
+        leonardo_api_key
+        or os.environ.get("LEONARDO_API_KEY")
+        or config.LEONARDO_API_KEY,
+    )
+
+
+class RenderOptions:
+    """Các tùy chọn của một lần tạo video (tương ứng với các ô trên giao diện)"""
+
+    def __init__(
+        self,
+        api_key: Optional[str] = None,
+        leonardo_api_key: Optional[str] = None,
+        translate: bool = False,
+        voice: Optional[str] = None,
+        lang: str = "vi",
+        speed: str = "+0%",
+        auto_images: bool = True,
+        time_per_image_seconds: float = 60,
+        image_count: int = 1,
+        tts_workers: int = SYNTHESIS_WORKERS,
+        encode_workers: int = ENCODE_WORKERS,
+        subtitle_renderer: str = SUBTITLE_RENDERER,
+    ):
+        """
+        Args:
+            api_key (str, optional): DeepSeek API key (mặc định lấy từ biến môi
+                trường DEEPSEEK_API_KEY hoặc config.py)
+            leonardo_api_key (str, optional): Leonardo.ai API key (mặc định lấy từ
+                LEONARDO_API_KEY hoặc config.py)
+            translate (bool, optional): Dịch truyện từ tiếng Trung sang tiếng Việt
+            voice (str, optional): Tên giọng nói/mô hình TTS
+            lang (str, optional): Mã ngôn ngữ của giọng đọc
+            speed (str, optional): Tốc độ đọc theo định dạng "+0%", "-7%"...
+            auto_images (bool, optional): Tính số hình theo thời lượng audio
+            time_per_image_seconds (float, optional): Thời gian cho mỗi hình
+                (chế độ tự động)
+            image_count (int, optional): Số hình cố định (khi auto_images=False)
+            tts_workers (int, optional): Số bản sao mô hình TTS chạy song song
+            encode_workers (int, optional): Số tiến trình ffmpeg mã hóa song song
+                khi video có nhiều hình
+            subtitle_renderer (str, optional): Cách gắn phụ đề ("overlay",
+                "libass" hoặc "precomposed")
+        """
+        self.api_key, self.leonardo_api_key = resolve_api_keys(
+            api_key, leonardo_api_key
+        )
+        self.translate = translate
+        self.voice = voice
+        # Nội dung đã dịch luôn là tiếng Việt
+        self.lang = "vi" if translate else lang
+        self.speed = speed
+        self.auto_images = auto_images
+        self.time_per_image_seconds = time_per_image_seconds
+        self.image_count = image_count
+        self.tts_workers = tts_workers
+        self.encode_workers = encode_workers
+        self.subtitle_renderer = subtitle_renderer
+
+    def to_dict(self) -> Dict:
+        """
+        Các tùy chọn dạng dict để lưu lại (JobStore); không gồm API key, khi
+        dựng lại bằng from_dict key được lấy lại từ biến môi trường/config.py
+        """
+        data = dict(self.__dict__)
+        del data["api_key"], data["leonardo_api_key"]
+        return data
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "RenderOptions":
+        return cls(**data)
+
+
+def _stage_files(name: str, output) -> List[str]:
+    """Các file mà kết quả đã lưu của một bước trỏ tới"""
+    if name == "tts":
+        return [p for p in (output["audio_path"], output["timing_path"]) if p]
+    if name == "images":
+        return list(output)
+    if name in ("subtitle", "video"):
+        return [output]
+    return []
+
+
+def _restore_stages(graph: "StageGraph", saved: Dict) -> Dict:
+    """
+    Chọn các kết quả đã lưu còn dùng được: file vẫn còn và mọi bước phụ thuộc
+    cũng được khôi phục (nếu TTS phải chạy lại thì phụ đề và video cũng vậy)
+    """
+    restored = {}
+    # graph.stages giữ thứ tự thêm vào, các bước phụ thuộc luôn đứng trước
+    for name, (_, deps) in graph.stages.items():
+        if name not in saved or not all(d in restored for d in deps):
+            continue
+        if all(os.path.exists(p) for p in _stage_files(name, saved[name])):
+            restored[name] = saved[name]
+    return restored
+
+
+def render_story(
+    story: str,
+    output_dir: str,
+    options: Optional[RenderOptions] = None,
+    progress: Optional[Callable[[str], None]] = None,
+    cancel_event: Optional[threading.Event] = None,
+    job_store: Optional[JobStore] = None,
+    job_id: Optional[int] = None,
+) -> str:
+    """
+    Tạo video hoàn chỉnh từ nội dung truyện
+
+    Các bước chạy theo đồ thị phụ thuộc (StageGraph): TTS và tạo hình ảnh chạy
+    song song ngay sau bước dịch; ở chế độ tự động, số hình được tính từ thời
+    lượng ước tính (estimate_video_duration) thay vì chờ audio. Khi có job_store,
+    kết quả mỗi bước được lưu lại và lần chạy sau bỏ qua các bước đã xong.
+
+    Args:
+        story (str): Nội dung truyện
+        output_dir (str): Thư mục chứa các file của lần tạo video này
+        options (RenderOptions, optional): Tùy chọn, mặc định RenderOptions()
+        progress (Callable[[str], None], optional): Hàm nhận thông báo tiến độ
+        cancel_event (threading.Event, optional): Đặt cờ để dừng ở bước kế tiếp
+        job_store (JobStore, optional): Nơi lưu kết quả từng bước
+        job_id (int, optional): Mã công việc trong job_store
+
+    Returns:
+        str: Đường dẫn đến video đã tạo
+
+    Raises:
+        RenderCancelled: Khi cancel_event được đặt
+    """
+    options = options or RenderOptions()
+    # Đặt khi bị hủy hoặc một bước lỗi; các bước dài (TTS, ffmpeg) theo dõi cờ
+    # này để dừng ngay thay vì chạy hết
+    stop_event = threading.Event()
+
+    def report(message):
+        if stop_event.is_set() or (cancel_event is not None and cancel_event.is_set()):
+            raise RenderCancelled()
+        logger.info(message)
+        if progress:
+            progress(message)
+
+    base = output_dir
+    os.makedirs(base, exist_ok=True)
+    audio_path = os.path.join(base, "audio.m4a")
+    img_path = os.path.join(base, "image.png")
+    video_path = os.path.join(base, "video.mp4")
+    sub_path = os.path.join(base, "subtitle.ass")
+    timing_path = os.path.join(base, "timings.bin")
+    leonardo_api_key = options.leonardo_api_key
+
+    def translate_stage(results):
+        if not options.translate:
+            return story
+
+        report("Đang dịch từ tiếng Trung sang tiếng Việt...")
+        try:
+            # Save the original Chinese story
+            chinese_path = os.path.join(base, "original_chinese.txt")
+            with open(chinese_path, "w", encoding="utf-8") as f:
+                f.write(story)
+
+            # Translate the story, writing each paragraph as soon as it arrives
+            vietnamese_path = os.path.join(base, "translated_vietnamese.txt")
+            total = sum(1 for line in story.split("\n") if line.strip())
+            translated_paragraphs = []
+            done = 0
+            with open(vietnamese_path, "w", encoding="utf-8") as f:
+                for paragraph in stream_chinese_to_vietnamese(story, options.api_key):
+                    if translated_paragraphs:
+                        f.write("\n")
+                    f.write(paragraph)
+                    f.flush()
+                    translated_paragraphs.append(paragraph)
+                    if paragraph.strip():
+                        done += 1
+                        report(f"Đang dịch... {done}/{total} đoạn")
+            translated = "\n".join(translated_paragraphs)
+        except RenderCancelled:
+            raise
+        except Exception as e:
+            raise Exception(f"Không thể dịch văn bản: {str(e)}")
+
+        report("Đã dịch xong tiếng Trung sang tiếng Việt")
+        return translated
+
+    def tts_stage(results):
+        report(
+            f"Đang tạo giọng nói ({options.voice}, tốc độ: {options.speed}) và tính thời gian..."
+        )
+        path, word_timings = text_to_speech(
+            results["translate"],
+            audio_path,
+            lang=options.lang,
+            timing_file=timing_path,
+            voice=options.voice,
+            rate=options.speed,
+            workers=options.tts_workers,
+            cancel_event=stop_event,
+        )
+        # text_to_speech trả về đường dẫn cả khi tổng hợp thất bại: kiểm tra
+        # file để kết quả lỗi không được lưu như một bước đã xong
+        if not path or not os.path.exists(path):
+            raise Exception("Không thể tạo giọng nói: không có file audio")
+        # Thời lượng audio do bước TTS ghi lại, dùng chung cho các bước sau
+        duration = get_audio_duration(path)
+        if duration <= 0:
+            raise Exception(f"Không thể tạo giọng nói: audio rỗng ({path})")
+        report(f"Đã tạo giọng nói ({duration:.1f} giây)")
+        return {
+            "audio_path": path,
+            "timing_path": timing_path if word_timings else None,
+            "duration": duration,
+        }
+
+    def images_stage(results):
+        text = results["translate"]
+        if options.auto_images:
+            # Số hình tính theo thời lượng ước tính để không phải chờ TTS
+            estimated = estimate_video_duration(text, options.speed)
+            if options.time_per_image_seconds > 0:
+                total_images = max(1, int(estimated / options.time_per_image_seconds))
+            else:
+                report("Thời gian cho mỗi hình không hợp lệ, tạo 1 hình")
+                total_images = 1
+            report(
+                f"Audio ước tính {estimated:.1f} giây, tạo {total_images} hình (mỗi {options.time_per_image_seconds:g} giây)"
+            )
+        else:
+            total_images = options.image_count
+
+        if total_images > 1:
+            report(f"Đang tạo {total_images} hình ảnh cho các phân đoạn truyện...")
+            segments_dir = os.path.join(base, "segment_images")
+            os.makedirs(segments_dir, exist_ok=True)
+            try:
+                from modules.story_segment import process_story_for_images
+
+                # Phân đoạn truyện và tạo hình ảnh
+                image_paths = process_story_for_images(
+                    text,
+                    total_images,
+                    segments_dir,
+                    leonardo_api_key,
+                    cancel_event=stop_event,
+                )
+                # Dừng ở đây nếu bị hủy trong lúc chờ Leonardo.ai
+                report(f"Đã tạo {len(image_paths)} hình ảnh")
+                return image_paths
+            except RenderCancelled:
+                raise
+            except Exception as e:
+                report(f"Lỗi khi tạo hình cho các phân đoạn: {str(e)}")
+                report("Thử tạo một hình đơn...")
+
+        # Tạo một hình duy nhất
+        report("Đang tạo hình ảnh...")
+        generate_image_from_story(
+            text, img_path, leonardo_api_key, cancel_event=stop_event
+        )
+        report("Đã tạo hình ảnh")
+        return [img_path]
+
+    def subtitle_stage(results):
+        # Phụ đề (với dữ liệu timing)
+        report("Đang tạo phụ đề đồng bộ với audio...")
+        timing_file = results["tts"]["timing_path"]
+        word_timings = load_timings(timing_file) if timing_file else None
+        create_subtitle(results["translate"], sub_path, word_timings=word_timings)
+        return sub_path
+
+    def video_stage(results):
+        path = results["tts"]["audio_path"]
+        image_paths = results["images"]
+        if len(image_paths) <= 1:
+            report("Đang tạo video và gắn phụ đề...")
+            create_video(
+                image_paths[0],
+                path,
+                video_path,
+                sub_path,
+                subtitle_renderer=options.subtitle_renderer,
+                cancel_event=stop_event,
+            )
+            return video_path
+
+        report(f"Đang tạo video từ {len(image_paths)} hình ảnh và gắn phụ đề...")
+        try:
+            create_video_with_segments(
+                image_paths,
+                path,
+                video_path,
+                sub_path,
+                workers=options.encode_workers,
+                subtitle_renderer=options.subtitle_renderer,
+                cancel_event=stop_event,
+            )
+        except Exception as e:
+            report(f"Lỗi khi tạo video từ nhiều hình: {str(e)}")
+
+            # Thử lại với một hình duy nhất
+            report("Thử tạo video với một hình đơn...")
+            generate_image_from_story(results["translate"], img_path, leonardo_api_key)
+            create_video(
+                img_path,
+                path,
+                video_path,
+                sub_path,
+                subtitle_renderer=options.subtitle_renderer,
+                cancel_event=stop_event,
+            )
+        return video_path
+
+    # Dịch -> (TTS || hình ảnh) -> phụ đề -> video
+    graph = StageGraph()
+    graph.add("translate", translate_stage)
+    graph.add("tts", tts_stage, deps=["translate"])
+    graph.add("images", images_stage, deps=["translate"])
+    graph.add("subtitle", subtitle_stage, deps=["translate", "tts"])
+    graph.add("video", video_stage, deps=["tts", "images", "subtitle"])
+
+    restored = {}
+    save_stage = None
+    if job_store is not None and job_id is not None:
+        restored = _restore_stages(graph, job_store.load_stages(job_id))
+        if restored:
+            report(
+                f"Tiếp tục công việc, bỏ qua các bước đã xong: {', '.join(restored)}"
+            )
+        if "tts" in restored:
+            # Thời lượng đã biết, không cần chạy lại ffprobe
+            tts_output = restored["tts"]
+            record_media_info(tts_output["audio_path"], tts_output["duration"])
+
+        # Chỉ bước chạy xong không lỗi mới được lưu (StageGraph.run)
+        def save_stage(name, output):
+            job_store.save_stage(job_id, name, output)
+
+    results = graph.run(
+        cancel_event, results=restored, on_done=save_stage, stop_event=stop_event
+    )
+
+    # Hiển thị thông tin thời lượng
+    audio_duration = results["tts"]["duration"]
+    try:
+        video_dur = get_video_duration(video_path)
+        report(
+            f"Đã tạo video ({video_dur:.1f}s) từ audio ({audio_duration:.1f}s): {video_path}"
+        )
+    except RenderCancelled:
+        raise
+    except Exception:
+        pass
+    return results["video"]
+
+
+def run_job(
+    job_store: JobStore,
+    job_id: int,
+    progress: Optional[Callable[[str], None]] = None,
+    cancel_event: Optional[threading.Event] = None,
+    api_key: Optional[str] = None,
+    leonardo_api_key: Optional[str] = None,
+) -> str:
+    """
+    Chạy (hoặc chạy tiếp) một công việc đã lưu trong JobStore và cập nhật trạng
+    thái của nó
+
+    API key không được lưu cùng công việc: truyền vào đây (ví dụ key nhập trên
+    giao diện), nếu không sẽ lấy từ biến môi trường hoặc config.py.
+
+    Công việc được nhận (JobStore.claim_job) trước khi chạy và được gia hạn
+    định kỳ bằng heartbeat, nên một tiến trình khác không chạy lại nó.
+
+    Returns:
+        str: Đường dẫn đến video đã tạo
+
+    Raises:
+        JobAlreadyClaimed: Khi công việc đang chạy ở tiến trình khác
+    """
+    job = job_store.get_job(job_id)
+    if job is None:
+        raise ValueError(f"Không tìm thấy công việc #{job_id}")
+
+    owner = job_owner()
+    if not job_store.claim_job(job_id, owner):
+        raise JobAlreadyClaimed(f"Công việc #{job_id} đang được chạy ở nơi khác")
+
+    finished = threading.Event()
+
+    def keep_alive():
+        while not finished.wait(JOB_HEARTBEAT_SECONDS):
+            if not job_store.heartbeat(job_id, owner):
+                logger.warning(f"Công việc #{job_id} đã bị tiến trình khác nhận lại")
+                return
+
+    threading.Thread(target=keep_alive, daemon=True).start()
+    try:
+        video_path = render_story(
+            job["story"],
+            job["output_dir"],
+            RenderOptions.from_dict(
+                dict(
+                    job["options"],
+                    api_key=api_key,
+                    leonardo_api_key=leonardo_api_key,
+                )
+            ),
+            progress=progress,
+            cancel_event=cancel_event,
+            job_store=job_store,
+            job_id=job_id,
+        )
+    except RenderCancelled:
+        job_store.set_status(job_id, JOB_CANCELLED)
+        raise
+    except Exception as e:
+        job_store.set_status(job_id, JOB_FAILED, str(e))
+        raise
+    finally:
+        finished.set()
+    job_store.set_status(job_id, JOB_DONE)
+    return video_path
+
+
+if __name__ == "__main__":
+    # Thử nghiệm: tạo video từ story1.txt
+    with open("story1.txt", "r", encoding="utf-8") as f:
+        print(render_story(f.read(), os.path.join("output", "pipeline_test")))
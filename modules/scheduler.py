@@ -2,6 +2,8 @@
 # Đặt lịch thực thi tác vụ
 from apscheduler.schedulers.background import BackgroundScheduler
 import datetime
+from modules.job_store import JobStore
+from modules.pipeline import resolve_api_keys, run_job
 
 scheduler = BackgroundScheduler()
 
@@ -9,3 +11,60 @@ def schedule_task(func, run_time, *args, **kwargs):
     scheduler.add_job(func, 'date', run_date=run_time, args=args, kwargs=kwargs)
     if not scheduler.running:
         scheduler.start()
+
+def schedule_job(store: JobStore, job_id, run_time=None, progress=None,
+                 api_key=None, leonardo_api_key=None):
+    """
+    Đặt lịch chạy một công việc đã lưu trong JobStore. Lịch được lưu cùng công
+    việc nên vẫn còn sau khi khởi động lại (xem resume_jobs)
+
+    Args:
+        store (JobStore): Hàng đợi công việc
+        job_id (int): Mã công việc
+        run_time (datetime, optional): Thời điểm chạy, mặc định lấy từ công việc
+            hoặc chạy ngay
+        progress (Callable[[str], None], optional): Hàm nhận thông báo tiến độ
+        api_key (str, optional): DeepSeek API key, mặc định như resolve_api_keys
+        leonardo_api_key (str, optional): Leonardo.ai API key, mặc định như
+            resolve_api_keys
+
+    Raises:
+        ValueError: Khi không có API key nào dùng được
+    """
+    # API key không được lưu cùng công việc: chốt ngay lúc đặt lịch để công
+    # việc chạy với cùng key dù được đặt lịch từ giao diện hay lúc khởi động
+    api_key, leonardo_api_key = resolve_api_keys(api_key, leonardo_api_key)
+    if not api_key or not leonardo_api_key:
+        raise ValueError(f"Thiếu API key, không thể đặt lịch công việc #{job_id}")
+
+    if run_time is not None:
+        store.set_run_at(job_id, run_time.timestamp())
+    else:
+        run_at = store.get_job(job_id)["run_at"]
+        run_time = datetime.datetime.fromtimestamp(run_at) if run_at else None
+
+    # Lịch đã qua (máy tắt lúc đến giờ) thì chạy ngay
+    now = datetime.datetime.now()
+    if run_time is None or run_time < now:
+        run_time = now
+    scheduler.add_job(run_job, 'date', run_date=run_time, args=(store, job_id),
+                      kwargs={'progress': progress, 'api_key': api_key,
+                              'leonardo_api_key': leonardo_api_key},
+                      id=f'render-{job_id}', replace_existing=True)
+    if not scheduler.running:
+        scheduler.start()
+
+def resume_jobs(store: JobStore, progress=None, api_key=None,
+                leonardo_api_key=None):
+    """
+    Đặt lịch lại mọi công việc chưa xong (đang chờ hoặc bị dừng giữa chừng);
+    mỗi công việc chạy tiếp từ bước chưa hoàn thành
+
+    Returns:
+        List[int]: Mã các công việc đã được đặt lịch
+    """
+    job_ids = [job['id'] for job in store.unfinished_jobs()]
+    for job_id in job_ids:
+        schedule_job(store, job_id, progress=progress, api_key=api_key,
+                     leonardo_api_key=leonardo_api_key)
+    return job_ids
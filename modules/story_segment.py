@@ -5,11 +5,13 @@ import json
 import os
 import logging
 import requests
-import time
+import threading
 from typing import List, Dict, Optional
 import textwrap
+from concurrent.futures import ThreadPoolExecutor
 from modules.translate import DeepseekTranslator
-from modules.deepseek import DeepSeek
+from modules.deepseek import DeepSeek, DEEPSEEK_MAX_CONCURRENCY
+from modules.http_client import get_http_client
 
 # Configure more detailed logging for debugging
 logging.basicConfig(
@@ -22,6 +24,23 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Number of segments whose prompts are requested in one DeepSeek call
+PROMPT_BATCH_SIZE = 20
+
+PROMPT_SYSTEM_PROMPT = """cung cấp cho tôi prompt để tạo hình với lenardo.ai với nội dung như sau
+            lưu ý 
+            1. chỉ trả về duy nhất một prompt tốt nhất
+            2. chỉ có duy nhất nội dung prompt
+            3. nội dung phản hồi bằng tiếng anh
+            4. không đưa tên người vào nội dung prompt mà thay bằng chàng trai, cô gái, ông già tương úng với độ tuổi của nhân viên"""
+
+BATCH_PROMPT_SYSTEM_PROMPT = """cung cấp cho tôi prompt để tạo hình với lenardo.ai cho từng đoạn nội dung được đánh số
+            lưu ý 
+            1. mỗi đoạn chỉ có duy nhất một prompt tốt nhất
+            2. chỉ trả về JSON dạng {"prompts": [{"id": <số thứ tự đoạn>, "prompt": "<prompt>"}]}, không có nội dung nào khác
+            3. prompt bằng tiếng anh
+            4. không đưa tên người vào nội dung prompt mà thay bằng chàng trai, cô gái, ông già tương úng với độ tuổi của nhân viên"""
+
 
 class StorySegmenter:
     """
@@ -115,78 +134,159 @@ class StorySegmenter:
             # Return original text if translation fails
             return text
 
-    def generate_prompts(self) -> List[str]:
+    def _segment_summary(self, segment: str) -> str:
         """
-        Generate image prompts for each segment
+        Pick the most descriptive parts of a segment (max 250 characters)
+
+        Args:
+            segment (str): Segment text
 
         Returns:
-            List[str]: List of image prompts
+            str: Short description used as input for the image prompt
         """
-        if not self.segments:
-            self.segment_by_paragraphs()
+        # Remove dialog (text in quotes) as it's less useful for scene description
+        clean_text = re.sub(r'"[^"]*"', "", segment)
+
+        # Extract lines that describe scenes, objects, or characters
+        descriptive_lines = []
+        for line in clean_text.split("\n"):
+            if any(
+                word in line.lower()
+                for word in [
+                    "nhìn",
+                    "mặc",
+                    "ánh",
+                    "màu",
+                    "phát hiện",
+                    "kinh ngạc",
+                    "thấy",
+                    "cảnh",
+                    "hiện ra",
+                ]
+            ):
+                descriptive_lines.append(line)
+
+        # If we didn't find descriptive lines, use the first 2-3 sentences
+        if not descriptive_lines:
+            sentences = re.split(r"[.!?]\s+", clean_text)
+            descriptive_lines = sentences[: min(3, len(sentences))]
+
+        # Create a prompt with key elements
+        prompt_text = " ".join(descriptive_lines)
+
+        # Make the prompt concise (max 250 characters)
+        return textwrap.shorten(prompt_text, width=250, placeholder="...")
+
+    def _generate_single_prompt(self, index: int, summary: str) -> str:
+        """Ask DeepSeek for the prompt of one segment (falls back to the summary)"""
+        try:
+            final_prompt = self.deepseek.chat(
+                prompt=summary, system_prompt=PROMPT_SYSTEM_PROMPT
+            )
+            logger.info(
+                f"Generated prompt for segment {index+1}: {final_prompt[:50]}..."
+            )
+            return final_prompt
+        except Exception as e:
+            logger.error(f"Error generating prompt for segment {index+1}: {str(e)}")
+            return summary  # Fallback to original prompt
 
-        self.prompts = []
+    def _generate_prompt_batch(self, batch: Dict[int, str]) -> Dict[int, str]:
+        """
+        Ask DeepSeek for the prompts of several segments in one JSON request
 
-        for i, segment in enumerate(self.segments):
-            if not segment:
-                # Skip empty segments
-                self.prompts.append("")
-                continue
+        Args:
+            batch (Dict[int, str]): Segment summaries by segment index
 
-            # Extract the most descriptive parts from the segment
-            # Remove dialog (text in quotes) as it's less useful for scene description
-            clean_text = re.sub(r'"[^"]*"', "", segment)
-
-            # Extract lines that describe scenes, objects, or characters
-            descriptive_lines = []
-            for line in clean_text.split("\n"):
-                if any(
-                    word in line.lower()
-                    for word in [
-                        "nhìn",
-                        "mặc",
-                        "ánh",
-                        "màu",
-                        "phát hiện",
-                        "kinh ngạc",
-                        "thấy",
-                        "cảnh",
-                        "hiện ra",
-                    ]
-                ):
-                    descriptive_lines.append(line)
-
-            # If we didn't find descriptive lines, use the first 2-3 sentences
-            if not descriptive_lines:
-                sentences = re.split(r"[.!?]\s+", clean_text)
-                descriptive_lines = sentences[: min(3, len(sentences))]
-
-            # Create a prompt with key elements
-            prompt_text = " ".join(descriptive_lines)
-
-            # Make the prompt concise (max 250 characters)
-            prompt = textwrap.shorten(prompt_text, width=250, placeholder="...")
-            system_prompt = f"""cung cấp cho tôi prompt để tạo hình với lenardo.ai với nội dung như sau
-            lưu ý 
-            1. chỉ trả về duy nhất một prompt tốt nhất
-            2. chỉ có duy nhất nội dung prompt
-            3. nội dung phản hồi bằng tiếng anh
-            4. không đưa tên người vào nội dung prompt mà thay bằng chàng trai, cô gái, ông già tương úng với độ tuổi của nhân viên"""
+        Returns:
+            Dict[int, str]: Prompts by segment index (segments missing from the
+                response are left out)
+        """
+        request = "\n\n".join(
+            f"Đoạn {index + 1}:\n{summary}" for index, summary in batch.items()
+        )
+        try:
+            response = self.deepseek.chat(
+                prompt=request,
+                system_prompt=BATCH_PROMPT_SYSTEM_PROMPT,
+                max_tokens=min(8000, 200 * len(batch) + 200),
+            )
+            # The model sometimes wraps the JSON in a ```json code block
+            response = re.sub(r"^```(?:json)?\s*|\s*```$", "", response.strip())
+            entries = json.loads(response)["prompts"]
+        except Exception as e:
+            logger.error(f"Batched prompt generation failed: {str(e)}")
+            return {}
 
-            # Convert to final prompt using DeepSeek
+        prompts = {}
+        for entry in entries:
             try:
-                final_prompt = self.deepseek.chat(
-                    prompt=prompt, system_prompt=system_prompt
-                )
-                logger.info(
-                    f"Generated prompt for segment {i+1}: {final_prompt[:50]}..."
-                )
-            except Exception as e:
-                logger.error(f"Error generating prompt for segment {i+1}: {str(e)}")
-                final_prompt = prompt  # Fallback to original prompt
+                index = int(entry["id"]) - 1
+                prompt = str(entry["prompt"]).strip()
+            except (KeyError, TypeError, ValueError):
+                continue
+            if index in batch and prompt:
+                prompts[index] = prompt
+        logger.info(f"Generated {len(prompts)}/{len(batch)} prompts in one request")
+        return prompts
+
+    def generate_prompts(
+        self,
+        batch_size: int = PROMPT_BATCH_SIZE,
+        workers: int = DEEPSEEK_MAX_CONCURRENCY,
+    ) -> List[str]:
+        """
+        Generate image prompts for each segment
+
+        Prompts are requested in batches of up to batch_size segments per
+        DeepSeek call (JSON response), batches running concurrently. Segments
+        missing from a batch response get their own request, also concurrently.
+
+        Args:
+            batch_size (int): Segments per request (1 = one request per segment)
+            workers (int): Maximum number of concurrent requests
 
-            self.prompts.append(final_prompt)
+        Returns:
+            List[str]: List of image prompts
+        """
+        if not self.segments:
+            self.segment_by_paragraphs()
 
+        # Empty segments get an empty prompt
+        summaries = {
+            i: self._segment_summary(segment)
+            for i, segment in enumerate(self.segments)
+            if segment
+        }
+        indices = list(summaries)
+
+        prompts = {}
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+            batched = batch_size > 1 and len(indices) > 1
+            if batched:
+                batches = [
+                    {i: summaries[i] for i in indices[start : start + batch_size]}
+                    for start in range(0, len(indices), batch_size)
+                ]
+                for result in executor.map(self._generate_prompt_batch, batches):
+                    prompts.update(result)
+
+            missing = [i for i in indices if i not in prompts]
+            if missing and batched:
+                logger.warning(
+                    f"{len(missing)} segments missing from batched response, requesting them one by one"
+                )
+            for i, prompt in zip(
+                missing,
+                executor.map(
+                    self._generate_single_prompt,
+                    missing,
+                    [summaries[i] for i in missing],
+                ),
+            ):
+                prompts[i] = prompt
+
+        self.prompts = [prompts.get(i, "") for i in range(len(self.segments))]
         return self.prompts
 
     def save_segments_and_prompts(self, output_dir: str) -> str:
@@ -227,14 +327,17 @@ class LeonardoImageGenerator:
     Class to generate images using Leonardo.ai API
     """
 
-    def __init__(self, api_key: str):
+    def __init__(self, api_key: str, cancel_event: Optional[threading.Event] = None):
         """
         Initialize the image generator
 
         Args:
             api_key (str): Leonardo.ai API key
+            cancel_event (threading.Event, optional): When set, status polling
+                and download retries stop early
         """
         self.api_key = api_key
+        self.cancel_event = cancel_event or threading.Event()
         self.base_url = "https://cloud.leonardo.ai/api/rest/v1"
         self.headers = {
             "Authorization": f"Bearer {self.api_key}",
@@ -252,7 +355,7 @@ class LeonardoImageGenerator:
             negative_prompt (str): Negative prompt to avoid certain elements
 
         Returns:
-            str: URL of the generated image, or None if failed
+            str: URL of the generated image, or None if failed or cancelled
         """
         if not prompt:
             logger.warning("Empty prompt, skipping image generation")
@@ -273,7 +376,12 @@ class LeonardoImageGenerator:
 
         try:
             logger.info(f"Creating generation job for prompt: {prompt[:50]}...")
-            response = requests.post(generation_url, json=payload, headers=self.headers)
+            response = get_http_client().post(
+                generation_url,
+                endpoint="leonardo.generations",
+                json=payload,
+                headers=self.headers,
+            )
             response.raise_for_status()
 
             response_data = response.json()
@@ -294,7 +402,11 @@ class LeonardoImageGenerator:
                     f"Checking generation status (attempt {attempts}/{max_attempts})..."
                 )
                 status_url = f"{self.base_url}/generations/{generation_id}"
-                status_response = requests.get(status_url, headers=self.headers)
+                status_response = get_http_client().get(
+                    status_url,
+                    endpoint="leonardo.generation_status",
+                    headers=self.headers,
+                )
                 status_response.raise_for_status()
 
                 status_data = status_response.json()
@@ -321,7 +433,10 @@ class LeonardoImageGenerator:
                     return None
 
                 logger.info(f"Generation status: {status}, waiting...")
-                time.sleep(5)  # Wait 5 seconds before checking again
+                # Wait 5 seconds before checking again
+                if self.cancel_event.wait(5):
+                    logger.info("Image generation cancelled")
+                    return None
 
             logger.error("Exceeded maximum attempts waiting for image generation")
             return None
@@ -333,6 +448,8 @@ class LeonardoImageGenerator:
     def download_image(self, image_url: str, output_path: str) -> bool:
         """
         Download an image from a URL with detailed debugging
+
+        Returns False without retrying further once cancel_event is set.
         """
         try:
             logger.info(f"DEBUG: Attempting to download from URL: {image_url}")
@@ -346,7 +463,9 @@ class LeonardoImageGenerator:
 
             # First, test if URL is accessible
             logger.info("DEBUG: Testing URL accessibility...")
-            test_response = requests.head(image_url, timeout=10)
+            test_response = get_http_client().head(
+                image_url, endpoint="leonardo.image_head", timeout=10
+            )
             logger.info(f"DEBUG: URL HEAD response status: {test_response.status_code}")
             logger.info(
                 f"DEBUG: URL HEAD response headers: {dict(test_response.headers)}"
@@ -356,7 +475,12 @@ class LeonardoImageGenerator:
             max_retries = 3
             for attempt in range(max_retries):
                 try:
-                    response = requests.get(image_url, stream=True, timeout=30)
+                    response = get_http_client().get(
+                        image_url,
+                        endpoint="leonardo.image_download",
+                        stream=True,
+                        timeout=30,
+                    )
                     response.raise_for_status()
 
                     # Check if we received valid image data
@@ -367,7 +491,8 @@ class LeonardoImageGenerator:
                             logger.info(
                                 f"Retrying download (attempt {attempt+1}/{max_retries})..."
                             )
-                            time.sleep(2)
+                            if self.cancel_event.wait(2):
+                                return False
                             continue
                         return False
 
@@ -390,7 +515,8 @@ class LeonardoImageGenerator:
                             logger.info(
                                 f"Retrying download (attempt {attempt+1}/{max_retries})..."
                             )
-                            time.sleep(2)
+                            if self.cancel_event.wait(2):
+                                return False
                             continue
                         return False
 
@@ -400,7 +526,8 @@ class LeonardoImageGenerator:
                     )
                     if attempt < max_retries - 1:
                         logger.info(f"Retrying download in 2 seconds...")
-                        time.sleep(2)
+                        if self.cancel_event.wait(2):
+                            return False
                     else:
                         return False
 
@@ -413,7 +540,11 @@ class LeonardoImageGenerator:
 
 
 def process_story_for_images(
-    story_text: str, num_images: int, output_dir: str, api_key: str
+    story_text: str,
+    num_images: int,
+    output_dir: str,
+    api_key: str,
+    cancel_event: Optional[threading.Event] = None,
 ) -> List[str]:
     """
     Process a story to generate images for each segment
@@ -423,6 +554,8 @@ def process_story_for_images(
         num_images (int): Number of images to generate
         output_dir (str): Directory to save output files
         api_key (str): Leonardo.ai API key
+        cancel_event (threading.Event, optional): When set, Leonardo.ai polling
+            stops early
 
     Returns:
         List[str]: Paths to generated images
@@ -434,7 +567,7 @@ def process_story_for_images(
     # segmenter.save_segments_and_prompts(output_dir)
 
     # # Generate images
-    # image_generator = LeonardoImageGenerator(api_key)
+    # image_generator = LeonardoImageGenerator(api_key, cancel_event)
     image_paths = []
 
     # for i, prompt in enumerate(prompts):
@@ -0,0 +1,614 @@
+# modules/subtitle_render.py
+# Vẽ sẵn phụ đề thành ảnh RGBA để ghép vào video thay cho bộ lọc subtitles (libass)
+import os
+import re
+import time
+import hashlib
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Sequence, Tuple
+import pysubs2
+from PIL import Image, ImageDraw, ImageFont
+
+# Cấu hình logging
+logging.basicConfig(
+    level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+)
+logger = logging.getLogger(__name__)
+
+# Chiều cao khung mặc định của ASS khi file không khai báo PlayResY
+ASS_DEFAULT_PLAY_RES_Y = 288
+
+# Font thử lần lượt khi không tìm thấy font của style (Windows, Linux)
+FALLBACK_FONTS = ["arial.ttf", "DejaVuSans.ttf"]
+FALLBACK_BOLD_FONTS = ["arialbd.ttf", "DejaVuSans-Bold.ttf"]
+
+# Bộ nhớ đệm khung hình đã ghép sẵn (hình nền + phụ đề)
+DEFAULT_FRAME_CACHE_DIR = os.path.join("cache", "frames")
+DEFAULT_FRAME_CACHE_MAX_BYTES = 1024**3  # 1 GB
+# Khung dùng gần đây hơn mức này không bị xóa (tiến trình khác có thể đang mã hóa)
+FRAME_CACHE_EVICT_MIN_AGE = 3600  # giây
+# Khung cuối của danh sách concat được giữ thêm khoảng này: concat demuxer bỏ
+# thời lượng của mục cuối, video được cắt lại đúng thời lượng bằng -t
+PRECOMPOSED_TAIL_SECONDS = 1.0
+
+# Khung hình đang được các lần mã hóa trong tiến trình này dùng
+# (đường dẫn tuyệt đối -> số danh sách concat đang trỏ tới)
+_frames_in_use: Dict[str, int] = {}
+_frame_lists: Dict[str, List[str]] = {}
+_frames_lock = threading.Lock()
+
+_OVERRIDE_BLOCK = re.compile(r"\{[^}]*\}")
+_COLOR_TAG = re.compile(r"\\(1?c|3c)&H([0-9A-Fa-f]+)&?")
+_SIZE_TAG = re.compile(r"\\fs(\d+(?:\.\d+)?)")
+_BOLD_TAG = re.compile(r"\\b([01])")
+
+
+def ass_color_to_rgba(value: str) -> Tuple[int, int, int, int]:
+    """
+    Chuyển màu ASS (&HAABBGGRR, alpha 00 = đục) sang RGBA của Pillow
+
+    Args:
+        value (str): Chuỗi màu, ví dụ "&H00FFFFFF" hoặc "FFFFFF"
+
+    Returns:
+        Tuple[int, int, int, int]: Màu (r, g, b, a)
+    """
+    digits = value.upper().replace("&H", "").replace("&", "").rjust(8, "0")[-8:]
+    alpha, blue, green, red = (int(digits[i : i + 2], 16) for i in range(0, 8, 2))
+    return red, green, blue, 255 - alpha
+
+
+class SubtitleStyle:
+    """Kiểu chữ dùng để vẽ một dòng phụ đề (đơn vị theo khung ASS)"""
+
+    def __init__(
+        self,
+        fontname: str = "Arial",
+        fontsize: float = 28,
+        bold: bool = True,
+        primary: Tuple[int, int, int, int] = (255, 255, 255, 255),
+        outline_color: Tuple[int, int, int, int] = (255, 0, 0, 255),
+        outline: float = 3,
+        margin_v: int = 35,
+    ):
+        self.fontname = fontname
+        self.fontsize = fontsize
+        self.bold = bold
+        self.primary = primary
+        self.outline_color = outline_color
+        self.outline = outline
+        self.margin_v = margin_v
+
+    @classmethod
+    def from_ssa_style(cls, style: pysubs2.SSAStyle) -> "SubtitleStyle":
+        """Tạo từ style của file ASS"""
+
+        def rgba(color):
+            return color.r, color.g, color.b, 255 - color.a
+
+        return cls(
+            fontname=style.fontname,
+            fontsize=style.fontsize,
+            bold=bool(style.bold),
+            primary=rgba(style.primarycolor),
+            outline_color=rgba(style.outlinecolor),
+            outline=style.outline,
+            margin_v=style.marginv,
+        )
+
+    def with_overrides(self, text: str) -> "SubtitleStyle":
+        """
+        Áp dụng các thẻ override ở đầu dòng (\\c, \\3c, \\fs, \\b) như libass
+        """
+        style = SubtitleStyle(**self.__dict__)
+        for block in _OVERRIDE_BLOCK.findall(text):
+            for tag, value in _COLOR_TAG.findall(block):
+                if tag == "3c":
+                    style.outline_color = ass_color_to_rgba(value)[:3] + (
+                        style.outline_color[3],
+                    )
+                else:
+                    style.primary = ass_color_to_rgba(value)[:3] + (style.primary[3],)
+            for value in _SIZE_TAG.findall(block):
+                style.fontsize = float(value)
+            for value in _BOLD_TAG.findall(block):
+                style.bold = value == "1"
+        return style
+
+    def key(self) -> Tuple:
+        """Khóa dùng cho bộ nhớ đệm ảnh"""
+        return tuple(sorted(self.__dict__.items()))
+
+
+class SubtitleEvent:
+    """Một dòng phụ đề đã bỏ thẻ định dạng"""
+
+    def __init__(self, start: float, end: float, text: str, style: SubtitleStyle):
+        self.start = start
+        self.end = end
+        self.text = text
+        self.style = style
+
+
+def load_subtitle_events(
+    subtitle_path: str, style_overrides: Optional[Dict] = None
+) -> Tuple[List[SubtitleEvent], int]:
+    """
+    Đọc các dòng phụ đề từ file ASS
+
+    Args:
+        subtitle_path (str): Đường dẫn đến file phụ đề
+        style_overrides (Dict, optional): Thuộc tính của SubtitleStyle ghi đè lên
+            style trong file (giống force_style của ffmpeg)
+
+    Returns:
+        Tuple[List[SubtitleEvent], int]: Các dòng theo thứ tự thời gian và PlayResY
+    """
+    subs = pysubs2.load(subtitle_path, encoding="utf-8")
+    play_res_y = int(subs.info.get("PlayResY", ASS_DEFAULT_PLAY_RES_Y))
+
+    base_styles = {}
+    events = []
+    for event in subs.events:
+        if event.is_comment or not event.plaintext.strip():
+            continue
+        if event.style not in base_styles:
+            ssa_style = subs.styles.get(event.style) or pysubs2.SSAStyle()
+            style = SubtitleStyle.from_ssa_style(ssa_style)
+            for name, value in (style_overrides or {}).items():
+                setattr(style, name, value)
+            base_styles[event.style] = style
+        events.append(
+            SubtitleEvent(
+                event.start / 1000,
+                event.end / 1000,
+                event.plaintext.strip(),
+                base_styles[event.style].with_overrides(event.text),
+            )
+        )
+    events.sort(key=lambda e: e.start)
+    return events, play_res_y
+
+
+class SubtitleRasterizer:
+    """
+    Vẽ từng dòng phụ đề thành ảnh RGBA trong suốt có kích thước bằng khung video
+
+    Mỗi dòng khác nhau chỉ được vẽ một lần; ảnh được lưu ra đĩa theo mã băm của
+    nội dung và kiểu chữ nên các dòng lặp lại dùng chung một file (không giữ ảnh
+    trong bộ nhớ).
+    """
+
+    def __init__(self, width: int, height: int, play_res_y: int = 288):
+        self.width = width
+        self.height = height
+        # Kích thước trong ASS tính theo PlayResY, phóng theo chiều cao thực
+        self.scale = height / play_res_y
+        self._fonts = {}
+        self._saved = set()
+
+    @property
+    def rendered_count(self) -> int:
+        """Số ảnh phụ đề khác nhau đã lưu"""
+        return len(self._saved)
+
+    def _font(self, style: SubtitleStyle):
+        size = max(1, int(round(style.fontsize * self.scale)))
+        cache_key = (style.fontname, style.bold, size)
+        if cache_key not in self._fonts:
+            candidates = [f"{style.fontname}.ttf"]
+            candidates += FALLBACK_BOLD_FONTS if style.bold else []
+            candidates += FALLBACK_FONTS
+            font = None
+            for name in candidates:
+                try:
+                    font = ImageFont.truetype(name, size)
+                    break
+                except OSError:
+                    continue
+            if font is None:
+                logger.warning(
+                    f"Không tìm thấy font {style.fontname}, dùng font mặc định"
+                )
+                font = ImageFont.load_default()
+            self._fonts[cache_key] = font
+        return self._fonts[cache_key]
+
+    def image_key(self, text: str, style: SubtitleStyle) -> str:
+        payload = repr((text, style.key(), self.width, self.height))
+        return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+    def render(self, text: str, style: SubtitleStyle) -> Image.Image:
+        """
+        Vẽ một dòng phụ đề (canh giữa, phía dưới như Alignment=2)
+
+        Returns:
+            Image.Image: Ảnh RGBA kích thước width x height
+        """
+        image = Image.new("RGBA", (self.width, self.height), (0, 0, 0, 0))
+        draw = ImageDraw.Draw(image)
+        stroke = max(0, int(round(style.outline * self.scale)))
+        draw.multiline_text(
+            (self.width / 2, self.height - style.margin_v * self.scale),
+            text,
+            font=self._font(style),
+            fill=style.primary,
+            anchor="md",
+            align="center",
+            stroke_width=stroke,
+            stroke_fill=style.outline_color,
+        )
+        return image
+
+    def save(self, text: str, style: SubtitleStyle, output_dir: str) -> str:
+        """Vẽ (nếu chưa có) và lưu dòng phụ đề thành PNG, trả về đường dẫn"""
+        key = self.image_key(text, style)
+        path = os.path.join(output_dir, f"sub_{key}.png")
+        if key not in self._saved:
+            if not os.path.exists(path):
+                self.render(text, style).save(path)
+            self._saved.add(key)
+        return path
+
+
+def _concat_path(path: str) -> str:
+    # Đường dẫn tuyệt đối với dấu / để concat demuxer đọc được trên Windows
+    return os.path.abspath(path).replace("\\", "/")
+
+
+def build_overlay_concat(
+    subtitle_path: str,
+    width: int,
+    height: int,
+    output_dir: str,
+    style_overrides: Optional[Dict] = None,
+) -> Optional[str]:
+    """
+    Tạo luồng phụ đề dạng ảnh cho concat demuxer của ffmpeg
+
+    Mỗi dòng phụ đề là một ảnh PNG giữ trong đúng thời lượng của dòng, khoảng
+    trống giữa các dòng dùng ảnh trong suốt. Luồng này được ghép lên video bằng
+    bộ lọc overlay, nên ffmpeg chỉ giải mã vài trăm ảnh thay vì chạy libass trên
+    mọi khung hình.
+
+    Args:
+        subtitle_path (str): Đường dẫn đến file phụ đề (.ass)
+        width (int): Chiều rộng video
+        height (int): Chiều cao video
+        output_dir (str): Thư mục lưu ảnh và file danh sách
+        style_overrides (Dict, optional): Ghi đè kiểu chữ (xem load_subtitle_events)
+
+    Returns:
+        str: Đường dẫn file danh sách concat, hoặc None nếu không có dòng nào
+    """
+    events, play_res_y = load_subtitle_events(subtitle_path, style_overrides)
+    if not events:
+        return None
+
+    os.makedirs(output_dir, exist_ok=True)
+    rasterizer = SubtitleRasterizer(width, height, play_res_y)
+    blank_path = os.path.join(output_dir, "sub_blank.png")
+    Image.new("RGBA", (width, height), (0, 0, 0, 0)).save(blank_path)
+
+    entries = []
+    position = 0.0
+    for event in events:
+        start = max(event.start, position)
+        if event.end <= start:
+            continue
+        if start > position:
+            entries.append((blank_path, start - position))
+        entries.append(
+            (rasterizer.save(event.text, event.style, output_dir), event.end - start)
+        )
+        position = event.end
+    # Sau dòng cuối là ảnh trống (overlay giữ khung cuối cho tới hết video)
+    entries.append((blank_path, 1.0))
+
+    concat_path = os.path.join(output_dir, "subtitles_concat.txt")
+    with open(concat_path, "w", encoding="utf-8") as f:
+        f.write("ffconcat version 1.0\n")
+        for path, duration in entries:
+            f.write(f"file '{_concat_path(path)}'\n")
+            f.write(f"duration {duration:.3f}\n")
+        # Lặp lại file cuối để concat demuxer dùng duration của mục cuối
+        f.write(f"file '{_concat_path(entries[-1][0])}'\n")
+
+    logger.info(
+        f"Đã vẽ {rasterizer.rendered_count} dòng phụ đề khác nhau cho {len(events)} sự kiện"
+    )
+    return concat_path
+
+
+class FrameComposer:
+    """
+    Ghép hình nền với một dòng phụ đề thành khung hình tĩnh hoàn chỉnh
+
+    Khung được lưu trên đĩa theo (mã băm nội dung hình, dòng phụ đề, kiểu chữ,
+    kích thước), nên các lần render lại cùng truyện không phải vẽ lại. Khi thư
+    mục vượt dung lượng cho phép, các khung lâu không dùng nhất bị xóa.
+    """
+
+    def __init__(
+        self,
+        width: int,
+        height: int,
+        play_res_y: int = ASS_DEFAULT_PLAY_RES_Y,
+        cache_dir: str = DEFAULT_FRAME_CACHE_DIR,
+        max_bytes: int = DEFAULT_FRAME_CACHE_MAX_BYTES,
+    ):
+        self.width = width
+        self.height = height
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.rasterizer = SubtitleRasterizer(width, height, play_res_y)
+        os.makedirs(cache_dir, exist_ok=True)
+        self._hashes = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _image_hash(self, image_path: str) -> str:
+        with self._lock:
+            if image_path in self._hashes:
+                return self._hashes[image_path]
+        digest = hashlib.sha1()
+        with open(image_path, "rb") as f:
+            for block in iter(lambda: f.read(1024 * 1024), b""):
+                digest.update(block)
+        with self._lock:
+            self._hashes[image_path] = digest.hexdigest()
+        return self._hashes[image_path]
+
+    def _background(self, image_path: str) -> Image.Image:
+        # Thu nhỏ giữ tỉ lệ rồi đặt giữa nền đen (giống scale + pad của ffmpeg)
+        with Image.open(image_path) as img:
+            img = img.convert("RGBA")
+            ratio = min(self.width / img.width, self.height / img.height)
+            size = (
+                max(1, int(round(img.width * ratio))),
+                max(1, int(round(img.height * ratio))),
+            )
+            if size != img.size:
+                img = img.resize(size, Image.LANCZOS)
+            canvas = Image.new("RGBA", (self.width, self.height), (0, 0, 0, 255))
+            canvas.paste(
+                img, ((self.width - size[0]) // 2, (self.height - size[1]) // 2)
+            )
+        return canvas
+
+    def frame(
+        self,
+        image_path: str,
+        text: Optional[str] = None,
+        style: Optional[SubtitleStyle] = None,
+    ) -> str:
+        """
+        Lấy (hoặc tạo) khung hình của một hình nền với một dòng phụ đề
+
+        Args:
+            image_path (str): Hình nền
+            text (str, optional): Dòng phụ đề, None nếu không có
+            style (SubtitleStyle, optional): Kiểu chữ của dòng phụ đề
+
+        Returns:
+            str: Đường dẫn file PNG của khung hình
+        """
+        payload = repr(
+            (
+                self._image_hash(image_path),
+                text,
+                style.key() if style else None,
+                self.width,
+                self.height,
+            )
+        )
+        key = hashlib.sha1(payload.encode("utf-8")).hexdigest()
+        path = os.path.join(self.cache_dir, key[:2], key + ".png")
+        if os.path.exists(path):
+            os.utime(path)
+            with self._lock:
+                self.hits += 1
+            return path
+
+        frame = self._background(image_path)
+        if text:
+            frame.alpha_composite(self.rasterizer.render(text, style))
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = path + f".{threading.get_ident()}.tmp"
+        # Nén nhẹ: ghi nhanh, ffmpeg chỉ đọc mỗi khung một lần
+        frame.convert("RGB").save(tmp_path, format="PNG", compress_level=1)
+        os.replace(tmp_path, path)
+        with self._lock:
+            self.misses += 1
+        return path
+
+    def evict(self):
+        """Xóa các khung lâu không dùng nhất khi vượt dung lượng cho phép"""
+        evict_frame_cache(self.cache_dir, self.max_bytes)
+
+
+def evict_frame_cache(
+    cache_dir: str = DEFAULT_FRAME_CACHE_DIR,
+    max_bytes: int = DEFAULT_FRAME_CACHE_MAX_BYTES,
+):
+    """
+    Xóa các khung lâu không dùng nhất khi thư mục vượt dung lượng cho phép
+
+    Không bao giờ xóa khung đang nằm trong một danh sách concat chưa mã hóa
+    xong, hoặc khung vừa được dùng trong FRAME_CACHE_EVICT_MIN_AGE giây (nên bộ
+    nhớ đệm có thể tạm thời vượt giới hạn khi đang render video dài).
+    """
+    with _frames_lock:
+        in_use = set(_frames_in_use)
+    recent = time.time() - FRAME_CACHE_EVICT_MIN_AGE
+    files = []
+    for root, _, names in os.walk(cache_dir):
+        for name in names:
+            if name.endswith(".png"):
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                files.append((stat.st_mtime, stat.st_size, path))
+    total = sum(size for _, size, _ in files)
+    for mtime, size, path in sorted(files):
+        if total <= max_bytes or mtime > recent:
+            break
+        if os.path.abspath(path) in in_use:
+            continue
+        try:
+            os.remove(path)
+            total -= size
+        except OSError:
+            pass
+
+
+def release_precomposed_frames(
+    concat_path: str,
+    cache_dir: str = DEFAULT_FRAME_CACHE_DIR,
+    max_bytes: int = DEFAULT_FRAME_CACHE_MAX_BYTES,
+):
+    """
+    Gọi sau khi ffmpeg đã đọc xong danh sách concat của build_precomposed_concat:
+    bỏ đánh dấu đang dùng cho các khung của nó rồi dọn bộ nhớ đệm
+    """
+    with _frames_lock:
+        _unmark_frames(concat_path)
+    evict_frame_cache(cache_dir, max_bytes)
+
+
+def _unmark_frames(concat_path: str):
+    """Bỏ đánh dấu đang dùng các khung của một danh sách (gọi khi giữ _frames_lock)"""
+    for path in _frame_lists.pop(concat_path, []):
+        _frames_in_use[path] -= 1
+        if not _frames_in_use[path]:
+            del _frames_in_use[path]
+
+
+def build_precomposed_concat(
+    image_paths: Sequence[str],
+    durations: Sequence[float],
+    subtitle_path: Optional[str],
+    width: int,
+    height: int,
+    output_dir: str,
+    style_overrides: Optional[Dict] = None,
+    workers: Optional[int] = None,
+    cache_dir: str = DEFAULT_FRAME_CACHE_DIR,
+) -> Tuple[str, List[float]]:
+    """
+    Biểu diễn cả video thành danh sách (khung hình tĩnh, thời lượng)
+
+    Hình chỉ thay đổi khi đổi hình nền hoặc đổi dòng phụ đề, nên ranh giới của
+    các đoạn hình và các dòng phụ đề được gộp lại thành các khoảng; mỗi khoảng
+    là một khung được ghép sẵn bằng Pillow (song song, có bộ nhớ đệm).
+
+    Args:
+        image_paths (Sequence[str]): Hình nền theo thứ tự
+        durations (Sequence[float]): Thời lượng của từng hình nền (giây)
+        subtitle_path (str, optional): File phụ đề (.ass)
+        width (int): Chiều rộng video
+        height (int): Chiều cao video
+        output_dir (str): Thư mục lưu file danh sách concat
+        style_overrides (Dict, optional): Ghi đè kiểu chữ (xem load_subtitle_events)
+        workers (int, optional): Số luồng ghép khung, mặc định theo số CPU
+        cache_dir (str, optional): Thư mục bộ nhớ đệm khung hình
+
+    Returns:
+        Tuple[str, List[float]]: File danh sách concat và thời điểm đổi hình nền
+
+    Danh sách dài hơn tổng durations PRECOMPOSED_TAIL_SECONDS giây, người dùng
+    cắt lại bằng "-t". Các khung được đánh dấu đang dùng (không bị xóa khỏi bộ nhớ đệm); gọi
+    release_precomposed_frames(concat_path) sau khi mã hóa xong.
+    """
+    events, play_res_y = [], ASS_DEFAULT_PLAY_RES_Y
+    if subtitle_path and os.path.exists(subtitle_path):
+        events, play_res_y = load_subtitle_events(subtitle_path, style_overrides)
+
+    # Ranh giới các đoạn hình nền (tính bằng ms để tránh sai số cộng dồn)
+    segment_ends = []
+    position = 0
+    for duration in durations:
+        position += int(round(duration * 1000))
+        segment_ends.append(position)
+    total = segment_ends[-1]
+
+    cuts = {0, total}
+    cuts.update(segment_ends)
+    for event in events:
+        cuts.add(min(total, int(round(event.start * 1000))))
+        cuts.add(min(total, int(round(event.end * 1000))))
+    cuts = sorted(cuts)
+
+    # Mỗi khoảng: (chỉ số hình nền, chỉ số dòng phụ đề hoặc None, thời lượng ms)
+    intervals = []
+    segment = 0
+    event_index = 0
+    for start, end in zip(cuts[:-1], cuts[1:]):
+        while segment_ends[segment] <= start:
+            segment += 1
+        while event_index < len(events) and events[event_index].end * 1000 <= start:
+            event_index += 1
+        line = None
+        if (
+            event_index < len(events)
+            and events[event_index].start * 1000 <= start
+            and events[event_index].end * 1000 >= end
+        ):
+            line = event_index
+        text = events[line].text if line is not None else None
+        if intervals and intervals[-1][0] == segment and intervals[-1][3] == text:
+            intervals[-1][2] += end - start
+        else:
+            intervals.append([segment, line, end - start, text])
+
+    composer = FrameComposer(width, height, play_res_y, cache_dir)
+
+    def compose(interval):
+        segment, line, _, text = interval
+        style = events[line].style if line is not None else None
+        return composer.frame(image_paths[segment], text, style)
+
+    with ThreadPoolExecutor(max_workers=workers or os.cpu_count() or 1) as executor:
+        frame_paths = list(executor.map(compose, intervals))
+    logger.info(
+        f"Đã ghép {len(intervals)} khung hình ({composer.hits} từ bộ nhớ đệm, "
+        f"{composer.misses} khung mới)"
+    )
+
+    os.makedirs(output_dir, exist_ok=True)
+    concat_path = os.path.join(output_dir, "frames_concat.txt")
+    # Giữ các khung này cho tới khi release_precomposed_frames được gọi
+    with _frames_lock:
+        _unmark_frames(concat_path)
+        used = sorted({os.path.abspath(p) for p in frame_paths})
+        for path in used:
+            _frames_in_use[path] = _frames_in_use.get(path, 0) + 1
+        _frame_lists[concat_path] = used
+    with open(concat_path, "w", encoding="utf-8") as f:
+        f.write("ffconcat version 1.0\n")
+        for frame_path, interval in zip(frame_paths, intervals):
+            f.write(f"file '{_concat_path(frame_path)}'\n")
+            f.write(f"duration {interval[2] / 1000:.3f}\n")
+        # Lặp lại file cuối (giữ thêm PRECOMPOSED_TAIL_SECONDS) để khung cuối
+        # kéo dài tới hết audio thay vì bị cắt
+        f.write(f"file '{_concat_path(frame_paths[-1])}'\n")
+        f.write(f"duration {PRECOMPOSED_TAIL_SECONDS:.3f}\n")
+        f.write(f"file '{_concat_path(frame_paths[-1])}'\n")
+
+    image_changes = [end / 1000 for end in segment_ends[:-1]]
+    return concat_path, image_changes
+
+
+if __name__ == "__main__":
+    import sys
+
+    # Ví dụ: python -m modules.subtitle_render output/subtitle.ass 1280 720
+    path = sys.argv[1] if len(sys.argv) > 1 else "output/subtitle.ass"
+    w = int(sys.argv[2]) if len(sys.argv) > 2 else 1280
+    h = int(sys.argv[3]) if len(sys.argv) > 3 else 720
+    print(build_overlay_concat(path, w, h, "output/subtitle_frames"))
@@ -0,0 +1,227 @@
+# modules/timings.py
+# Lưu trữ timing từng từ dạng cột (mảng float32 + bảng từ dùng chung)
+import os
+import sys
+import json
+import struct
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Union
+import numpy as np
+
+# Định dạng file nhị phân:
+#   header (24 byte): magic(8) | số từ (uint32) | số từ khác nhau (uint32) | số byte bảng từ (uint64)
+#   starts float32[n] | ends float32[n] | word_ids uint32[n]
+#   offsets uint32[số từ khác nhau + 1] | bảng từ utf-8
+TIMINGS_MAGIC = b"GHMWT01\0"
+_HEADER = struct.Struct("<8sIIQ")
+
+
+class WordTimings:
+    """
+    Timing của các từ lưu theo cột: start/end là mảng float32, từ được lưu một lần
+    trong bảng từ dùng chung và tham chiếu bằng chỉ số uint32
+
+    Vẫn dùng được như list các dict {"word", "start", "end"} (len, index, lặp),
+    nên các hàm cũ như create_subtitle không cần thay đổi.
+    """
+
+    def __init__(
+        self,
+        word_table: Optional[List[str]] = None,
+        word_ids: Optional[np.ndarray] = None,
+        starts: Optional[np.ndarray] = None,
+        ends: Optional[np.ndarray] = None,
+    ):
+        self.word_table = list(word_table or [])
+        self._word_index = {word: i for i, word in enumerate(self.word_table)}
+        self._word_ids = np.asarray(
+            word_ids if word_ids is not None else [], dtype=np.uint32
+        )
+        self._starts = np.asarray(
+            starts if starts is not None else [], dtype=np.float32
+        )
+        self._ends = np.asarray(ends if ends is not None else [], dtype=np.float32)
+        # Các đoạn được thêm vào sau, chỉ ghép thành mảng khi cần đọc
+        self._pending = []
+
+    @classmethod
+    def from_dicts(cls, timings: Iterable[Dict]) -> "WordTimings":
+        """Tạo từ danh sách dict {"word", "start", "end"}"""
+        result = cls()
+        timings = list(timings)
+        result.append_words(
+            [t["word"] for t in timings],
+            [t["start"] for t in timings],
+            [t["end"] for t in timings],
+        )
+        return result
+
+    def _intern(self, word: str) -> int:
+        index = self._word_index.get(word)
+        if index is None:
+            index = len(self.word_table)
+            self.word_table.append(sys.intern(word))
+            self._word_index[word] = index
+        return index
+
+    def append_words(
+        self,
+        words: Sequence[str],
+        starts: Sequence[float],
+        ends: Sequence[float],
+    ):
+        """Thêm một nhóm từ (thường là một câu) vào cuối"""
+        if not len(words):
+            return
+        ids = np.fromiter((self._intern(w) for w in words), np.uint32, len(words))
+        self._pending.append(
+            (
+                ids,
+                np.asarray(starts, dtype=np.float32),
+                np.asarray(ends, dtype=np.float32),
+            )
+        )
+
+    def extend(self, other: Union["WordTimings", Iterable[Dict]]):
+        """Nối thêm timing từ một WordTimings khác hoặc danh sách dict"""
+        if not isinstance(other, WordTimings):
+            other = WordTimings.from_dicts(other)
+        self.append_words(other.words, other.starts, other.ends)
+
+    def _consolidate(self):
+        if not self._pending:
+            return
+        ids, starts, ends = zip(*self._pending)
+        self._word_ids = np.concatenate([self._word_ids, *ids])
+        self._starts = np.concatenate([self._starts, *starts])
+        self._ends = np.concatenate([self._ends, *ends])
+        self._pending = []
+
+    @property
+    def starts(self) -> np.ndarray:
+        self._consolidate()
+        return self._starts
+
+    @property
+    def ends(self) -> np.ndarray:
+        self._consolidate()
+        return self._ends
+
+    @property
+    def word_ids(self) -> np.ndarray:
+        self._consolidate()
+        return self._word_ids
+
+    @property
+    def words(self) -> List[str]:
+        table = self.word_table
+        return [table[i] for i in self.word_ids]
+
+    @property
+    def duration(self) -> float:
+        """Thời điểm kết thúc của từ cuối cùng"""
+        return float(self.ends[-1]) if len(self) else 0.0
+
+    def __len__(self) -> int:
+        return len(self._word_ids) + sum(len(chunk[0]) for chunk in self._pending)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return WordTimings(
+                self.word_table,
+                self.word_ids[index],
+                self.starts[index],
+                self.ends[index],
+            )
+        return {
+            "word": self.word_table[self.word_ids[index]],
+            "start": float(self.starts[index]),
+            "end": float(self.ends[index]),
+        }
+
+    def __iter__(self) -> Iterator[Dict]:
+        table = self.word_table
+        for word_id, start, end in zip(
+            self.word_ids.tolist(), self.starts.tolist(), self.ends.tolist()
+        ):
+            yield {"word": table[word_id], "start": start, "end": end}
+
+    def to_dicts(self) -> List[Dict]:
+        """Chuyển về danh sách dict như định dạng cũ"""
+        return list(self)
+
+    def save(self, path: str):
+        """Lưu ra file nhị phân (xem TIMINGS_MAGIC) để tải lại bằng mmap"""
+        encoded = [word.encode("utf-8") for word in self.word_table]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.uint32)
+        offsets[1:] = np.cumsum([len(e) for e in encoded])
+        table_bytes = b"".join(encoded)
+
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(
+                _HEADER.pack(TIMINGS_MAGIC, len(self), len(encoded), len(table_bytes))
+            )
+            f.write(self.starts.astype("<f4").tobytes())
+            f.write(self.ends.astype("<f4").tobytes())
+            f.write(self.word_ids.astype("<u4").tobytes())
+            f.write(offsets.astype("<u4").tobytes())
+            f.write(table_bytes)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str, mmap: bool = True) -> "WordTimings":
+        """
+        Tải file nhị phân; với mmap=True các mảng start/end/word_ids được ánh xạ
+        trực tiếp từ file mà không đọc toàn bộ vào bộ nhớ
+        """
+        with open(path, "rb") as f:
+            magic, count, table_count, table_size = _HEADER.unpack(f.read(_HEADER.size))
+            if magic != TIMINGS_MAGIC:
+                raise ValueError(f"Không phải file timing hợp lệ: {path}")
+            f.seek(_HEADER.size + count * 12)
+            offsets = np.frombuffer(f.read((table_count + 1) * 4), dtype="<u4")
+            table_bytes = f.read(table_size)
+
+        word_table = [
+            table_bytes[offsets[i] : offsets[i + 1]].decode("utf-8")
+            for i in range(table_count)
+        ]
+
+        def column(dtype, index):
+            offset = _HEADER.size + index * count * 4
+            if not count:
+                return np.zeros(0, dtype=dtype)
+            if mmap:
+                return np.memmap(
+                    path, dtype=dtype, mode="r", offset=offset, shape=(count,)
+                )
+            with open(path, "rb") as f:
+                f.seek(offset)
+                return np.frombuffer(f.read(count * 4), dtype=dtype)
+
+        return cls(word_table, column("<u4", 2), column("<f4", 0), column("<f4", 1))
+
+
+def save_timings(timings: Union[WordTimings, List[Dict]], path: str):
+    """
+    Lưu timing ra file: .json giữ định dạng cũ, các phần mở rộng khác dùng
+    định dạng nhị phân của WordTimings
+    """
+    if path.lower().endswith(".json"):
+        if isinstance(timings, WordTimings):
+            timings = timings.to_dicts()
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(timings, f, ensure_ascii=False)
+        return
+
+    if not isinstance(timings, WordTimings):
+        timings = WordTimings.from_dicts(timings)
+    timings.save(path)
+
+
+def load_timings(path: str, mmap: bool = True) -> WordTimings:
+    """Tải timing từ file .json (định dạng cũ) hoặc file nhị phân"""
+    if path.lower().endswith(".json"):
+        with open(path, "r", encoding="utf-8") as f:
+            return WordTimings.from_dicts(json.load(f))
+    return WordTimings.load(path, mmap=mmap)
@@ -5,7 +5,12 @@ import json
 import time
 import logging
 import os
-from modules.deepseek import DeepSeek
+import re
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from modules.deepseek import DeepSeek, DEEPSEEK_MAX_CONCURRENCY
+from modules.translation_memory import get_translation_memory
 
 # Configure logging
 logging.basicConfig(
@@ -13,13 +18,27 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Paragraph marker used in chunk prompts, e.g. "[3] ..."
+PARAGRAPH_MARKER = re.compile(r"^\s*\[(\d+)\]\s*(.*)$")
+
 
 class DeepseekTranslator:
     """Class to handle translation using Deepseek API"""
 
-    def __init__(self, api_key=None):
-        """Initialize the translator with a DeepSeek instance"""
+    def __init__(self, api_key=None, memory=None):
+        """
+        Initialize the translator with a DeepSeek instance
+
+        Args:
+            api_key (str, optional): Deepseek API key
+            memory (TranslationMemory, optional): Paragraph translation memory
+                (default: the shared one, False disables it)
+        """
         self.deepseek = DeepSeek(api_key)
+        self.temperature = 0.1
+        if memory is None:
+            memory = get_translation_memory()
+        self.memory = memory or None
 
     def translate(
         self, text, source_lang="Chinese", target_lang="Vietnamese", retries=3, delay=2
@@ -41,14 +60,115 @@ class DeepseekTranslator:
             logger.warning("Empty text provided for translation")
             return ""
 
-        # Prepare the prompt for translation
-        prompt = f"Translate the following {source_lang} text to {target_lang}. Return only the translated text without any explanation or additional comments:\n\n{text}"
-
-        # Use the DeepSeek chat method
+        # Use the DeepSeek chat method (the instructions are part of the prompt)
         return self.deepseek.chat(
-            prompt, temperature=0.1, max_tokens=4000, retries=retries, delay=delay
+            None,
+            self._translation_prompt(text, source_lang, target_lang),
+            temperature=self.temperature,
+            max_tokens=4000,
+            retries=retries,
+            delay=delay,
         )
 
+    def _translation_prompt(self, text, source_lang, target_lang):
+        return f"Translate the following {source_lang} text to {target_lang}. Keep the original line breaks. Return only the translated text without any explanation or additional comments:\n\n{text}"
+
+    def _chunk_prompt(self, group, source_lang, target_lang):
+        """Prompt for a chunk, each paragraph prefixed with its marker"""
+        text = "\n".join(f"[{k}] {para.strip()}" for k, para in enumerate(group, 1))
+        return (
+            f"Translate the following {source_lang} text to {target_lang}. "
+            "Each paragraph starts with a marker such as [3]: translate every "
+            "paragraph on its own line, starting with the same marker, and do not "
+            "merge or split paragraphs. Return only the translated text without "
+            f"any explanation or additional comments:\n\n{text}"
+        )
+
+    @staticmethod
+    def _iter_lines(pieces, stop):
+        """Turn streamed pieces into complete, non-empty lines"""
+        buffer = ""
+        for piece in pieces:
+            if stop.is_set():
+                return
+            buffer += piece
+            *complete, buffer = buffer.split("\n")
+            for line in complete:
+                if line.strip():
+                    yield line
+        if buffer.strip():
+            yield buffer
+
+    @staticmethod
+    def _marked_paragraphs(lines, count, truncated=None):
+        """
+        Map the lines of a marked chunk translation back to its paragraphs
+
+        Yields exactly one (translation, clean) pair per paragraph, in order.
+        A paragraph is yielded once the next marker arrives (or the response
+        ends). Lines without a valid marker continue the current paragraph. A
+        paragraph whose marker is missing (merged into the previous one) gets
+        None, and so does the last paragraph when `truncated()` reports that
+        the response was cut off. `clean` is True only when the paragraph is
+        known to contain exactly its own translation.
+        """
+        current = 0
+        parts = []
+        clean = True
+        for line in lines:
+            match = PARAGRAPH_MARKER.match(line)
+            number = int(match.group(1)) if match else None
+            if number is None or number <= current or number > count:
+                if current == 0:
+                    # Text before the first marker: cannot tell where it belongs
+                    clean = False
+                    continue
+                parts.append(line.strip())
+                continue
+            if current:
+                # Skipped markers mean the following paragraphs were merged in
+                yield " ".join(parts) or None, clean and bool(
+                    parts
+                ) and number == current + 1
+            for _ in range(current + 1, number):
+                yield None, False
+            # Text before the first marker also taints the first paragraph
+            clean = clean if current == 0 else True
+            current = number
+            parts = [match.group(2).strip()] if match.group(2).strip() else []
+        if current:
+            if truncated is not None and truncated():
+                # Cut off by max_tokens: the paragraph may be incomplete
+                yield None, False
+            else:
+                yield " ".join(parts) or None, (
+                    clean and bool(parts) and current == count
+                )
+        for _ in range(current + 1, count + 1):
+            yield None, False
+
+    def _split_into_chunks(self, paragraphs, chunk_size):
+        """Group paragraphs into chunks of roughly chunk_size characters"""
+        chunks = []
+        current_chunk = []
+        current_length = 0
+
+        for para in paragraphs:
+            if current_length + len(para) > chunk_size and current_chunk:
+                # If adding this paragraph exceeds chunk size, save current chunk
+                chunks.append(current_chunk)
+                current_chunk = [para]
+                current_length = len(para)
+            else:
+                # Add paragraph to current chunk
+                current_chunk.append(para)
+                current_length += len(para)
+
+        # Add the last chunk if it exists
+        if current_chunk:
+            chunks.append(current_chunk)
+        return chunks
+
     def translate_long_text(
         self,
         text,
@@ -57,6 +177,8 @@ class DeepseekTranslator:
         chunk_size=1500,
         retries=3,
         delay=2,
+        workers=DEEPSEEK_MAX_CONCURRENCY,
+        chunk_retries=2,
     ):
         """
         Translate long text by breaking it into manageable chunks
@@ -68,58 +190,189 @@ class DeepseekTranslator:
             chunk_size (int): Approximate size of each chunk in characters
             retries (int): Number of retries for API calls
             delay (int): Delay between retries
+            workers (int): Maximum number of chunks translated at the same time
+            chunk_retries (int): Extra attempts for a chunk whose API calls failed
 
         Returns:
             str: Complete translated text
         """
-        if not text or not text.strip():
-            return ""
+        return "\n".join(
+            self.iter_translation(
+                text,
+                source_lang,
+                target_lang,
+                chunk_size,
+                retries,
+                delay,
+                workers,
+                chunk_retries,
+            )
+        )
+
+    def iter_translation(
+        self,
+        text,
+        source_lang="Chinese",
+        target_lang="Vietnamese",
+        chunk_size=1500,
+        retries=3,
+        delay=2,
+        workers=DEEPSEEK_MAX_CONCURRENCY,
+        chunk_retries=2,
+    ):
+        """
+        Translate long text and yield the translated paragraphs, in order, as
+        soon as each one is available
 
-        # If text is short enough, translate it directly
-        if len(text) <= chunk_size:
-            return self.translate(text, source_lang, target_lang, retries, delay)
+        Each paragraph is first looked up in the translation memory; only the
+        paragraphs that are not there yet are chunked and sent to the API, and
+        their translations are stored for the next run. Chunks are translated
+        concurrently (at most `workers` requests in flight, request rate limited
+        by deepseek.rate_limiter) with streamed responses, so the first
+        paragraphs come out while the rest is still being generated.
 
-        logger.info(
-            f"Text length ({len(text)} chars) exceeds chunk size. Breaking into chunks."
-        )
+        Chunk paragraphs are sent with markers ([1], [2]...) so translations map
+        back to their paragraphs even when the model merges or splits lines;
+        only paragraphs that map cleanly are stored in the memory or reused
+        for repeated paragraphs. Paragraphs the response has no translation
+        for (markers dropped, response cut off) are translated on their own. A
+        chunk whose stream fails, even midway, is retried on its own and
+        resumes after the paragraphs already yielded.
 
-        # Split text into paragraphs
-        paragraphs = text.split("\n")
-        chunks = []
-        current_chunk = []
-        current_length = 0
+        Args: see translate_long_text
 
-        # Group paragraphs into chunks of appropriate size
-        for para in paragraphs:
-            if current_length + len(para) > chunk_size and current_chunk:
-                # If adding this paragraph exceeds chunk size, save current chunk
-                chunks.append("\n".join(current_chunk))
-                current_chunk = [para]
-                current_length = len(para)
-            else:
-                # Add paragraph to current chunk
-                current_chunk.append(para)
-                current_length += len(para)
+        Yields:
+            str: Translated paragraphs (empty paragraphs are kept as they are)
+        """
+        if not text or not text.strip():
+            return
 
-        # Add the last chunk if it exists
-        if current_chunk:
-            chunks.append("\n".join(current_chunk))
-
-        # Translate each chunk
-        translated_chunks = []
-        for i, chunk in enumerate(chunks):
-            logger.info(f"Translating chunk {i+1}/{len(chunks)} ({len(chunk)} chars)")
-            translated_chunk = self.translate(
-                chunk, source_lang, target_lang, retries, delay
+        paragraphs = text.split("\n")
+        memory_key = (source_lang, target_lang, self.deepseek.model, self.temperature)
+        known = {}
+        if self.memory is not None:
+            known = self.memory.lookup(
+                [p for p in paragraphs if p.strip()], *memory_key
+            )
+
+        # Paragraphs still to translate, each sent once even if it repeats
+        missing = list(
+            dict.fromkeys(p for p in paragraphs if p.strip() and p not in known)
+        )
+        logger.info(
+            f"{len(known)} paragraphs found in translation memory, "
+            f"{len(missing)} to translate"
+        )
+        if len(text) > chunk_size:
+            logger.info(
+                f"Text length ({len(text)} chars) exceeds chunk size. Breaking into chunks."
             )
-            translated_chunks.append(translated_chunk)
+        chunks = self._split_into_chunks(missing, chunk_size)
+        chunk_of = {para: index for index, group in enumerate(chunks) for para in group}
+
+        # Each chunk streams one (translation, clean) pair per paragraph into
+        # its own queue, in paragraph order
+        queues = [queue.Queue() for _ in chunks]
+        stop = threading.Event()
 
-            # Add delay between chunk translations to avoid rate limiting
-            if i < len(chunks) - 1:
-                time.sleep(delay)
+        def translate_chunk(index):
+            group = chunks[index]
+            prompt = self._chunk_prompt(group, source_lang, target_lang)
+            emitted = 0
+            for attempt in range(chunk_retries + 1):
+                if stop.is_set():
+                    return
+                logger.info(
+                    f"Translating chunk {index+1}/{len(chunks)} ({len(prompt)} chars)"
+                )
+                try:
+                    finish = []
+                    pieces = self.deepseek.chat_stream(
+                        None,
+                        prompt,
+                        temperature=self.temperature,
+                        max_tokens=4000,
+                        retries=retries,
+                        delay=delay,
+                        stop_event=stop,
+                        on_finish=finish.append,
+                    )
+                    lines = self._iter_lines(pieces, stop)
+                    items = self._marked_paragraphs(
+                        lines, len(group), lambda: "length" in finish
+                    )
+                    for k, item in enumerate(items, 1):
+                        # After a dropped stream, skip the paragraphs already
+                        # handed out (the markers keep the retry in sync)
+                        if k > emitted:
+                            queues[index].put(item)
+                            emitted = k
+                    return
+                except Exception as e:
+                    if attempt == chunk_retries:
+                        error = Exception(
+                            f"Failed to translate chunk {index+1}/{len(chunks)}: {e}"
+                        )
+                        queues[index].put(error)
+                        raise error
+                    wait = delay * 2 ** (attempt + 1)
+                    logger.warning(
+                        f"Chunk {index+1} failed after {emitted}/{len(group)} "
+                        f"paragraphs ({e}), retrying in {wait} seconds..."
+                    )
+                    if stop.wait(wait):
+                        return
 
-        # Join the translated chunks
-        return "\n".join(translated_chunks)
+        executor = ThreadPoolExecutor(max_workers=max(1, workers))
+        translated = dict(known)
+        # Paragraphs whose translation may be reused for repeats and stored
+        reusable = set(known)
+        learned = {}
+        try:
+            for i in range(len(chunks)):
+                executor.submit(translate_chunk, i)
+            for para in paragraphs:
+                if not para.strip():
+                    yield para
+                    continue
+                if para in translated and para not in reusable:
+                    # Repeat of a paragraph that came back merged with another:
+                    # translate it on its own instead of reusing that text
+                    translated[para] = self.translate(
+                        para.strip(), source_lang, target_lang, retries, delay
+                    )
+                    reusable.add(para)
+                    learned[para] = translated[para]
+                elif para not in translated:
+                    item = queues[chunk_of[para]].get()
+                    if isinstance(item, Exception):
+                        raise item
+                    translated[para], clean = item
+                    if translated[para] is None:
+                        logger.warning(
+                            "No translation in the chunk response for a "
+                            "paragraph, translating it on its own"
+                        )
+                        translated[para] = self.translate(
+                            para.strip(), source_lang, target_lang, retries, delay
+                        )
+                        if not translated[para]:
+                            raise Exception(
+                                f"Failed to translate paragraph: {para.strip()[:50]}"
+                            )
+                        clean = True
+                    if clean:
+                        reusable.add(para)
+                        learned[para] = translated[para]
+                yield translated[para]
+        finally:
+            # Also stops the chunks still running if the caller gave up early;
+            # do not wait for them, a request may take up to CHAT_TIMEOUT
+            stop.set()
+            executor.shutdown(wait=False, cancel_futures=True)
+            # Only paragraphs known to be aligned with their translation
+            if self.memory is not None and learned:
+                self.memory.store(learned, *memory_key)
 
 
 def translate_chinese_to_vietnamese(text, api_key=None):
@@ -137,6 +390,22 @@ def translate_chinese_to_vietnamese(text, api_key=None):
     return translator.translate_long_text(text)
 
 
+def stream_chinese_to_vietnamese(text, api_key=None):
+    """
+    Like translate_chinese_to_vietnamese, but yields the translated paragraphs
+    as soon as they are available
+
+    Args:
+        text (str): The Chinese text to translate
+        api_key (str, optional): Deepseek API key
+
+    Yields:
+        str: Translated paragraphs, in order
+    """
+    translator = DeepseekTranslator(api_key)
+    yield from translator.iter_translation(text)
+
+
 # For testing the module
 if __name__ == "__main__":
     # Example usage
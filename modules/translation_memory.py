@@ -0,0 +1,126 @@
+# modules/translation_memory.py
+# Persistent paragraph-level translation memory for DeepSeek translations
+import os
+import re
+import sqlite3
+import hashlib
+import logging
+import threading
+import unicodedata
+from typing import Dict, Iterable
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+)
+logger = logging.getLogger(__name__)
+
+DEFAULT_MEMORY_DB = os.path.join("cache", "translation_memory.sqlite")
+
+
+def normalize_paragraph(text):
+    """Normalize a paragraph so trivially different copies share one entry"""
+    text = unicodedata.normalize("NFC", text)
+    return re.sub(r"\s+", " ", text).strip()
+
+
+class TranslationMemory:
+    """
+    SQLite store of translated paragraphs, keyed by (source language, target
+    language, model, temperature, hash of the normalized paragraph)
+    """
+
+    def __init__(self, db_path=DEFAULT_MEMORY_DB):
+        self.db_path = db_path
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(db_path, check_same_thread=False)
+        self._db.execute("""CREATE TABLE IF NOT EXISTS translations (
+                source_lang TEXT NOT NULL,
+                target_lang TEXT NOT NULL,
+                model TEXT NOT NULL,
+                temperature REAL NOT NULL,
+                source_hash TEXT NOT NULL,
+                translation TEXT NOT NULL,
+                PRIMARY KEY (source_lang, target_lang, model, temperature, source_hash)
+            )""")
+        self._db.commit()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def paragraph_hash(paragraph):
+        return hashlib.sha256(
+            normalize_paragraph(paragraph).encode("utf-8")
+        ).hexdigest()
+
+    def lookup(
+        self, paragraphs: Iterable[str], source_lang, target_lang, model, temperature
+    ) -> Dict[str, str]:
+        """
+        Look up many paragraphs at once
+
+        Returns:
+            Dict[str, str]: Translation for each paragraph found in the memory
+        """
+        hashes = {p: self.paragraph_hash(p) for p in paragraphs}
+        cached = {}
+        with self._lock:
+            for source_hash in set(hashes.values()):
+                row = self._db.execute(
+                    "SELECT translation FROM translations WHERE source_lang = ? "
+                    "AND target_lang = ? AND model = ? AND temperature = ? "
+                    "AND source_hash = ?",
+                    (source_lang, target_lang, model, temperature, source_hash),
+                ).fetchone()
+                if row is not None:
+                    cached[source_hash] = row[0]
+            found = {p: cached[h] for p, h in hashes.items() if h in cached}
+            self.hits += len(found)
+            self.misses += len(hashes) - len(found)
+        return found
+
+    def store(
+        self, translations: Dict[str, str], source_lang, target_lang, model, temperature
+    ):
+        """Save paragraph -> translation pairs"""
+        rows = [
+            (
+                source_lang,
+                target_lang,
+                model,
+                temperature,
+                self.paragraph_hash(paragraph),
+                translation,
+            )
+            for paragraph, translation in translations.items()
+        ]
+        with self._lock:
+            self._db.executemany(
+                "INSERT OR REPLACE INTO translations VALUES (?, ?, ?, ?, ?, ?)", rows
+            )
+            self._db.commit()
+
+    def stats(self):
+        with self._lock:
+            entries = self._db.execute("SELECT COUNT(*) FROM translations").fetchone()
+        return {"hits": self.hits, "misses": self.misses, "entries": entries[0]}
+
+
+_default_memory = None
+_default_memory_lock = threading.Lock()
+
+
+def get_translation_memory() -> TranslationMemory:
+    """Shared translation memory, created on first use"""
+    global _default_memory
+    with _default_memory_lock:
+        if _default_memory is None:
+            _default_memory = TranslationMemory()
+        return _default_memory
+
+
+# For testing the module
+if __name__ == "__main__":
+    memory = TranslationMemory()
+    print(f"Translation memory at {memory.db_path}: {memory.stats()}")
@@ -2,14 +2,24 @@
 # Chuyển văn bản thành giọng nói tiếng Việt và tính thời gian cho từng từ/câu
 import os
 import re
-import json
 import logging
-import tempfile
-from typing import List, Dict, Tuple, Optional
+import time
+import copy
+import threading
+import queue
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Iterator, Tuple, Optional
 import torch
 from TTS.api import TTS
 import numpy as np
 from pydub import AudioSegment
+from modules.alignment import AlignmentStage, word_spans_from_durations
+from modules.audio_dsp import time_stretch
+from modules.audio_stream import AUDIO_CODEC_NAMES, FFmpegAudioEncoder
+from modules.media_info import record_media_info
+from modules.timings import WordTimings, save_timings
+from modules.tts_cache import SentenceAudioCache, get_sentence_cache, make_key
 
 # Cấu hình logging
 logging.basicConfig(
@@ -26,12 +36,266 @@ ENGLISH_MODELS = [
     "tts_models/en/ljspeech/glow-tts",
 ]
 
+# Giới hạn của bộ nhớ đệm mô hình dùng chung trong tiến trình
+MODEL_CACHE_MAX_MODELS = 2
+MODEL_CACHE_MAX_BYTES = 2 * 1024**3  # 2 GB
+
+# Số bản sao mô hình tổng hợp song song (1 = tổng hợp tuần tự từng câu)
+SYNTHESIS_WORKERS = 1
+# Số ký tự tối đa của một lô câu gửi cho cùng một bản sao mô hình
+SYNTHESIS_BATCH_CHARS = 600
+
+
+class TTSModelCache:
+    """
+    Bộ nhớ đệm mô hình Coqui TTS dùng chung cho cả tiến trình
+
+    Mô hình được lưu theo khóa (model_name, device) và bị loại bỏ theo thứ tự
+    ít được dùng gần đây nhất (LRU) khi vượt quá số lượng mô hình hoặc ngân sách
+    bộ nhớ. Mỗi mô hình đi kèm một lock vì cùng một instance TTS không an toàn
+    khi được gọi đồng thời từ nhiều luồng. Mô hình được tải ngoài lock chung,
+    chỉ các luồng cần cùng một mô hình mới phải chờ nhau.
+    """
+
+    def __init__(
+        self,
+        max_models: int = MODEL_CACHE_MAX_MODELS,
+        max_bytes: int = MODEL_CACHE_MAX_BYTES,
+    ):
+        self.max_models = max_models
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        # Lock riêng cho việc tải từng khóa (model_name, device)
+        self._loading = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.load_time = 0.0
+
+    def get(self, model_name: str, device: str):
+        """
+        Lấy mô hình từ bộ nhớ đệm, tải mới nếu chưa có
+
+        Args:
+            model_name (str): Tên mô hình Coqui TTS
+            device (str): Thiết bị chạy mô hình ("cpu" hoặc "cuda")
+
+        Returns:
+            Tuple[TTS, threading.Lock]: Mô hình đã tải và lock đi kèm
+        """
+        key = (model_name, device)
+        with self._lock:
+            entry = self._lookup(key)
+            if entry is not None:
+                return entry["model"], entry["lock"]
+            load_lock = self._loading.setdefault(key, threading.Lock())
+
+        # Tải mô hình ngoài lock chung để luồng dùng mô hình khác không phải
+        # chờ; lock theo khóa tránh hai luồng cùng tải một mô hình
+        with load_lock:
+            with self._lock:
+                # Luồng khác có thể vừa tải xong trong lúc chờ
+                entry = self._lookup(key)
+                if entry is not None:
+                    return entry["model"], entry["lock"]
+                self.misses += 1
+
+            start = time.perf_counter()
+            model = TTS(model_name=model_name).to(device)
+            elapsed = time.perf_counter() - start
+            size = _estimate_model_bytes(model)
+            entry = {
+                "model": model,
+                "lock": threading.Lock(),
+                "bytes": size,
+                "replicas": [],
+            }
+
+            with self._lock:
+                self.load_time += elapsed
+                self._entries[key] = entry
+                logger.info(
+                    f"Đã tải mô hình {model_name} trong {elapsed:.1f} giây "
+                    f"(~{size / 1024**2:.0f} MB)"
+                )
+                self._evict(keep=key)
+            return model, entry["lock"]
+
+    def _lookup(self, key):
+        """Mục của khóa trong bộ nhớ đệm (gọi khi đang giữ lock chung)"""
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._entries.move_to_end(key)
+            self.hits += 1
+            logger.info(f"Dùng lại mô hình đã tải: {key[0]} ({key[1]})")
+        return entry
+
+    def get_replicas(self, model_name: str, device: str, count: int) -> List:
+        """
+        Lấy các bản sao độc lập của một mô hình đã tải để tổng hợp song song
+
+        Bản sao được tạo bằng deepcopy (nhanh hơn nhiều so với tải lại từ đĩa)
+        và được giữ cùng mục của mô hình gốc để các lần sau dùng lại. Dung lượng
+        bản sao được tính vào ngân sách bộ nhớ; khi không đủ, số bản sao trả về
+        có thể ít hơn count.
+
+        Args:
+            model_name (str): Tên mô hình Coqui TTS
+            device (str): Thiết bị chạy mô hình
+            count (int): Số bản sao cần (tính cả mô hình gốc)
+
+        Returns:
+            List[Tuple[TTS, threading.Lock]]: Danh sách mô hình và lock tương ứng
+        """
+        model, lock = self.get(model_name, device)
+        key = (model_name, device)
+        while True:
+            with self._lock:
+                entry = self._entries.get(key)
+                if entry is None:
+                    return [(model, lock)]
+                replicas = [(entry["model"], entry["lock"])] + entry["replicas"]
+                if len(replicas) >= count:
+                    return replicas[:count]
+
+            # Sao chép ngoài lock của bộ nhớ đệm để các luồng khác vẫn lấy được mô hình
+            with lock:
+                replica = copy.deepcopy(model)
+            size = _estimate_model_bytes(replica)
+
+            with self._lock:
+                if self._entries.get(key) is not entry:
+                    # Mô hình đã bị loại trong lúc sao chép
+                    return [(model, lock)]
+                if len(entry["replicas"]) >= count - 1:
+                    # Luồng khác đã thêm đủ bản sao
+                    continue
+                replicas = [(entry["model"], entry["lock"])] + entry["replicas"]
+                if entry["bytes"] + size > self.max_bytes:
+                    logger.warning(
+                        f"Không đủ ngân sách bộ nhớ cho thêm bản sao của {model_name}, "
+                        f"dùng {len(replicas)} bản sao"
+                    )
+                    return replicas
+                entry["replicas"].append((replica, threading.Lock()))
+                entry["bytes"] += size
+                self._entries.move_to_end(key)
+                self._evict(keep=key)
+
+    def _evict(self, keep):
+        """Loại bỏ các mô hình ít dùng nhất cho đến khi nằm trong giới hạn"""
+        while len(self._entries) > 1 and (
+            len(self._entries) > self.max_models or self.total_bytes() > self.max_bytes
+        ):
+            key = next(iter(self._entries))
+            if key == keep:
+                break
+            self._entries.pop(key)
+            self.evictions += 1
+            logger.info(f"Giải phóng mô hình khỏi bộ nhớ đệm: {key[0]} ({key[1]})")
+            if key[1] == "cuda":
+                torch.cuda.empty_cache()
+
+    def total_bytes(self) -> int:
+        """Tổng dung lượng ước tính của các mô hình đang được giữ"""
+        return sum(entry["bytes"] for entry in self._entries.values())
+
+    def clear(self):
+        """Xóa toàn bộ mô hình khỏi bộ nhớ đệm"""
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict:
+        """Thống kê hoạt động của bộ nhớ đệm"""
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "load_time": self.load_time,
+                "models": [f"{name} ({device})" for name, device in self._entries],
+                "bytes": self.total_bytes(),
+            }
+
+
+def _estimate_model_bytes(model) -> int:
+    """Ước tính dung lượng bộ nhớ của mô hình dựa trên tham số và buffer"""
+    try:
+        tensors = list(model.parameters()) + list(model.buffers())
+        return sum(t.numel() * t.element_size() for t in tensors)
+    except Exception:
+        return 0
+
+
+# Bộ nhớ đệm mô hình dùng chung cho toàn bộ tiến trình
+model_cache = TTSModelCache()
+
+
+class TorchThreadBudget:
+    """
+    Chia số luồng tính toán của PyTorch cho các bản sao mô hình đang tổng hợp
+
+    torch.set_num_threads có hiệu lực cho cả tiến trình, nên các công việc chạy
+    cùng lúc không thể tự lưu rồi khôi phục giá trị riêng (sẽ ghi đè lẫn nhau).
+    Số bản sao đang chạy của mọi công việc được cộng dồn, số luồng ban đầu được
+    chia đều cho chúng và chỉ được khôi phục khi công việc cuối cùng kết thúc.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._active = 0
+        self._default_threads = None
+
+    def acquire(self, workers: int):
+        """Đăng ký workers bản sao bắt đầu tổng hợp"""
+        with self._lock:
+            if self._active == 0:
+                self._default_threads = torch.get_num_threads()
+            self._active += workers
+            torch.set_num_threads(max(1, self._default_threads // self._active))
+
+    def release(self, workers: int):
+        """Đăng ký workers bản sao đã tổng hợp xong"""
+        with self._lock:
+            self._active -= workers
+            if self._active == 0:
+                torch.set_num_threads(self._default_threads)
+            else:
+                torch.set_num_threads(max(1, self._default_threads // self._active))
+
+
+torch_threads = TorchThreadBudget()
+
+
+def get_model_cache_stats() -> Dict:
+    """Lấy thống kê hit/miss/thời gian tải của bộ nhớ đệm mô hình TTS"""
+    return model_cache.stats()
+
+
+class SynthesisCancelled(Exception):
+    """Quá trình tổng hợp giọng nói bị hủy"""
+
 
 class CoquiTTSWrapper:
     """Wrapper cho Coqui TTS để dễ dàng sử dụng"""
 
-    def __init__(self):
-        """Khởi tạo Coqui TTS wrapper"""
+    def __init__(
+        self,
+        sentence_cache: Optional[SentenceAudioCache] = None,
+        aligner: Optional[AlignmentStage] = None,
+        cancel_event: Optional[threading.Event] = None,
+    ):
+        """
+        Khởi tạo Coqui TTS wrapper
+
+        Args:
+            sentence_cache (SentenceAudioCache, optional): Bộ nhớ đệm audio theo câu,
+                các câu đã có trong cache sẽ không phải tổng hợp lại
+            aligner (AlignmentStage, optional): Bộ căn chỉnh thời gian từng từ
+            cancel_event (threading.Event, optional): Cờ hủy, được kiểm tra trước
+                mỗi câu; khi được đặt, SynthesisCancelled được ném ra
+        """
         logger.info("Khởi tạo Coqui TTS wrapper")
         self.device = "cuda" if torch.cuda.is_available() else "cpu"
         logger.info(f"Sử dụng thiết bị: {self.device}")
@@ -39,12 +303,16 @@ class CoquiTTSWrapper:
         # Khởi tạo TTS với mô hình mặc định (sẽ tự động tải nếu chưa có)
         self.tts = None
         self.current_model = None
+        self.model_lock = threading.Lock()
+        self.sentence_cache = sentence_cache
+        self.aligner = aligner or AlignmentStage()
+        self.cancel_event = cancel_event
 
     def load_model(self, model_name):
-        """Tải mô hình TTS"""
+        """Tải mô hình TTS (dùng lại mô hình đã tải trong tiến trình nếu có)"""
         try:
             logger.info(f"Đang tải mô hình Coqui TTS: {model_name}")
-            self.tts = TTS(model_name=model_name).to(self.device)
+            self.tts, self.model_lock = model_cache.get(model_name, self.device)
             self.current_model = model_name
             return True
         except Exception as e:
@@ -72,8 +340,14 @@ class CoquiTTSWrapper:
             return []
 
     def synthesize(
-        self, text: str, output_path: str, speaker: str = None, speed: float = 1.0
-    ) -> Tuple[str, List[Dict]]:
+        self,
+        text: str,
+        output_path: str,
+        speaker: str = None,
+        speed: float = 1.0,
+        workers: int = SYNTHESIS_WORKERS,
+        stream: bool = False,
+    ) -> Tuple[str, WordTimings]:
         """
         Tổng hợp giọng nói từ văn bản và lưu vào file
 
@@ -82,101 +356,339 @@ class CoquiTTSWrapper:
             output_path (str): Đường dẫn để lưu file audio
             speaker (str, optional): Tên giọng nói cho mô hình multi-speaker
             speed (float, optional): Tốc độ nói (1.0 là bình thường)
+            workers (int, optional): Số bản sao mô hình tổng hợp song song
+            stream (bool, optional): Mã hóa audio bằng ffmpeg ngay khi từng câu
+                được tổng hợp xong, thay vì chờ toàn bộ văn bản
 
         Returns:
-            Tuple[str, List[Dict]]: Đường dẫn đến file audio và dữ liệu timing
+            Tuple[str, WordTimings]: Đường dẫn đến file audio và dữ liệu timing
         """
         if not self.tts:
             logger.error("Mô hình TTS chưa được tải")
-            return output_path, []
+            return output_path, WordTimings()
 
         try:
             # Tạo thư mục nếu chưa tồn tại
             os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
 
-            # Xử lý văn bản: chia thành các câu để tổng hợp tốt hơn
-            sentences = self._split_into_sentences(text)
+            if stream and FFmpegAudioEncoder.available():
+                return self._synthesize_streaming(
+                    text, output_path, speaker, speed, workers
+                )
 
-            # Tạo file tạm cho audio trung gian
-            with tempfile.NamedTemporaryFile(suffix=".wav", delete=False) as tmp_file:
-                temp_path = tmp_file.name
+            # Giữ waveform của từng câu trong bộ nhớ, chỉ ghép một lần ở cuối
+            chunks = []
+            word_timings = WordTimings()
+            for samples, sentence_timings in self.iter_synthesis(
+                text, speaker, speed, workers
+            ):
+                chunks.append(samples)
+                word_timings.extend(sentence_timings)
 
-            # Xử lý từng câu và thu thập dữ liệu timing
-            word_timings = []
-            current_offset = 0
+            if not chunks:
+                logger.error("Không có audio được tạo ra")
+                return output_path, word_timings
 
-            # Tạo audio kết hợp
-            combined_audio = None
+            # Ghép toàn bộ audio và mã hóa một lần duy nhất
+            audio = np.concatenate(chunks)
+            self._export_audio(audio, self._output_sample_rate(), output_path, speed)
 
-            for i, sentence in enumerate(sentences):
-                if not sentence.strip():
-                    continue
+            return output_path, word_timings
 
-                logger.info(
-                    f"Đang tổng hợp câu {i+1}/{len(sentences)}: {sentence[:30]}..."
-                )
+        except SynthesisCancelled:
+            raise
+        except Exception as e:
+            logger.error(f"Lỗi trong quá trình tổng hợp giọng nói: {str(e)}")
+            import traceback
+
+            logger.error(traceback.format_exc())
+            return output_path, WordTimings()
+
+    def iter_synthesis(
+        self,
+        text: str,
+        speaker: str = None,
+        speed: float = 1.0,
+        workers: int = SYNTHESIS_WORKERS,
+        window: Optional[int] = None,
+    ) -> Iterator[Tuple[np.ndarray, WordTimings]]:
+        """
+        Tổng hợp văn bản theo từng câu, trả về lần lượt theo đúng thứ tự
 
-                # Tổng hợp giọng nói cho câu
-                speaker_args = {}
-                if speaker and speaker in self.get_model_speakers():
-                    speaker_args = {"speaker": speaker}
-
-                wav = self.tts.tts(text=sentence, **speaker_args)
-
-                # Chuyển đổi thành AudioSegment
-                with tempfile.NamedTemporaryFile(
-                    suffix=".wav", delete=False
-                ) as sentence_file:
-                    sentence_path = sentence_file.name
-                self.tts.save_wav(wav, sentence_path)
-                sentence_audio = AudioSegment.from_wav(sentence_path)
-
-                # Điều chỉnh tốc độ nếu cần
-                if speed != 1.0:
-                    sentence_audio = self._adjust_speed(sentence_audio, speed)
-
-                # Kết hợp với audio trước đó
-                if combined_audio is None:
-                    combined_audio = sentence_audio
-                else:
-                    combined_audio += sentence_audio
-
-                # Ước tính thời gian cho từng từ trong câu
-                sentence_duration = (
-                    len(sentence_audio) / 1000.0
-                )  # Chuyển từ ms sang giây
-                sentence_timings = self._estimate_word_timings(
-                    sentence, current_offset, sentence_duration
+        Args:
+            text (str): Văn bản cần tổng hợp
+            speaker (str, optional): Tên giọng nói cho mô hình multi-speaker
+            speed (float, optional): Tốc độ nói, dùng để tính timing
+            workers (int, optional): Số bản sao mô hình tổng hợp song song
+            window (int, optional): Số câu được tổng hợp cùng lúc trước khi trả
+                về; mặc định là toàn bộ văn bản
+
+        Yields:
+            Tuple[np.ndarray, WordTimings]: Waveform float32 của câu (chưa điều
+            chỉnh tốc độ) và timing của các từ trong câu
+        """
+        # Xử lý văn bản: chia thành các câu để tổng hợp tốt hơn
+        sentences = [s for s in self._split_into_sentences(text) if s.strip()]
+        sample_rate = self._output_sample_rate()
+
+        speaker_args = {}
+        if speaker and speaker in self.get_model_speakers():
+            speaker_args = {"speaker": speaker}
+
+        window = window or max(1, len(sentences))
+        current_offset = 0
+        for start in range(0, len(sentences), window):
+            group = sentences[start : start + window]
+            results = self._synthesize_cached(group, speaker_args, workers, sample_rate)
+            for sentence, (samples, model_spans) in zip(group, results):
+                # Căn chỉnh thời gian từng từ trong câu (đã tính cả tốc độ đọc)
+                spans = self.aligner.align(sentence, samples, sample_rate, model_spans)
+                sentence_timings = self._word_timings(
+                    sentence, spans, current_offset, speed
                 )
-                word_timings.extend(sentence_timings)
+                sentence_duration = len(samples) / sample_rate / speed
 
                 # Cập nhật offset cho câu tiếp theo
                 current_offset += sentence_duration
+                yield samples, sentence_timings
+
+    def _synthesize_streaming(
+        self, text: str, output_path: str, speaker: str, speed: float, workers: int
+    ) -> Tuple[str, WordTimings]:
+        """Tổng hợp và đẩy từng câu vào ffmpeg để mã hóa song song"""
+        word_timings = WordTimings()
+        with FFmpegAudioEncoder(
+            output_path, self._output_sample_rate(), speed=speed
+        ) as encoder:
+            for samples, sentence_timings in self.iter_synthesis(
+                text, speaker, speed, workers, window=max(1, workers)
+            ):
+                encoder.write(samples)
+                word_timings.extend(sentence_timings)
 
-                # Xóa file tạm của câu
-                os.unlink(sentence_path)
-
-            # Lưu audio kết hợp
-            if combined_audio:
-                output_format = os.path.splitext(output_path)[1][1:].lower()
-                if output_format == "mp3":
-                    combined_audio.export(output_path, format="mp3")
-                else:
-                    combined_audio.export(output_path, format="wav")
+        if not word_timings:
+            logger.error("Không có audio được tạo ra")
+        else:
+            # Thời lượng đã biết từ số mẫu, các bước sau không cần ffprobe
+            output_format = os.path.splitext(output_path)[1][1:].lower()
+            record_media_info(
+                output_path,
+                duration=encoder.duration,
+                audio_codec=AUDIO_CODEC_NAMES.get(output_format),
+            )
+        return output_path, word_timings
+
+    def _synthesize_cached(
+        self,
+        sentences: List[str],
+        speaker_args: Dict,
+        workers: int,
+        sample_rate: int,
+    ) -> List[Tuple[np.ndarray, Optional[np.ndarray]]]:
+        """Lấy các câu đã có từ bộ nhớ đệm, chỉ tổng hợp những câu còn thiếu"""
+        if self.sentence_cache is None:
+            return self._synthesize_sentences(sentences, speaker_args, workers)
+
+        speaker = speaker_args.get("speaker")
+        keys = [make_key(self.current_model, speaker, s) for s in sentences]
+        results = [None] * len(sentences)
+        missing = []
+        for i, key in enumerate(keys):
+            cached = self.sentence_cache.get(key)
+            if cached is not None and cached[1] == sample_rate:
+                results[i] = (cached[0], cached[2])
             else:
-                logger.error("Không có audio được tạo ra")
+                missing.append(i)
+
+        logger.info(
+            f"Bộ nhớ đệm TTS: {len(sentences) - len(missing)}/{len(sentences)} câu "
+            f"đã có sẵn, cần tổng hợp {len(missing)} câu"
+        )
+        synthesized = self._synthesize_sentences(
+            [sentences[i] for i in missing], speaker_args, workers
+        )
+        for i, (samples, model_spans) in zip(missing, synthesized):
+            results[i] = (samples, model_spans)
+            self.sentence_cache.put(
+                keys[i],
+                samples,
+                sample_rate,
+                self.current_model,
+                sentences[i],
+                word_spans=model_spans,
+            )
+        return results
 
-            # Xóa file tạm
-            os.unlink(temp_path)
+    def _synthesize_sentences(
+        self, sentences: List[str], speaker_args: Dict, workers: int = 1
+    ) -> List[Tuple[np.ndarray, Optional[np.ndarray]]]:
+        """
+        Tổng hợp danh sách câu, trả về waveform theo đúng thứ tự ban đầu
 
-            return output_path, word_timings
+        Mỗi phần tử gồm waveform và ranh giới từ lấy từ thời lượng token của
+        mô hình (None nếu mô hình không cung cấp).
 
-        except Exception as e:
-            logger.error(f"Lỗi trong quá trình tổng hợp giọng nói: {str(e)}")
-            import traceback
+        Với workers > 1, các câu được nhóm thành lô theo độ dài và phân cho một
+        nhóm bản sao mô hình chạy trên thread pool (PyTorch nhả GIL trong lúc
+        suy luận). API của Coqui TTS chỉ nhận từng đoạn văn bản một, nên mỗi lô
+        được xử lý tuần tự trên bản sao của nó.
+        """
+        results = [None] * len(sentences)
+        if not sentences:
+            return results
+
+        def run(model, lock, indices):
+            for i in indices:
+                if self.cancel_event is not None and self.cancel_event.is_set():
+                    raise SynthesisCancelled()
+                logger.info(
+                    f"Đang tổng hợp câu {i+1}/{len(sentences)}: {sentences[i][:30]}..."
+                )
+                with lock:
+                    wav, model_spans = self._infer(model, sentences[i], speaker_args)
+                results[i] = (_normalize_peak(wav), model_spans)
+
+        batches = _batch_by_length(sentences, SYNTHESIS_BATCH_CHARS)
+        workers = min(max(1, workers), len(batches))
+        if workers <= 1 or self.device == "cuda":
+            run(self.tts, self.model_lock, range(len(sentences)))
+            return results
+
+        replicas = queue.Queue()
+        models = model_cache.get_replicas(self.current_model, self.device, workers)
+        for replica in models:
+            replicas.put(replica)
+        workers = len(models)
+
+        def run_batch(indices):
+            model, lock = replicas.get()
+            try:
+                run(model, lock, indices)
+            finally:
+                replicas.put((model, lock))
+
+        # Chia đều số luồng tính toán của PyTorch cho các bản sao
+        torch_threads.acquire(workers)
+        try:
+            logger.info(
+                f"Tổng hợp {len(sentences)} câu theo {len(batches)} lô "
+                f"trên {workers} bản sao mô hình"
+            )
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                list(executor.map(run_batch, batches))
+        finally:
+            torch_threads.release(workers)
 
-            logger.error(traceback.format_exc())
-            return output_path, []
+        return results
+
+    def _infer(
+        self, model, sentence: str, speaker_args: Dict
+    ) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+        """
+        Chạy mô hình cho một câu
+
+        Với mô hình sinh waveform trực tiếp (VITS) có dự đoán thời lượng, gọi thẳng
+        hàm synthesis của Coqui để lấy thêm thời lượng từng token, dùng cho căn
+        chỉnh từ. Các mô hình khác (hoặc khi có lỗi) dùng API tts() thông thường.
+        """
+        if not speaker_args:
+            try:
+                result = self._infer_with_durations(model, sentence)
+                if result is not None:
+                    return result
+            except Exception as e:
+                logger.debug(f"Không lấy được thời lượng token từ mô hình: {str(e)}")
+
+        wav = model.tts(text=sentence, **speaker_args)
+        return np.asarray(wav, dtype=np.float32), None
+
+    def _infer_with_durations(
+        self, model, sentence: str
+    ) -> Optional[Tuple[np.ndarray, Optional[np.ndarray]]]:
+        """Tổng hợp một câu bằng mô hình end-to-end và lấy thời lượng token"""
+        synthesizer = model.synthesizer
+        tts_model = synthesizer.tts_model
+        config = tts_model.config
+        if (
+            synthesizer.vocoder_model is not None
+            or getattr(tts_model, "tokenizer", None) is None
+            or getattr(config.audio, "do_trim_silence", False)
+        ):
+            return None
+
+        from TTS.tts.utils.synthesis import synthesis
+
+        with torch.no_grad():
+            outputs = synthesis(
+                model=tts_model,
+                text=sentence,
+                CONFIG=config,
+                use_cuda=self.device == "cuda",
+            )
+        durations = outputs["outputs"].get("durations")
+        if durations is None:
+            return None
+
+        wav = np.asarray(outputs["wav"], dtype=np.float32).reshape(-1)
+        token_ids = tts_model.tokenizer.text_to_ids(sentence)
+        token_texts = [tts_model.tokenizer.decode([i]) for i in token_ids]
+        model_spans = word_spans_from_durations(
+            sentence,
+            token_texts,
+            durations.detach().cpu().numpy(),
+            config.audio.hop_length,
+            synthesizer.output_sample_rate,
+        )
+
+        # Synthesizer.tts thêm 10000 mẫu im lặng sau mỗi câu, giữ nguyên như vậy
+        wav = np.concatenate([wav, np.zeros(10000, dtype=np.float32)])
+        return wav, model_spans
+
+    def _output_sample_rate(self) -> int:
+        """Lấy tần số lấy mẫu đầu ra của mô hình hiện tại"""
+        try:
+            return int(self.tts.synthesizer.output_sample_rate)
+        except AttributeError:
+            return 22050
+
+    def _export_audio(
+        self, audio: np.ndarray, sample_rate: int, output_path: str, speed: float
+    ):
+        """Mã hóa buffer PCM (float32, mono) ra file mp3/m4a/opus/wav"""
+        # Điều chỉnh tốc độ một lần cho toàn bộ audio
+        if speed != 1.0:
+            audio = self._adjust_speed(audio, speed)
+
+        pcm = (np.clip(audio, -1.0, 1.0) * 32767).astype(np.int16)
+        combined_audio = AudioSegment(
+            data=pcm.tobytes(), sample_width=2, frame_rate=sample_rate, channels=1
+        )
+
+        output_format = os.path.splitext(output_path)[1][1:].lower()
+        if output_format == "mp3":
+            combined_audio.export(output_path, format="mp3")
+        elif output_format in ("m4a", "aac"):
+            # AAC để bước tạo video ghép thẳng (-c:a copy) không mã hóa lại
+            combined_audio.export(
+                output_path, format="ipod", codec="aac", bitrate="160k"
+            )
+        elif output_format in ("opus", "webm"):
+            combined_audio.export(
+                output_path,
+                format=output_format,
+                codec="libopus",
+                bitrate="96k",
+                parameters=["-ar", "48000"],
+            )
+        else:
+            combined_audio.export(output_path, format="wav")
+
+        # Thời lượng đã biết từ số mẫu, các bước sau không cần ffprobe
+        record_media_info(
+            output_path,
+            duration=len(audio) / sample_rate,
+            audio_codec=AUDIO_CODEC_NAMES.get(output_format),
+        )
 
     def _split_into_sentences(self, text: str) -> List[str]:
         """Chia văn bản thành các câu để tổng hợp tốt hơn"""
@@ -184,39 +696,57 @@ class CoquiTTSWrapper:
         sentences = re.split(r"(?<=[.!?])\s+", text)
         return sentences
 
-    def _estimate_word_timings(
-        self, sentence: str, start_time: float, duration: float
-    ) -> List[Dict]:
+    def _word_timings(
+        self, sentence: str, spans: np.ndarray, start_time: float, speed: float
+    ) -> WordTimings:
         """
-        Ước tính thời gian cho từng từ trong một câu
+        Chuyển ranh giới từ (giây, tính từ đầu câu) thành dữ liệu timing
 
-        Đây là một ước tính đơn giản phân bổ các từ đều nhau trong thời gian của câu.
-        Để có timing chính xác hơn, cần sử dụng forced aligner.
+        Ranh giới được tính trên audio chưa điều chỉnh tốc độ nên được chia cho
+        speed rồi cộng offset của câu.
         """
-        words = sentence.split()
-        if not words:
-            return []
+        words = sentence.split()[: len(spans)]
+        timings = WordTimings()
+        timings.append_words(
+            words,
+            start_time + spans[: len(words), 0] / speed,
+            start_time + spans[: len(words), 1] / speed,
+        )
+        return timings
 
-        # Phân bổ các từ đều đều trong thời lượng
-        word_duration = duration / len(words)
+    def _adjust_speed(self, audio: np.ndarray, speed: float) -> np.ndarray:
+        """Điều chỉnh tốc độ của toàn bộ audio, giữ nguyên cao độ giọng đọc"""
+        return time_stretch(audio, speed)
 
-        timings = []
-        for i, word in enumerate(words):
-            word_start = start_time + (i * word_duration)
-            word_end = word_start + word_duration
 
-            timings.append({"word": word, "start": word_start, "end": word_end})
+def _batch_by_length(sentences: List[str], max_chars: int) -> List[List[int]]:
+    """
+    Nhóm chỉ số các câu thành các lô có tổng độ dài gần bằng nhau
 
-        return timings
+    Câu dài được xếp trước (giống thuật toán LPT) để các lô kết thúc gần như
+    cùng lúc; mỗi lô không vượt quá max_chars trừ khi chỉ có một câu.
+    """
+    order = sorted(range(len(sentences)), key=lambda i: len(sentences[i]), reverse=True)
+    batches = []
+    sizes = []
+    for i in order:
+        length = len(sentences[i])
+        # Đặt câu vào lô nhỏ nhất còn chỗ, nếu không thì mở lô mới
+        candidates = [b for b in range(len(batches)) if sizes[b] + length <= max_chars]
+        if candidates:
+            b = min(candidates, key=lambda b: sizes[b])
+            batches[b].append(i)
+            sizes[b] += length
+        else:
+            batches.append([i])
+            sizes.append(length)
+    return [sorted(batch) for batch in batches]
 
-    def _adjust_speed(self, audio: AudioSegment, speed: float) -> AudioSegment:
-        """Điều chỉnh tốc độ của một đoạn audio"""
-        # Đây là cách đơn giản sử dụng pydub's speed change
-        # Lưu ý: Cách này cũng thay đổi pitch, để có kết quả tốt hơn có thể sử dụng librosa
-        sound_with_altered_frame_rate = audio._spawn(
-            audio.raw_data, overrides={"frame_rate": int(audio.frame_rate * speed)}
-        )
-        return sound_with_altered_frame_rate.set_frame_rate(audio.frame_rate)
+
+def _normalize_peak(samples: np.ndarray) -> np.ndarray:
+    """Chuẩn hóa biên độ đỉnh của một câu giống như TTS.save_wav"""
+    peak = max(0.01, float(np.max(np.abs(samples)))) if len(samples) else 1.0
+    return samples / peak
 
 
 def get_available_voices():
@@ -330,7 +860,16 @@ def filter_voices_by_language(all_voices, language_code="vi-VN"):
 
 
 def text_to_speech(
-    text, output_path, lang="vi", timing_file=None, voice=None, rate="+0%"
+    text,
+    output_path,
+    lang="vi",
+    timing_file=None,
+    voice=None,
+    rate="+0%",
+    workers=SYNTHESIS_WORKERS,
+    use_cache=True,
+    stream=True,
+    cancel_event=None,
 ):
     """
     Tạo giọng nói từ văn bản sử dụng Coqui TTS với API tương thích với hệ thống hiện tại
@@ -339,12 +878,20 @@ def text_to_speech(
         text (str): Văn bản cần tổng hợp thành giọng nói
         output_path (str): Đường dẫn để lưu file audio
         lang (str): Mã ngôn ngữ ('vi' cho tiếng Việt, 'en' cho tiếng Anh)
-        timing_file (str, optional): Đường dẫn để lưu dữ liệu timing
+        timing_file (str, optional): Đường dẫn để lưu dữ liệu timing (.json theo
+            định dạng cũ, phần mở rộng khác dùng định dạng nhị phân)
         voice (str, optional): Tên giọng nói/mô hình
         rate (str, optional): Tốc độ đọc theo định dạng "+0%", "+10%", "-5%", v.v.
+        workers (int, optional): Số bản sao mô hình tổng hợp song song trên CPU
+        use_cache (bool, optional): Dùng lại audio của các câu đã tổng hợp trước đó
+        stream (bool, optional): Mã hóa audio song song với quá trình tổng hợp
+        cancel_event (threading.Event, optional): Cờ hủy, dừng trước câu kế tiếp
 
     Returns:
-        Tuple[str, List[Dict]]: Đường dẫn đến file audio và dữ liệu timing
+        Tuple[str, WordTimings]: Đường dẫn đến file audio và dữ liệu timing
+
+    Raises:
+        SynthesisCancelled: Khi cancel_event được đặt
     """
     # Chuyển đổi chuỗi rate thành số thực (ví dụ: "+7%" thành 1.07, "-5%" thành 0.95)
     speed = 1.0
@@ -354,7 +901,9 @@ def text_to_speech(
         speed = 1.0 - float(rate.strip("-%")) / 100
 
     # Khởi tạo và tải mô hình TTS
-    tts_wrapper = CoquiTTSWrapper()
+    tts_wrapper = CoquiTTSWrapper(
+        get_sentence_cache() if use_cache else None, cancel_event=cancel_event
+    )
 
     # Chọn mô hình dựa trên ngôn ngữ và giọng được chỉ định
     selected_model = None  # Nếu đã có mô hình được chỉ định, kiểm tra và sử dụng nó
@@ -385,7 +934,7 @@ def text_to_speech(
         logger.error(
             "Không thể khởi tạo Coqui TTS, vui lòng kiểm tra xem mô hình có sẵn không"
         )
-        return output_path, []
+        return output_path, WordTimings()
 
     # Tổng hợp giọng nói
     # Đối với mô hình đa giọng, chúng ta có thể truyền tham số speaker,
@@ -395,12 +944,13 @@ def text_to_speech(
         output_path=output_path,
         speaker=None,  # Coqui TTS mô hình đơn giọng không cần tham số này
         speed=speed,
+        workers=workers,
+        stream=stream,
     )
 
     # Lưu dữ liệu timing nếu được yêu cầu
     if timing_file and word_timings:
-        with open(timing_file, "w", encoding="utf-8") as f:
-            json.dump(word_timings, f, ensure_ascii=False, indent=2)
+        save_timings(word_timings, timing_file)
 
     return output_path, word_timings
 
@@ -0,0 +1,280 @@
+# modules/tts_cache.py
+# Bộ nhớ đệm audio của từng câu trên đĩa, định danh theo nội dung
+import os
+import re
+import time
+import hashlib
+import sqlite3
+import logging
+import threading
+import unicodedata
+from typing import Dict, Optional, Tuple
+import numpy as np
+
+# Cấu hình logging
+logging.basicConfig(
+    level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+)
+logger = logging.getLogger(__name__)
+
+# Thư mục và dung lượng mặc định của bộ nhớ đệm
+DEFAULT_CACHE_DIR = os.path.join("cache", "tts")
+DEFAULT_MAX_BYTES = 2 * 1024**3  # 2 GB
+
+
+def normalize_sentence(text: str) -> str:
+    """Chuẩn hóa câu (Unicode NFC, gộp khoảng trắng) trước khi băm"""
+    text = unicodedata.normalize("NFC", text)
+    return re.sub(r"\s+", " ", text).strip()
+
+
+def make_key(model_name: str, speaker: Optional[str], text: str) -> str:
+    """
+    Tạo khóa bộ nhớ đệm cho một câu
+
+    Tốc độ đọc không nằm trong khóa: audio được lưu trước bước điều chỉnh tốc
+    độ (áp dụng một lần cho toàn bộ buffer), nên đổi tốc độ vẫn dùng lại được.
+
+    Args:
+        model_name (str): Tên mô hình Coqui TTS
+        speaker (str, optional): Giọng nói (mô hình multi-speaker)
+        text (str): Nội dung câu
+
+    Returns:
+        str: Chuỗi sha256 dạng hex
+    """
+    payload = "\x1f".join([model_name or "", speaker or "", normalize_sentence(text)])
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class SentenceAudioCache:
+    """
+    Lưu PCM (int16, mono) và thời lượng của từng câu đã tổng hợp
+
+    Mỗi câu là một file .npy trong thư mục cache; chỉ mục SQLite giữ thông tin
+    kích thước và thời điểm truy cập để loại bỏ theo LRU khi vượt dung lượng.
+    """
+
+    def __init__(
+        self, cache_dir: str = DEFAULT_CACHE_DIR, max_bytes: int = DEFAULT_MAX_BYTES
+    ):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        os.makedirs(cache_dir, exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(
+            os.path.join(cache_dir, "index.sqlite"), check_same_thread=False
+        )
+        self._db.execute("""CREATE TABLE IF NOT EXISTS entries (
+                key TEXT PRIMARY KEY,
+                model TEXT,
+                text TEXT,
+                sample_rate INTEGER,
+                num_samples INTEGER,
+                duration REAL,
+                bytes INTEGER,
+                created REAL,
+                last_access REAL,
+                word_spans BLOB
+            )""")
+        columns = [row[1] for row in self._db.execute("PRAGMA table_info(entries)")]
+        if "word_spans" not in columns:
+            # Chỉ mục được tạo trước khi có căn chỉnh từ
+            self._db.execute("ALTER TABLE entries ADD COLUMN word_spans BLOB")
+        self._db.commit()
+        self.hits = 0
+        self.misses = 0
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key[:2], key + ".npy")
+
+    def get(self, key: str) -> Optional[Tuple[np.ndarray, int, Optional[np.ndarray]]]:
+        """
+        Lấy audio của một câu từ bộ nhớ đệm
+
+        Returns:
+            Tuple[np.ndarray, int, np.ndarray]: Waveform float32, tần số lấy mẫu và
+            ranh giới từ do mô hình dự đoán (có thể None), hoặc None nếu chưa có
+        """
+        with self._lock:
+            row = self._db.execute(
+                "SELECT sample_rate, word_spans FROM entries WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+
+            try:
+                pcm = np.load(self._path(key))
+            except (OSError, ValueError):
+                # File đã bị xóa hoặc hỏng: bỏ mục khỏi chỉ mục
+                self._db.execute("DELETE FROM entries WHERE key = ?", (key,))
+                self._db.commit()
+                self.misses += 1
+                return None
+
+            self._db.execute(
+                "UPDATE entries SET last_access = ? WHERE key = ?", (time.time(), key)
+            )
+            self._db.commit()
+            self.hits += 1
+            word_spans = None
+            if row[1] is not None:
+                word_spans = np.frombuffer(row[1], dtype=np.float32).reshape(-1, 2)
+            return pcm.astype(np.float32) / 32767, row[0], word_spans
+
+    def put(
+        self,
+        key: str,
+        samples: np.ndarray,
+        sample_rate: int,
+        model_name: str = "",
+        text: str = "",
+        word_spans: Optional[np.ndarray] = None,
+    ):
+        """
+        Lưu audio của một câu vào bộ nhớ đệm
+
+        Args:
+            key (str): Khóa tạo bởi make_key
+            samples (np.ndarray): Waveform float32 trong khoảng [-1, 1]
+            sample_rate (int): Tần số lấy mẫu
+            model_name (str, optional): Tên mô hình (để thống kê/xóa theo mô hình)
+            text (str, optional): Nội dung câu (để tiện kiểm tra)
+            word_spans (np.ndarray, optional): Ranh giới từ do mô hình dự đoán
+        """
+        pcm = (np.clip(samples, -1.0, 1.0) * 32767).astype(np.int16)
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        # Ghi ra file tạm rồi đổi tên để không để lại file dở dang
+        tmp_path = path + f".{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            np.save(f, pcm)
+        os.replace(tmp_path, path)
+
+        spans_blob = None
+        if word_spans is not None:
+            spans_blob = np.asarray(word_spans, dtype=np.float32).tobytes()
+
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    key,
+                    model_name,
+                    text,
+                    sample_rate,
+                    len(pcm),
+                    len(pcm) / sample_rate,
+                    os.path.getsize(path),
+                    now,
+                    now,
+                    spans_blob,
+                ),
+            )
+            self._db.commit()
+            self._evict()
+
+    def _evict(self):
+        """Xóa các câu lâu không dùng nhất cho đến khi nằm trong dung lượng cho phép"""
+        total = self._db.execute(
+            "SELECT COALESCE(SUM(bytes), 0) FROM entries"
+        ).fetchone()[0]
+        if total <= self.max_bytes:
+            return
+
+        rows = self._db.execute(
+            "SELECT key, bytes FROM entries ORDER BY last_access ASC"
+        ).fetchall()
+        for key, size in rows:
+            if total <= self.max_bytes:
+                break
+            self._remove_file(key)
+            self._db.execute("DELETE FROM entries WHERE key = ?", (key,))
+            total -= size
+            logger.info(f"Loại bỏ câu khỏi bộ nhớ đệm TTS: {key[:12]}")
+        self._db.commit()
+
+    def _remove_file(self, key: str):
+        try:
+            os.remove(self._path(key))
+        except OSError:
+            pass
+
+    def stats(self) -> Dict:
+        """Thống kê số câu, dung lượng và tỉ lệ hit/miss"""
+        with self._lock:
+            entries, total_bytes, total_duration = self._db.execute(
+                "SELECT COUNT(*), COALESCE(SUM(bytes), 0), COALESCE(SUM(duration), 0) "
+                "FROM entries"
+            ).fetchone()
+            models = self._db.execute(
+                "SELECT model, COUNT(*) FROM entries GROUP BY model"
+            ).fetchall()
+        return {
+            "entries": entries,
+            "bytes": total_bytes,
+            "max_bytes": self.max_bytes,
+            "duration": total_duration,
+            "models": dict(models),
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+    def purge(self, model_name: Optional[str] = None) -> int:
+        """
+        Xóa bộ nhớ đệm (toàn bộ hoặc chỉ của một mô hình)
+
+        Returns:
+            int: Số câu đã xóa
+        """
+        with self._lock:
+            if model_name:
+                rows = self._db.execute(
+                    "SELECT key FROM entries WHERE model = ?", (model_name,)
+                ).fetchall()
+            else:
+                rows = self._db.execute("SELECT key FROM entries").fetchall()
+            for (key,) in rows:
+                self._remove_file(key)
+                self._db.execute("DELETE FROM entries WHERE key = ?", (key,))
+            self._db.commit()
+        logger.info(f"Đã xóa {len(rows)} câu khỏi bộ nhớ đệm TTS")
+        return len(rows)
+
+
+_default_cache = None
+_default_cache_lock = threading.Lock()
+
+
+def get_sentence_cache() -> SentenceAudioCache:
+    """Lấy bộ nhớ đệm câu mặc định (tạo khi dùng lần đầu)"""
+    global _default_cache
+    with _default_cache_lock:
+        if _default_cache is None:
+            _default_cache = SentenceAudioCache()
+        return _default_cache
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Kiểm tra/xóa bộ nhớ đệm câu TTS")
+    parser.add_argument("--dir", default=DEFAULT_CACHE_DIR, help="Thư mục cache")
+    parser.add_argument("--purge", action="store_true", help="Xóa bộ nhớ đệm")
+    parser.add_argument("--model", help="Chỉ xóa các câu của mô hình này")
+    args = parser.parse_args()
+
+    cache = SentenceAudioCache(args.dir)
+    if args.purge:
+        print(f"Đã xóa {cache.purge(args.model)} câu")
+    stats = cache.stats()
+    print(f"Số câu: {stats['entries']}")
+    print(
+        f"Dung lượng: {stats['bytes'] / 1024**2:.1f} / {stats['max_bytes'] / 1024**2:.0f} MB"
+    )
+    print(f"Tổng thời lượng: {stats['duration']:.1f} giây")
+    for model, count in stats["models"].items():
+        print(f"  {model}: {count} câu")
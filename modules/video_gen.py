@@ -1,11 +1,21 @@
 # modules/video_gen.py
 # Tạo video từ hình ảnh và audio
-import ffmpeg
 import os
 import json
 import logging
+import shutil
+import tempfile
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
 from typing import List, Optional
 from pydub import AudioSegment
+from PIL import Image
+from modules.media_info import get_audio_codec, get_duration, record_media_info
+from modules.subtitle_render import (
+    build_overlay_concat,
+    build_precomposed_concat,
+    release_precomposed_frames,
+)
 import math
 
 # Configure logging
@@ -36,352 +46,779 @@ def normalize_path_for_ffmpeg(path):
     return normalized_path
 
 
-def create_video(image_path, audio_path, output_path, subtitle_path=None):
-    # Lấy độ dài audio
-    probe = ffmpeg.probe(audio_path)
-    duration = float(probe["format"]["duration"])
-
-    # Tạo video từ ảnh tĩnh và audio
-    input_image = ffmpeg.input(image_path, loop=1, t=duration)
-    input_audio = ffmpeg.input(audio_path)
-
-    temp_video = output_path + ".temp.mp4"
-
-    # Tạo video cơ bản
-    (
-        ffmpeg.output(
-            input_image,
-            input_audio,
-            temp_video,
-            vcodec="libx264",
-            acodec="aac",
-            shortest=None,
-            pix_fmt="yuv420p",
-            r=24,
-        ).run(overwrite_output=True)
-    )  # Gắn phụ đề trực tiếp vào video (burned-in)
-    if subtitle_path and os.path.exists(subtitle_path):
-        video_with_subtitles = ffmpeg.input(temp_video)
-
-        # Kiểm tra xem file phụ đề có dữ liệu không
-        with open(subtitle_path, "r", encoding="utf-8") as f:
-            subtitle_content = f.read()
-
-        if not subtitle_content.strip():
-            print(f"File phụ đề rỗng: {subtitle_path}")
-            # Kiểm tra và xử lý nếu file đích đã tồn tại
-            if os.path.exists(output_path):
-                os.remove(output_path)
-            os.rename(temp_video, output_path)
-            return output_path
-
-        # Sử dụng đường dẫn tuyệt đối cho Windows
-        subtitle_path_escaped = normalize_path_for_ffmpeg(subtitle_path)
-
-        # Sử dụng subtitles filter với các tùy chọn để phụ đề lớn, đậm, màu trắng viền xanh, ở giữa
-        subtitle_options = f"force_style='Fontname=Arial,Fontsize=28,PrimaryColour=&HFFFFFF,OutlineColour=&H0000FF,BorderStyle=1,Outline=3,Shadow=0,Alignment=2,MarginV=35'"
-
-        # In thông tin debug
-        print(f"Subtitle path: {subtitle_path}")
-        print(f"Subtitle path escaped: {subtitle_path_escaped}")
-        print(f"Output path: {output_path}")
+# Cấu hình mã hóa video
+# - default: 24 fps, tham số libx264 mặc định
+# - slideshow: dành cho hình tĩnh giữ nguyên nhiều phút, tốc độ khung thấp,
+#   GOP dài (keyframe ở mỗi lần đổi hình) và tune=stillimage
+ENCODER_PRESETS = {
+    "default": {
+        "fps": 24,
+        "args": ["-c:v", "libx264", "-pix_fmt", "yuv420p"],
+    },
+    "slideshow": {
+        "fps": 6,
+        # Keyframe tối đa mỗi 10 giây để YouTube vẫn tua được
+        "gop_seconds": 10,
+        "args": [
+            "-c:v",
+            "libx264",
+            "-pix_fmt",
+            "yuv420p",
+            "-tune",
+            "stillimage",
+            "-x264-params",
+            "scenecut=0:open-gop=0",
+            "-movflags",
+            "+faststart",
+        ],
+    },
+}
+DEFAULT_ENCODER_PRESET = "slideshow"
+
+# Số đoạn video mã hóa song song (1 = mã hóa toàn bộ trong một tiến trình)
+ENCODE_WORKERS = 1
+
+# Kiểu phụ đề: lớn, đậm, màu trắng viền xanh, ở giữa phía dưới
+SUBTITLE_FORCE_STYLE = "Fontname=Arial,Fontsize=28,PrimaryColour=&HFFFFFF,OutlineColour=&H0000FF,BorderStyle=1,Outline=3,Shadow=0,Alignment=2,MarginV=35"
+# Kiểu chữ tương ứng với SUBTITLE_FORCE_STYLE khi vẽ sẵn phụ đề bằng Pillow
+SUBTITLE_OVERLAY_STYLE = {
+    "fontname": "Arial",
+    "fontsize": 28,
+    "primary": (255, 255, 255, 255),
+    "outline_color": (255, 0, 0, 255),
+    "outline": 3,
+    "margin_v": 35,
+}
+
+# Codec audio mà mỗi loại container video nhận trực tiếp (ghép bằng -c:a copy),
+# theo tên codec của ffprobe (xem media_info.get_audio_codec)
+AUDIO_COPY_COMPATIBLE = {
+    "mp4": {"aac", "mp3"},
+    "mov": {"aac", "mp3"},
+    "m4v": {"aac", "mp3"},
+    "webm": {"opus", "vorbis"},
+    "mkv": {"aac", "opus", "vorbis", "mp3", "flac"},
+}
+
+# Cách gắn phụ đề:
+# - overlay: vẽ sẵn mỗi dòng thành ảnh một lần rồi ghép bằng bộ lọc overlay
+# - libass: bộ lọc subtitles, vẽ lại phụ đề trên mọi khung hình
+# - precomposed: ghép sẵn hình nền + phụ đề thành các khung tĩnh bằng Pillow,
+#   ffmpeg chỉ còn mã hóa danh sách khung (không dùng libass hay overlay)
+SUBTITLE_RENDERERS = ("overlay", "libass", "precomposed")
+SUBTITLE_RENDERER = "overlay"
+
+
+def build_subtitle_filter(subtitle_path):
+    """
+    Tạo bộ lọc subtitles cho ffmpeg từ file phụ đề
 
-        try:
-            # Kiểm tra và xóa file đích nếu đã tồn tại
-            if os.path.exists(output_path):
-                os.remove(output_path)
+    Args:
+        subtitle_path (str): Đường dẫn đến file phụ đề (.ass)
 
-            # Sử dụng cả hai cách để thử gắn phụ đề
-            try:
-                # Cách 1: Sử dụng vf=subtitles trực tiếp
-                (
-                    ffmpeg.output(
-                        video_with_subtitles,
-                        output_path,
-                        vf=f"subtitles='{subtitle_path_escaped}':{subtitle_options}",
-                        vcodec="libx264",
-                        acodec="copy",
-                    ).run(overwrite_output=True)
-                )
-            except Exception as e1:
-                print(f"Lỗi phương pháp 1: {str(e1)}")
+    Returns:
+        str: Chuỗi filter, hoặc None nếu không có file hoặc file rỗng
+    """
+    if not subtitle_path or not os.path.exists(subtitle_path):
+        return None
 
-                # Cách 2: Sử dụng options thông qua -vf flag
-                import subprocess
+    # Kiểm tra xem file phụ đề có dữ liệu không
+    with open(subtitle_path, "r", encoding="utf-8") as f:
+        if not f.read().strip():
+            logger.warning(f"File phụ đề rỗng: {subtitle_path}")
+            return None
 
-                cmd = [
-                    "ffmpeg",
-                    "-y",
-                    "-i",
-                    temp_video,
-                    "-vf",
-                    f"subtitles='{subtitle_path_escaped}':{subtitle_options}",
-                    "-c:v",
-                    "libx264",
-                    "-c:a",
-                    "copy",
-                    output_path,
-                ]
-                print(f"Lệnh ffmpeg: {' '.join(cmd)}")
-                result = subprocess.run(cmd, capture_output=True, text=True)
+    # Escape đường dẫn phụ đề cho ffmpeg theo cách đảm bảo hoạt động trên Windows
+    subtitle_path_escaped = normalize_path_for_ffmpeg(subtitle_path).replace(":", "\\:")
+    return f"subtitles='{subtitle_path_escaped}':force_style='{SUBTITLE_FORCE_STYLE}'"
 
-                if result.returncode != 0:
-                    print(f"Lỗi phương pháp 2: {result.stderr}")
-                    raise Exception(result.stderr)
 
-        except Exception as e:
-            print(f"Lỗi khi gắn phụ đề: {str(e)}")
-            # Fallback: sử dụng video không có phụ đề
-            if os.path.exists(output_path):
-                os.remove(output_path)
-            os.rename(temp_video, output_path)
-    else:
-        # Nếu không có file phụ đề, đổi tên file tạm thành file đích
-        if os.path.exists(output_path):
-            os.remove(output_path)
-        os.rename(temp_video, output_path)
+class FFmpegCancelled(Exception):
+    """Lệnh ffmpeg bị dừng vì cờ hủy đã được đặt"""
+
+
+def run_ffmpeg(cmd, cancel_event=None):
+    """
+    Chạy một lệnh ffmpeg, ném Exception kèm stderr nếu thất bại
+
+    Args:
+        cmd (List[str]): Lệnh ffmpeg đầy đủ
+        cancel_event (threading.Event, optional): Khi được đặt, tiến trình
+            ffmpeg bị dừng và FFmpegCancelled được ném ra
 
-        # Xóa file tạm
+    Raises:
+        FFmpegCancelled: Khi cancel_event được đặt
+    """
+    if cancel_event is not None and cancel_event.is_set():
+        raise FFmpegCancelled()
+    logger.info(f"Chạy lệnh ffmpeg: {' '.join(cmd)}")
+    process = subprocess.Popen(
+        cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True
+    )
+    while True:
         try:
-            os.remove(temp_video)
-        except:
-            pass
-    return output_path
+            # Chờ có giới hạn để kiểm tra cờ hủy thường xuyên
+            _, stderr = process.communicate(
+                timeout=None if cancel_event is None else 0.5
+            )
+            break
+        except subprocess.TimeoutExpired:
+            if cancel_event.is_set():
+                process.kill()
+                process.communicate()
+                raise FFmpegCancelled()
+    if process.returncode != 0:
+        logger.error(f"Lỗi ffmpeg: {stderr}")
+        raise Exception(stderr)
+
+
+def audio_codec_args(audio_path, output_path):
+    """
+    Chọn cách đưa audio vào video: ghép thẳng nếu codec tương thích với
+    container đầu ra, ngược lại mã hóa lại (AAC, hoặc Opus cho webm)
 
+    Args:
+        audio_path (str): File audio đầu vào
+        output_path (str): File video đầu ra
 
-def create_video_with_segments(
-    image_paths: List[str], audio_path: str, output_path: str, subtitle_path=None
+    Returns:
+        List[str]: Tham số codec audio cho ffmpeg
+    """
+    container = os.path.splitext(output_path)[1][1:].lower()
+    # Dựa vào codec thật của file (phần mở rộng có thể không khớp nội dung)
+    try:
+        audio_codec = get_audio_codec(audio_path)
+    except Exception as e:
+        logger.warning(f"Không đọc được codec audio, mã hóa lại: {str(e)}")
+        audio_codec = None
+    if audio_codec in AUDIO_COPY_COMPATIBLE.get(container, ()):
+        logger.info(f"Ghép audio {audio_codec} không mã hóa lại")
+        return ["-c:a", "copy"]
+    if container == "webm":
+        return ["-c:a", "libopus"]
+    return ["-c:a", "aac"]
+
+
+class SubtitleLayer:
+    """
+    Phụ đề của một lần render: luồng ảnh vẽ sẵn (overlay) hoặc bộ lọc subtitles
+
+    Nếu không vẽ sẵn được (thiếu font, file lỗi...) sẽ dùng bộ lọc subtitles.
+    """
+
+    def __init__(
+        self, subtitle_path, width, height, work_dir, renderer=SUBTITLE_RENDERER
+    ):
+        self.overlay_path = None
+        self.filter = None
+        if renderer == "overlay" and subtitle_path and os.path.exists(subtitle_path):
+            try:
+                self.overlay_path = build_overlay_concat(
+                    subtitle_path, width, height, work_dir, SUBTITLE_OVERLAY_STYLE
+                )
+            except Exception as e:
+                logger.warning(f"Không thể vẽ sẵn phụ đề: {str(e)}")
+        if self.overlay_path is None:
+            self.filter = build_subtitle_filter(subtitle_path)
+
+    def __bool__(self):
+        return bool(self.overlay_path or self.filter)
+
+    def input_args(self):
+        """Input thêm cho ffmpeg (luồng ảnh phụ đề qua concat demuxer)"""
+        if self.overlay_path:
+            return ["-f", "concat", "-safe", "0", "-i", self.overlay_path]
+        return []
+
+    def apply(self, label, input_index):
+        """
+        Gắn phụ đề vào luồng video có nhãn label
+
+        Args:
+            label (str): Nhãn luồng video trong filtergraph, ví dụ "[base]"
+            input_index (int): Chỉ số input của luồng ảnh phụ đề
+
+        Returns:
+            str: Đoạn filtergraph (chưa có nhãn đầu ra)
+        """
+        if self.overlay_path:
+            return f"{label}[{input_index}:v]overlay=0:0:format=auto,format=yuv420p"
+        if self.filter:
+            return f"{label}{self.filter}"
+        return f"{label}null"
+
+
+def video_encoder_args(preset, keyframe_times=None, vfr=False):
+    """
+    Tạo tham số mã hóa video cho ffmpeg theo cấu hình trong ENCODER_PRESETS
+
+    Args:
+        preset (str): Tên cấu hình
+        keyframe_times (List[float], optional): Các thời điểm bắt buộc có keyframe
+            (thường là lúc đổi hình)
+        vfr (bool, optional): Dùng tốc độ khung thay đổi (kết hợp với bộ lọc
+            mpdecimate để bỏ các khung trùng nhau)
+
+    Returns:
+        List[str]: Tham số dòng lệnh
+    """
+    config = ENCODER_PRESETS[preset]
+    args = list(config["args"])
+    if config.get("gop_seconds"):
+        args += ["-g", str(int(config["fps"] * config["gop_seconds"]))]
+    if keyframe_times:
+        args += [
+            "-force_key_frames",
+            ",".join(f"{t:.3f}" for t in keyframe_times),
+        ]
+    if vfr:
+        args += ["-fps_mode", "vfr"]
+    else:
+        args += ["-r", str(config["fps"])]
+    return args
+
+
+def create_video(
+    image_path,
+    audio_path,
+    output_path,
+    subtitle_path=None,
+    preset=DEFAULT_ENCODER_PRESET,
+    vfr=False,
+    subtitle_renderer=SUBTITLE_RENDERER,
+    cancel_event=None,
 ):
     """
-    Tạo video từ nhiều hình ảnh và audio, với mỗi hình ảnh hiển thị trong một phần của audio
+    Tạo video từ một hình ảnh tĩnh và audio, gắn phụ đề trong cùng một lần mã hóa
 
     Args:
-        image_paths (List[str]): Danh sách đường dẫn đến các hình ảnh
+        image_path (str): Đường dẫn đến hình ảnh
         audio_path (str): Đường dẫn đến file audio
         output_path (str): Đường dẫn để lưu video đầu ra
         subtitle_path (str, optional): Đường dẫn đến file phụ đề
+        preset (str, optional): Cấu hình mã hóa trong ENCODER_PRESETS
+        vfr (bool, optional): Bỏ các khung trùng nhau (tốc độ khung thay đổi)
+        subtitle_renderer (str, optional): Cách gắn phụ đề ("overlay", "libass"
+            hoặc "precomposed")
+        cancel_event (threading.Event, optional): Cờ hủy, dừng ffmpeg khi được đặt
 
     Returns:
         str: Đường dẫn đến video đã tạo
     """
-    # Lọc bỏ các đường dẫn hình ảnh không tồn tại
-    valid_image_paths = [path for path in image_paths if path and os.path.exists(path)]
-
-    if not valid_image_paths:
-        logger.error("Không có hình ảnh hợp lệ để tạo video")
-        # Nếu không có hình ảnh hợp lệ, sử dụng hàm tạo video từ một hình ảnh
-        if len(image_paths) > 0 and os.path.exists(image_paths[0]):
-            return create_video(image_paths[0], audio_path, output_path, subtitle_path)
-        return None
-
     # Lấy độ dài audio
-    probe = ffmpeg.probe(audio_path)
-    total_duration = float(
-        probe["format"]["duration"]
-    )  # Tính thời gian cho mỗi hình ảnh
-    segment_duration = total_duration / len(valid_image_paths)
+    duration = get_audio_duration(audio_path)
+    if not duration:
+        raise Exception(f"Không thể lấy độ dài audio: {audio_path}")
+    fps = ENCODER_PRESETS[preset]["fps"]
+    width, height = get_output_size(image_path)
 
-    logger.info(f"Thời lượng audio: {total_duration:.2f} giây")
-    logger.info(
-        f"Chia đều cho {len(valid_image_paths)} hình, mỗi hình hiển thị {segment_duration:.2f} giây"
+    if subtitle_renderer == "precomposed":
+        try:
+            return create_video_precomposed(
+                [image_path],
+                [duration],
+                audio_path,
+                output_path,
+                subtitle_path,
+                preset,
+                vfr,
+                cancel_event=cancel_event,
+            )
+        except FFmpegCancelled:
+            raise
+        except Exception as e:
+            logger.error(f"Lỗi khi tạo video từ khung ghép sẵn: {str(e)}")
+            subtitle_renderer = "overlay"
+
+    def build_command(subtitles):
+        # Lặp hình ảnh, gắn phụ đề (burned-in) và ghép audio trong một đồ thị ffmpeg
+        cmd = [
+            "ffmpeg",
+            "-y",
+            "-loop",
+            "1",
+            "-framerate",
+            str(fps),
+            "-t",
+            str(duration),
+            "-i",
+            image_path,
+            "-i",
+            audio_path,
+        ]
+        graph = f"[0:v]scale={width}:{height},setsar=1[base];"
+        if subtitles:
+            cmd += subtitles.input_args()
+            graph += subtitles.apply("[base]", 2)
+        else:
+            graph += "[base]format=yuv420p"
+        if vfr:
+            graph += ",mpdecimate"
+        cmd += ["-filter_complex", graph + "[vout]", "-map", "[vout]", "-map", "1:a"]
+        cmd += video_encoder_args(preset, vfr=vfr)
+        cmd += audio_codec_args(audio_path, output_path)
+        cmd += ["-shortest", output_path]
+        return cmd
+
+    work_dir = tempfile.mkdtemp(
+        prefix="subs_", dir=os.path.dirname(os.path.abspath(output_path))
     )
+    try:
+        subtitles = SubtitleLayer(
+            subtitle_path, width, height, work_dir, subtitle_renderer
+        )
+        try:
+            run_ffmpeg(build_command(subtitles), cancel_event)
+        except FFmpegCancelled:
+            raise
+        except Exception as e:
+            if not subtitles:
+                raise
+            # Fallback: tạo video không có phụ đề
+            logger.error(f"Lỗi khi gắn phụ đề: {str(e)}")
+            run_ffmpeg(build_command(None), cancel_event)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    # Video kết thúc cùng audio (-shortest)
+    record_media_info(output_path, duration=duration)
+    return output_path
 
-    # Tạo file danh sách hình ảnh cho ffmpeg
-    concat_file_path = os.path.join(os.path.dirname(output_path), "concat_list.txt")
 
-    with open(concat_file_path, "w", encoding="utf-8") as f:
-        for img_path in valid_image_paths:
-            # Lấy đường dẫn tuyệt đối
-            img_path_escaped = normalize_path_for_ffmpeg(img_path)
-            f.write(f"file '{img_path_escaped}'\n")
-            f.write(f"duration {segment_duration}\n")
+def get_output_size(image_path):
+    """
+    Lấy kích thước khung hình từ hình ảnh đầu tiên (làm tròn xuống số chẵn cho yuv420p)
+
+    Args:
+        image_path (str): Đường dẫn đến hình ảnh
+
+    Returns:
+        Tuple[int, int]: Chiều rộng và chiều cao
+    """
+    with Image.open(image_path) as img:
+        width, height = img.size
+    return width - width % 2, height - height % 2
 
-        # Thêm hình ảnh cuối cùng một lần nữa với duration 0 để tránh lỗi
-        img_path_escaped = normalize_path_for_ffmpeg(valid_image_paths[-1])
-        f.write(f"file '{img_path_escaped}'\n")
 
-    # Tạo video từ danh sách hình ảnh (không có audio)
-    temp_video_no_audio = output_path + ".temp_no_audio.mp4"
+def split_segment_durations(total_duration, count, fps):
+    """
+    Chia đều thời lượng cho các hình ảnh, làm tròn theo số khung hình
+
+    Ranh giới được tính trên tổng số khung nên tổng các đoạn luôn khớp với
+    thời lượng audio (không bị lệch dần do làm tròn từng đoạn).
 
+    Returns:
+        List[float]: Thời lượng (giây) của từng hình ảnh
+    """
+    total_frames = max(count, int(math.ceil(total_duration * fps)))
+    boundaries = [round(i * total_frames / count) for i in range(count + 1)]
+    return [(boundaries[i + 1] - boundaries[i]) / fps for i in range(count)]
+
+
+def create_video_precomposed(
+    image_paths: List[str],
+    durations: List[float],
+    audio_path: str,
+    output_path: str,
+    subtitle_path=None,
+    preset: str = DEFAULT_ENCODER_PRESET,
+    vfr: bool = False,
+    workers: Optional[int] = None,
+    cancel_event=None,
+):
+    """
+    Tạo video từ các khung hình ghép sẵn (hình nền + dòng phụ đề)
+
+    Cả video được biểu diễn thành danh sách (khung tĩnh, thời lượng) và đưa vào
+    concat demuxer, nên ffmpeg chỉ mã hóa vài trăm khung khác nhau.
+
+    Args:
+        image_paths (List[str]): Danh sách hình ảnh hợp lệ
+        durations (List[float]): Thời lượng của từng hình ảnh (giây)
+        audio_path (str): Đường dẫn đến file audio
+        output_path (str): Đường dẫn để lưu video đầu ra
+        subtitle_path (str, optional): Đường dẫn đến file phụ đề
+        preset (str, optional): Cấu hình mã hóa trong ENCODER_PRESETS
+        vfr (bool, optional): Giữ nguyên tốc độ khung thay đổi của danh sách khung
+        workers (int, optional): Số luồng ghép khung, mặc định theo số CPU
+        cancel_event (threading.Event, optional): Cờ hủy, dừng ffmpeg khi được đặt
+
+    Returns:
+        str: Đường dẫn đến video đã tạo
+    """
+    width, height = get_output_size(image_paths[0])
+    work_dir = tempfile.mkdtemp(
+        prefix="frames_", dir=os.path.dirname(os.path.abspath(output_path))
+    )
+    concat_file_path = None
     try:
-        # Log thông tin về concat_file_path để debug
-        logger.info(f"Sử dụng concat file: {concat_file_path}")
-        with open(concat_file_path, "r", encoding="utf-8") as f:
-            content = f.read()
-            logger.info(
-                f"Nội dung concat file: {content}"
-            )  # Thay vì dùng python-ffmpeg, dùng subprocess để có thể kiểm soát chính xác cách truyền đường dẫn
-        import subprocess
+        concat_file_path, image_changes = build_precomposed_concat(
+            image_paths,
+            durations,
+            subtitle_path,
+            width,
+            height,
+            work_dir,
+            SUBTITLE_OVERLAY_STYLE,
+            workers,
+        )
+        cmd = [
+            "ffmpeg",
+            "-y",
+            "-f",
+            "concat",
+            "-safe",
+            "0",
+            "-i",
+            concat_file_path,
+            "-i",
+            audio_path,
+            "-map",
+            "0:v",
+            "-map",
+            "1:a",
+            "-vf",
+            "format=yuv420p",
+        ]
+        cmd += video_encoder_args(preset, image_changes, vfr)
+        cmd += audio_codec_args(audio_path, output_path)
+        # Danh sách khung dài hơn audio; cắt đúng thời lượng thay vì -shortest
+        # (concat demuxer làm luồng hình ngắn hơn và mất khoảng nửa giây cuối)
+        cmd += ["-t", f"{sum(durations):.3f}", output_path]
+        run_ffmpeg(cmd, cancel_event)
+        record_media_info(output_path, duration=sum(durations))
+        return output_path
+    finally:
+        # Chỉ dọn bộ nhớ đệm khung hình sau khi ffmpeg đã đọc xong các khung
+        if concat_file_path:
+            release_precomposed_frames(concat_file_path)
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def create_video_chunked(
+    image_paths: List[str],
+    durations: List[float],
+    audio_path: str,
+    output_path: str,
+    subtitle_path=None,
+    preset: str = DEFAULT_ENCODER_PRESET,
+    vfr: bool = False,
+    workers: int = ENCODE_WORKERS,
+    subtitle_renderer: str = SUBTITLE_RENDERER,
+    cancel_event=None,
+):
+    """
+    Mã hóa mỗi hình ảnh thành một đoạn video riêng (song song), sau đó nối các
+    đoạn bằng concat demuxer mà không mã hóa lại (-c:v copy) và ghép audio
 
-        try:
-            # Thêm '@' vào trước đường dẫn để tránh các vấn đề với ký tự đặc biệt trên Windows
-            abs_concat_path = os.path.abspath(concat_file_path)
-            logger.info(f"Đường dẫn concat file tuyệt đối: {abs_concat_path}")
+    Mọi đoạn dùng cùng kích thước, tốc độ khung và tham số mã hóa, mỗi đoạn bắt
+    đầu bằng một keyframe (GOP đóng) nên có thể nối trực tiếp. Phụ đề được gắn
+    trong từng đoạn bằng cách dời timestamp về vị trí của đoạn trong audio, với
+    cùng cách gắn phụ đề như khi mã hóa một lần (overlay hoặc libass).
+
+    Args:
+        image_paths (List[str]): Danh sách hình ảnh hợp lệ
+        durations (List[float]): Thời lượng của từng hình ảnh (giây)
+        audio_path (str): Đường dẫn đến file audio
+        output_path (str): Đường dẫn để lưu video đầu ra
+        subtitle_path (str, optional): Đường dẫn đến file phụ đề
+        preset (str, optional): Cấu hình mã hóa trong ENCODER_PRESETS
+        vfr (bool, optional): Bỏ các khung trùng nhau (tốc độ khung thay đổi)
+        workers (int, optional): Số tiến trình ffmpeg chạy cùng lúc
+        subtitle_renderer (str, optional): Cách gắn phụ đề ("overlay" hoặc
+            "libass"; khung ghép sẵn không chia đoạn được)
+        cancel_event (threading.Event, optional): Cờ hủy, dừng ffmpeg khi được đặt
 
-            # Sử dụng ffmpeg trực tiếp qua subprocess
+    Returns:
+        str: Đường dẫn đến video đã tạo
+    """
+    if subtitle_renderer == "precomposed":
+        raise ValueError("Không thể mã hóa song song với phụ đề ghép sẵn")
+    fps = ENCODER_PRESETS[preset]["fps"]
+    width, height = get_output_size(image_paths[0])
+    # Chia luồng của libx264 cho các tiến trình để không tranh CPU
+    threads = max(1, (os.cpu_count() or 1) // workers)
+
+    chunk_dir = tempfile.mkdtemp(
+        prefix="chunks_", dir=os.path.dirname(os.path.abspath(output_path))
+    )
+    try:
+        offsets = [sum(durations[:i]) for i in range(len(durations))]
+        chunk_paths = [
+            os.path.join(chunk_dir, f"chunk_{i:04d}.mp4")
+            for i in range(len(image_paths))
+        ]
+
+        # Phụ đề dựng một lần cho cả video, mọi đoạn dùng chung
+        subtitles = SubtitleLayer(
+            subtitle_path, width, height, chunk_dir, subtitle_renderer
+        )
+
+        def encode_chunk(index):
+            graph = (
+                f"[0:v]scale={width}:{height}:force_original_aspect_ratio=decrease,"
+                f"pad={width}:{height}:(ow-iw)/2:(oh-ih)/2,setsar=1,"
+                f"fps={fps},format=yuv420p"
+            )
+            if subtitles:
+                # Dời timestamp để phụ đề khớp với vị trí của đoạn trong audio
+                graph += f",setpts=PTS+{offsets[index]:.6f}/TB[base];"
+                graph += subtitles.apply("[base]", 1) + ",setpts=PTS-STARTPTS"
+            if vfr:
+                graph += ",mpdecimate"
             cmd = [
                 "ffmpeg",
                 "-y",
-                "-safe",
-                "0",
-                "-f",
-                "concat",
+                "-loop",
+                "1",
+                "-framerate",
+                str(fps),
+                "-t",
+                f"{durations[index]:.6f}",
                 "-i",
-                abs_concat_path,
-                "-c:v",
-                "libx264",
-                "-pix_fmt",
-                "yuv420p",
-                "-r",
-                "24",
-                temp_video_no_audio,
+                image_paths[index],
             ]
-            logger.info(f"Chạy lệnh ffmpeg: {' '.join(cmd)}")
-
-            result = subprocess.run(cmd, capture_output=True, text=True)
-
-            if result.returncode != 0:
-                logger.error(f"Lỗi ffmpeg: {result.stderr}")
-                raise Exception(result.stderr)
-            else:
-                logger.info("Tạo video không có audio thành công")
-        except Exception as subprocess_error:
-            logger.error(f"Lỗi khi chạy ffmpeg: {str(subprocess_error)}")
-            raise  # Thêm audio vào video sử dụng subprocess
-        temp_video = output_path + ".temp.mp4"
-        try:
-            import subprocess
-
-            cmd_audio = [
+            if subtitles:
+                cmd += subtitles.input_args()
+            cmd += ["-filter_complex", graph + "[vout]", "-map", "[vout]"]
+            cmd += video_encoder_args(preset, vfr=vfr)
+            cmd += ["-threads", str(threads), "-an", chunk_paths[index]]
+            run_ffmpeg(cmd, cancel_event)
+
+        logger.info(f"Mã hóa {len(image_paths)} đoạn video với {workers} tiến trình")
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            # list() để ném lại lỗi của đoạn nào bị hỏng
+            list(executor.map(encode_chunk, range(len(image_paths))))
+
+        concat_file_path = os.path.join(chunk_dir, "concat_list.txt")
+        with open(concat_file_path, "w", encoding="utf-8") as f:
+            for chunk_path in chunk_paths:
+                f.write(f"file '{normalize_path_for_ffmpeg(chunk_path)}'\n")
+
+        # Nối các đoạn không mã hóa lại và ghép audio
+        run_ffmpeg(
+            [
                 "ffmpeg",
                 "-y",
+                "-f",
+                "concat",
+                "-safe",
+                "0",
                 "-i",
-                temp_video_no_audio,
+                concat_file_path,
                 "-i",
                 audio_path,
+                "-map",
+                "0:v",
+                "-map",
+                "1:a",
                 "-c:v",
                 "copy",
-                "-c:a",
-                "aac",
-                "-shortest",  # Đảm bảo video kết thúc khi audio kết thúc
-                temp_video,
-            ]
-            logger.info(f"Chạy lệnh thêm audio: {' '.join(cmd_audio)}")
-
-            result_audio = subprocess.run(cmd_audio, capture_output=True, text=True)
-
-            if result_audio.returncode != 0:
-                logger.error(f"Lỗi khi thêm audio: {result_audio.stderr}")
-                raise Exception(result_audio.stderr)
-            else:
-                logger.info("Thêm audio vào video thành công")
-        except Exception as audio_error:
-            logger.error(f"Lỗi khi thêm audio: {str(audio_error)}")
-            raise
+                *audio_codec_args(audio_path, output_path),
+                "-movflags",
+                "+faststart",
+                "-shortest",
+                output_path,
+            ],
+            cancel_event,
+        )
+        record_media_info(output_path, duration=sum(durations))
+        return output_path
+    finally:
+        shutil.rmtree(chunk_dir, ignore_errors=True)
 
-        # Tiếp tục với phần xử lý phụ đề như trong hàm create_video
-        if subtitle_path and os.path.exists(subtitle_path):
-            video_with_subtitles = ffmpeg.input(temp_video)
 
-            # Kiểm tra xem file phụ đề có dữ liệu không
-            with open(subtitle_path, "r", encoding="utf-8") as f:
-                subtitle_content = f.read()
+def create_video_with_segments(
+    image_paths: List[str],
+    audio_path: str,
+    output_path: str,
+    subtitle_path=None,
+    preset: str = DEFAULT_ENCODER_PRESET,
+    vfr: bool = False,
+    workers: int = ENCODE_WORKERS,
+    subtitle_renderer: str = SUBTITLE_RENDERER,
+    cancel_event=None,
+):
+    """
+    Tạo video từ nhiều hình ảnh và audio, với mỗi hình ảnh hiển thị trong một phần của audio
 
-            if not subtitle_content.strip():
-                print(f"File phụ đề rỗng: {subtitle_path}")
-                # Kiểm tra và xử lý nếu file đích đã tồn tại
-                if os.path.exists(output_path):
-                    os.remove(output_path)
-                os.rename(temp_video, output_path)
-                return output_path
+    Toàn bộ hình ảnh, audio và phụ đề được xử lý trong một filtergraph duy nhất,
+    chỉ mã hóa một lần và không ghi file trung gian. Với workers > 1, mỗi hình
+    ảnh được mã hóa thành một đoạn riêng song song (xem create_video_chunked).
 
-            # Sử dụng đường dẫn tuyệt đối cho Windows
-            import pathlib
+    Args:
+        image_paths (List[str]): Danh sách đường dẫn đến các hình ảnh
+        audio_path (str): Đường dẫn đến file audio
+        output_path (str): Đường dẫn để lưu video đầu ra
+        subtitle_path (str, optional): Đường dẫn đến file phụ đề
+        preset (str, optional): Cấu hình mã hóa trong ENCODER_PRESETS
+        vfr (bool, optional): Bỏ các khung trùng nhau (tốc độ khung thay đổi)
+        workers (int, optional): Số đoạn video mã hóa song song
+        subtitle_renderer (str, optional): Cách gắn phụ đề ("overlay", "libass"
+            hoặc "precomposed")
+        cancel_event (threading.Event, optional): Cờ hủy, dừng ffmpeg khi được đặt
 
-            subtitle_absolute_path = pathlib.Path(subtitle_path).absolute()
+    Returns:
+        str: Đường dẫn đến video đã tạo
+    """
+    # Lọc bỏ các đường dẫn hình ảnh không tồn tại
+    valid_image_paths = [path for path in image_paths if path and os.path.exists(path)]
 
-            # Escape đường dẫn phụ đề cho ffmpeg theo cách đảm bảo hoạt động trên Windows
-            subtitle_path_escaped = (
-                str(subtitle_absolute_path).replace("\\", "/").replace(":", "\\:")
+    if not valid_image_paths:
+        logger.error("Không có hình ảnh hợp lệ để tạo video")
+        # Nếu không có hình ảnh hợp lệ, sử dụng hàm tạo video từ một hình ảnh
+        if len(image_paths) > 0 and os.path.exists(image_paths[0]):
+            return create_video(
+                image_paths[0],
+                audio_path,
+                output_path,
+                subtitle_path,
+                preset,
+                vfr,
+                subtitle_renderer,
+                cancel_event,
             )
+        return None
 
-            # Sử dụng subtitles filter với các tùy chọn để phụ đề lớn, đậm, màu trắng viền xanh, ở giữa
-            subtitle_options = f"force_style='Fontname=Arial,Fontsize=28,PrimaryColour=&HFFFFFF,OutlineColour=&H0000FF,BorderStyle=1,Outline=3,Shadow=0,Alignment=2,MarginV=35'"
+    # Lấy độ dài audio
+    total_duration = get_audio_duration(audio_path)
+    if not total_duration:
+        raise Exception(f"Không thể lấy độ dài audio: {audio_path}")
+    # Tính thời gian cho mỗi hình ảnh
+    fps = ENCODER_PRESETS[preset]["fps"]
+    durations = split_segment_durations(total_duration, len(valid_image_paths), fps)
+    # Keyframe tại mỗi lần đổi hình
+    keyframe_times = [sum(durations[:i]) for i in range(1, len(durations))]
 
-            # In thông tin debug
-            print(f"Subtitle path: {subtitle_path}")
-            print(f"Subtitle path escaped: {subtitle_path_escaped}")
-            print(f"Output path: {output_path}")
+    logger.info(f"Thời lượng audio: {total_duration:.2f} giây")
+    logger.info(
+        f"Chia đều cho {len(valid_image_paths)} hình, mỗi hình hiển thị {durations[0]:.2f} giây"
+    )
 
-            try:
-                # Kiểm tra và xóa file đích nếu đã tồn tại
-                if os.path.exists(output_path):
-                    os.remove(output_path)
-
-                # Sử dụng cả hai cách để thử gắn phụ đề
-                try:
-                    # Cách 1: Sử dụng vf=subtitles trực tiếp
-                    (
-                        ffmpeg.output(
-                            video_with_subtitles,
-                            output_path,
-                            vf=f"subtitles='{subtitle_path_escaped}':{subtitle_options}",
-                            vcodec="libx264",
-                            acodec="copy",
-                        ).run(overwrite_output=True)
-                    )
-                except Exception as e1:
-                    print(f"Lỗi phương pháp 1: {str(e1)}")
-
-                    # Cách 2: Sử dụng options thông qua -vf flag
-                    import subprocess
-
-                    cmd = [
-                        "ffmpeg",
-                        "-y",
-                        "-i",
-                        temp_video,
-                        "-vf",
-                        f"subtitles='{subtitle_path_escaped}':{subtitle_options}",
-                        "-c:v",
-                        "libx264",
-                        "-c:a",
-                        "copy",
-                        output_path,
-                    ]
-                    print(f"Lệnh ffmpeg: {' '.join(cmd)}")
-                    result = subprocess.run(cmd, capture_output=True, text=True)
-
-                    if result.returncode != 0:
-                        print(f"Lỗi phương pháp 2: {result.stderr}")
-                        raise Exception(result.stderr)
+    if subtitle_renderer == "precomposed":
+        try:
+            output = create_video_precomposed(
+                valid_image_paths,
+                durations,
+                audio_path,
+                output_path,
+                subtitle_path,
+                preset,
+                vfr,
+                cancel_event=cancel_event,
+            )
+            logger.info(
+                f"Đã tạo video từ {len(valid_image_paths)} hình ảnh: {output_path}"
+            )
+            return output
+        except FFmpegCancelled:
+            raise
+        except Exception as e:
+            logger.error(f"Lỗi khi tạo video từ khung ghép sẵn: {str(e)}")
+            subtitle_renderer = "overlay"
 
-            except Exception as e:
-                print(f"Lỗi khi gắn phụ đề: {str(e)}")
-                # Fallback: sử dụng video không có phụ đề
-                if os.path.exists(output_path):
-                    os.remove(output_path)
-                os.rename(temp_video, output_path)
-        else:
-            # Không có phụ đề, sử dụng video đã có
-            if os.path.exists(output_path):
-                os.remove(output_path)
-            os.rename(temp_video, output_path)
+    if workers > 1 and len(valid_image_paths) > 1:
+        try:
+            output = create_video_chunked(
+                valid_image_paths,
+                durations,
+                audio_path,
+                output_path,
+                subtitle_path,
+                preset,
+                vfr,
+                workers,
+                subtitle_renderer,
+                cancel_event,
+            )
+            logger.info(
+                f"Đã tạo video từ {len(valid_image_paths)} hình ảnh: {output_path}"
+            )
+            return output
+        except FFmpegCancelled:
+            raise
+        except Exception as e:
+            logger.error(f"Lỗi khi mã hóa song song: {str(e)}")
+            logger.info("Thử lại với một lần mã hóa...")
 
-        # Dọn dẹp file tạm
-        for file_path in [temp_video, temp_video_no_audio, concat_file_path]:
-            try:
-                if file_path and os.path.exists(file_path):
-                    os.remove(file_path)
-                    logger.info(f"Đã xóa file tạm: {file_path}")
-            except Exception as cleanup_error:
-                logger.warning(
-                    f"Không thể xóa file tạm {file_path}: {str(cleanup_error)}"
+    work_dir = tempfile.mkdtemp(
+        prefix="subs_", dir=os.path.dirname(os.path.abspath(output_path))
+    )
+    try:
+        width, height = get_output_size(valid_image_paths[0])
+        count = len(valid_image_paths)
+
+        def build_command(subtitles):
+            cmd = ["ffmpeg", "-y"]
+            # Mỗi hình ảnh là một input lặp lại đúng thời lượng của nó
+            for img_path, duration in zip(valid_image_paths, durations):
+                cmd += [
+                    "-loop",
+                    "1",
+                    "-framerate",
+                    str(fps),
+                    "-t",
+                    f"{duration:.6f}",
+                    "-i",
+                    img_path,
+                ]
+            cmd += ["-i", audio_path]
+
+            # Đưa mọi hình về cùng kích thước rồi nối lại, sau đó gắn phụ đề
+            filters = []
+            for i in range(count):
+                filters.append(
+                    f"[{i}:v]scale={width}:{height}:force_original_aspect_ratio=decrease,"
+                    f"pad={width}:{height}:(ow-iw)/2:(oh-ih)/2,setsar=1,"
+                    f"fps={fps},format=yuv420p[v{i}]"
                 )
+            inputs = "".join(f"[v{i}]" for i in range(count))
+            filters.append(f"{inputs}concat=n={count}:v=1:a=0[vcat]")
+            if subtitles:
+                cmd += subtitles.input_args()
+                chain = subtitles.apply("[vcat]", count + 1)
+            else:
+                chain = "[vcat]null"
+            if vfr:
+                chain += ",mpdecimate"
+            filters.append(chain + "[vout]")
+
+            cmd += [
+                "-filter_complex",
+                ";".join(filters),
+                "-map",
+                "[vout]",
+                "-map",
+                f"{count}:a",
+            ]
+            cmd += video_encoder_args(preset, keyframe_times, vfr)
+            cmd += [
+                *audio_codec_args(audio_path, output_path),
+                "-shortest",  # Đảm bảo video kết thúc khi audio kết thúc
+                output_path,
+            ]
+            return cmd
 
+        subtitles = SubtitleLayer(
+            subtitle_path, width, height, work_dir, subtitle_renderer
+        )
+        try:
+            run_ffmpeg(build_command(subtitles), cancel_event)
+        except FFmpegCancelled:
+            raise
+        except Exception as e:
+            if not subtitles:
+                raise
+            # Fallback: tạo video không có phụ đề
+            logger.error(f"Lỗi khi gắn phụ đề: {str(e)}")
+            run_ffmpeg(build_command(None), cancel_event)
+
+        record_media_info(output_path, duration=total_duration)
         logger.info(f"Đã tạo video từ {len(valid_image_paths)} hình ảnh: {output_path}")
         return output_path
 
+    except FFmpegCancelled:
+        raise
     except Exception as e:
         logger.error(f"Lỗi khi tạo video từ nhiều hình ảnh: {str(e)}")
 
@@ -389,14 +826,24 @@ def create_video_with_segments(
         if valid_image_paths:
             logger.info("Thử tạo video với hình ảnh đầu tiên...")
             return create_video(
-                valid_image_paths[0], audio_path, output_path, subtitle_path
+                valid_image_paths[0],
+                audio_path,
+                output_path,
+                subtitle_path,
+                preset,
+                vfr,
+                subtitle_renderer,
+                cancel_event,
             )
         return None
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
 
 
 def get_audio_duration(audio_path):
     """
-    Lấy độ dài của file audio
+    Lấy độ dài của file audio (dùng bộ nhớ đệm của media_info, chỉ chạy
+    ffprobe khi bước TTS chưa ghi lại thời lượng)
 
     Args:
         audio_path (str): Đường dẫn đến file audio
@@ -405,13 +852,14 @@ def get_audio_duration(audio_path):
         float: Độ dài của file audio (đơn vị: giây)
     """
     try:
-        probe = ffmpeg.probe(audio_path)
-        return float(probe["format"]["duration"])
+        return get_duration(audio_path)
     except Exception:
         # Nếu ffprobe không hoạt động, thử với pydub
         try:
             audio = AudioSegment.from_file(audio_path)
-            return len(audio) / 1000.0  # Chuyển từ mili giây sang giây
+            duration = len(audio) / 1000.0  # Chuyển từ mili giây sang giây
+            record_media_info(audio_path, duration=duration)
+            return duration
         except Exception as e:
             logger.error(f"Không thể lấy độ dài audio: {str(e)}")
             return 0
@@ -428,9 +876,7 @@ def get_video_duration(video_path):
         float: Độ dài của file video (đơn vị: giây)
     """
     try:
-        probe = ffmpeg.probe(video_path)
-        duration = float(probe["format"]["duration"])
-        return duration
+        return get_duration(video_path)
     except Exception as e:
         logger.error(f"Không thể lấy độ dài video: {str(e)}")
         return 0
@@ -0,0 +1,55 @@
+import numpy as np
+from modules.alignment import EnergyAligner
+
+SAMPLE_RATE = 16000
+
+
+def make_speech(bursts, gap_seconds, sample_rate=SAMPLE_RATE):
+    """
+    Audio giả lập: các đoạn tiếng (sóng sin có biên độ dao động) cách nhau bởi
+    khoảng lặng gap_seconds
+    """
+    pieces = []
+    for seconds in bursts:
+        t = np.arange(int(seconds * sample_rate)) / sample_rate
+        # Biên độ dao động tạo các điểm năng lượng thấp giữa đoạn nói liền
+        envelope = 0.3 + 0.7 * np.abs(np.sin(2 * np.pi * 9 * t))
+        pieces.append(0.5 * envelope * np.sin(2 * np.pi * 220 * t))
+        pieces.append(np.zeros(int(gap_seconds * sample_rate)))
+    return np.concatenate(pieces).astype(np.float32)
+
+
+def check_spans(spans, count, min_word_seconds):
+    assert spans is not None and len(spans) == count
+    starts, ends = spans[:, 0], spans[:, 1]
+    # Từ sau không bắt đầu trước khi từ trước kết thúc
+    assert np.all(np.diff(starts) > 0), spans
+    assert np.all(ends[:-1] <= starts[1:] + 1e-6), spans
+    # Mỗi từ có thời lượng tối thiểu
+    assert np.all(ends - starts >= min_word_seconds - 1e-6), spans
+
+
+def test_close_words_do_not_overlap():
+    """Các từ ngắn đọc liền nhau không được có khoảng thời gian chồng lên nhau"""
+    aligner = EnergyAligner()
+    sentence = "a bb c dd e ff g hh i jj"
+    samples = make_speech([0.35, 0.3, 0.4], gap_seconds=0.02)
+    spans = aligner.align(sentence, samples, SAMPLE_RATE)
+    check_spans(spans, len(sentence.split()), aligner.min_word_seconds)
+
+
+def test_many_words_in_short_audio():
+    """Nhiều từ trong audio rất ngắn vẫn cho ranh giới tăng dần trong câu"""
+    aligner = EnergyAligner()
+    sentence = " ".join(["x"] * 12)
+    samples = make_speech([0.3], gap_seconds=0.0)
+    spans = aligner.align(sentence, samples, SAMPLE_RATE)
+    duration = len(samples) / SAMPLE_RATE
+    assert spans is not None and spans[-1, 1] <= duration + 1e-6
+    check_spans(spans, 12, min(aligner.min_word_seconds, duration / 12 - 0.01))
+
+
+if __name__ == "__main__":
+    test_close_words_do_not_overlap()
+    test_many_words_in_short_audio()
+    print("OK")
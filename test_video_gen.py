@@ -1,13 +1,63 @@
 import os
 import sys
 import argparse
+import subprocess
 from modules.video_gen import (
+    DEFAULT_ENCODER_PRESET,
+    ENCODER_PRESETS,
     create_video,
+    create_video_precomposed,
     create_video_with_segments,
+    get_audio_duration,
     normalize_path_for_ffmpeg,
+    split_segment_durations,
 )
 
 
+def probe_video_duration(video_path):
+    """Thời lượng luồng hình của video, đọc trực tiếp bằng ffprobe (không cache)"""
+    result = subprocess.run(
+        [
+            "ffprobe",
+            "-v",
+            "error",
+            "-select_streams",
+            "v:0",
+            "-count_frames",
+            "-show_entries",
+            "stream=nb_read_frames,r_frame_rate",
+            "-of",
+            "default=noprint_wrappers=1:nokey=1",
+            video_path,
+        ],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    rate, frames = result.stdout.split()
+    num, den = rate.split("/")
+    return int(frames) * int(den) / int(num)
+
+
+def check_precomposed_duration(image_paths, audio_path, subtitle_path, output_path):
+    """
+    Video ghép từ khung dựng sẵn phải dài đúng bằng audio (concat demuxer
+    không được làm mất các khung cuối)
+    """
+    audio_duration = get_audio_duration(audio_path)
+    fps = ENCODER_PRESETS[DEFAULT_ENCODER_PRESET]["fps"]
+    durations = split_segment_durations(audio_duration, len(image_paths), fps)
+    create_video_precomposed(
+        image_paths, durations, audio_path, output_path, subtitle_path
+    )
+    video_duration = probe_video_duration(output_path)
+    print(f"Audio: {audio_duration:.3f}s, video: {video_duration:.3f}s")
+    # Sai lệch tối đa một khung hình
+    assert (
+        abs(video_duration - audio_duration) <= 1.0 / fps + 1e-3
+    ), f"Video dài {video_duration:.3f}s, audio dài {audio_duration:.3f}s"
+
+
 def main():
     """
     Hàm test các chức năng của video_gen.py
@@ -22,6 +72,11 @@ def main():
         "--multiple", action="store_true", help="Test tạo video với nhiều hình"
     )
     parser.add_argument("--both", action="store_true", help="Test cả 2 phương pháp")
+    parser.add_argument(
+        "--precomposed",
+        action="store_true",
+        help="Test thời lượng video ghép từ khung dựng sẵn",
+    )
     parser.add_argument("--image", help="Đường dẫn đến hình ảnh (cho test single)")
     parser.add_argument(
         "--imagedir", help="Thư mục chứa nhiều hình ảnh (cho test multiple)"
@@ -32,7 +87,7 @@ def main():
     args = parser.parse_args()
 
     # Nếu không có tham số, mặc định test cả hai phương pháp
-    if not (args.single or args.multiple or args.both):
+    if not (args.single or args.multiple or args.both or args.precomposed):
         args.both = True
 
     # Chuẩn bị các đường dẫn mặc định nếu không được cung cấp
@@ -137,8 +192,7 @@ def main():
         # Tạo file phụ đề mặc định nếu không tồn tại
         if not os.path.exists(args.subtitle):
             with open(args.subtitle, "w", encoding="utf-8") as f:
-                f.write(
-                    """[Script Info]
+                f.write("""[Script Info]
 ScriptType: v4.00+
 PlayResX: 1280
 PlayResY: 720
@@ -152,13 +206,13 @@ Style: Default,Arial,28,&H00FFFFFF,&H000000FF,&H00000000,&H00000000,0,0,0,0,100,
 Format: Layer, Start, End, Style, Name, MarginL, MarginR, MarginV, Effect, Text
 Dialogue: 0,0:00:00.00,0:00:03.00,Default,,0,0,0,,Đây là phụ đề mẫu dòng 1
 Dialogue: 0,0:00:03.00,0:00:06.00,Default,,0,0,0,,Đây là phụ đề mẫu dòng 2
-"""
-                )
+""")
                 print(f"Đã tạo file phụ đề mẫu: {args.subtitle}")
 
     # Thiết lập đường dẫn file đầu ra
     single_output = os.path.join(output_dir, "video_single.mp4")
     multi_output = os.path.join(output_dir, "video_multi.mp4")
+    precomposed_output = os.path.join(output_dir, "video_precomposed.mp4")
 
     # Test với một hình ảnh
     if args.single or args.both:
@@ -202,6 +256,17 @@ Dialogue: 0,0:00:03.00,0:00:06.00,Default,,0,0,0,,Đây là phụ đề mẫu d
         except Exception as e:
             print(f"❌ Lỗi khi tạo video với nhiều hình: {str(e)}")
 
+    # Test thời lượng video từ khung dựng sẵn
+    if args.precomposed or args.both:
+        print("\n=== TEST THỜI LƯỢNG VIDEO TỪ KHUNG DỰNG SẴN ===")
+        try:
+            check_precomposed_duration(
+                default_images, args.audio, args.subtitle, precomposed_output
+            )
+            print(f"✅ Video đủ thời lượng: {precomposed_output}")
+        except Exception as e:
+            print(f"❌ Lỗi thời lượng video từ khung dựng sẵn: {str(e)}")
+
 
 if __name__ == "__main__":
     main()